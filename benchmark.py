@@ -0,0 +1,470 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""Benchmarks of parse_ipp_tax_benefit_tables on the workbooks bundled in Baremes_IPP.
+
+The "suite" benchmark times every stage of both parsers (parse_ipp_tax_benefit_tables and the pandas-based parser.py)
+on every workbook, saves the results as JSON and compares them with a baseline, e.g.:
+
+    ./benchmark.py suite -o baseline.json
+    ./benchmark.py suite -o results.json -b baseline.json --threshold 0.2
+"""
+
+
+import argparse
+import collections
+import datetime
+import imp
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import pandas as pd
+
+import merged_cells
+import parameter_grid
+import parameter_store
+import parse_ipp_tax_benefit_tables as parser
+import profiling
+import tax_schedule
+import validation
+
+
+app_name = os.path.splitext(os.path.basename(__file__))[0]
+default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Baremes_IPP')
+log = logging.getLogger(app_name)
+# parser.py can't be imported by its name, which is also the name of a module of the standard library.
+pandas_parser = imp.load_source('pandas_parser', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'parser.py'))
+workbook_extensions = (u'.xls', u'.xlsx')
+
+
+def benchmark_dates(args):
+    """Compare the fast date or year parser with the biryani converters, on every first cell of the bundled sheets."""
+    cells = []
+    for bareme, xls_path in iter_bundled_workbooks(args.dir):
+        book = parser.open_workbook(xls_path)
+        number_format_by_xf_index = parser.build_number_format_by_xf_index(book)
+        for sheet_name in parser.list_sheet_names(xls_path, bareme):
+            cells.extend(
+                row[0]
+                for row in parser.decode_sheet(book, sheet_name, number_format_by_xf_index)
+                if row
+                )
+    for cell in cells:
+        expected = convert_cell_safely(parser.cell_to_date_or_year, cell)
+        parser.date_or_year_by_cell.clear()
+        assert convert_cell_safely(parser.fast_cell_to_date_or_year, cell) == expected \
+            or expected[0] == 'exception', u'Parsers differ for {!r}'.format(cell).encode('utf-8')
+
+    def convert_with_cache():
+        parser.date_or_year_by_cell.clear()
+        for cell in cells:
+            convert_cell_safely(parser.fast_cell_to_date_or_year, cell)
+
+    def convert_without_cache():
+        for cell in cells:
+            parser.date_or_year_by_cell.clear()
+            convert_cell_safely(parser.fast_cell_to_date_or_year, cell)
+
+    print u'{} first cells, {} distinct'.format(len(cells), len(set((type(cell), cell) for cell in cells)))
+    print u'{:<25} {:>12} {:>12}'.format(u'Parser', u'Duration (s)', u'Speedup')
+    biryani_duration = min(timeit.repeat(
+        lambda: [convert_cell_safely(parser.cell_to_date_or_year, cell) for cell in cells],
+        number = 1,
+        repeat = args.repeat,
+        ))
+    print u'{:<25} {:>12.4f} {:>11.1f}x'.format(u'biryani', biryani_duration, 1)
+    for label, function in (
+            (u'fast path, no cache', convert_without_cache),
+            (u'fast path & cache', convert_with_cache),
+            ):
+        duration = min(timeit.repeat(function, number = 1, repeat = args.repeat))
+        print u'{:<25} {:>12.4f} {:>11.1f}x'.format(label, duration, biryani_duration / duration)
+
+
+def benchmark_grid(args):
+    """Compare the monthly grid assembly with the former column by column assembly, and with the typed grid, filled
+    and resampled."""
+    print u'{:<25} {:>10} {:>12} {:>12} {:>8} {:>12} {:>8}'.format(u'Bareme', u'Parameters', u'Former (s)',
+        u'Bulk (s)', u'Speedup', u'Typed (s)', u'Speedup')
+    for bareme, xls_path in iter_bundled_workbooks(args.dir):
+        vector_by_taxipp_name, unit_by_taxipp_name = parser.merge_sheets_vectors(
+            parser.parse_workbook_sheets(xls_path, bareme, parser.list_sheet_names(xls_path, bareme)))
+        former_data_frame = build_monthly_data_frame_column_by_column(vector_by_taxipp_name)
+        data_frame = build_monthly_data_frame(vector_by_taxipp_name, end_year = 2020)
+        assert former_data_frame.loc[data_frame.index[0]:].equals(data_frame), \
+            u'Grids differ for {}'.format(bareme).encode('utf-8')
+        former_duration = min(timeit.repeat(
+            lambda: build_monthly_data_frame_column_by_column(vector_by_taxipp_name),
+            number = 1,
+            repeat = args.repeat,
+            ))
+        duration = min(timeit.repeat(
+            lambda: build_monthly_data_frame(vector_by_taxipp_name, end_year = 2020),
+            number = 1,
+            repeat = args.repeat,
+            ))
+        typed_duration = min(timeit.repeat(
+            lambda: parameter_grid.ParameterGrid.from_vectors(vector_by_taxipp_name, unit_by_taxipp_name,
+                end_year = 2020).fill().resample(option = args.option),
+            number = 1,
+            repeat = args.repeat,
+            ))
+        print u'{:<25} {:>10} {:>12.4f} {:>12.4f} {:>7.1f}x {:>12.4f} {:>7.1f}x'.format(bareme,
+            len(vector_by_taxipp_name), former_duration, duration, former_duration / duration, typed_duration,
+            former_duration / typed_duration)
+
+
+def benchmark_schedule(args):
+    """Time the schedules of the bundled workbooks in force at a date, on an array of random incomes."""
+    date = datetime.date(args.year, 1, 1)
+    incomes = np.random.RandomState(0).lognormal(mean = 10, sigma = 1, size = args.incomes)
+    print u'{} incomes at {}'.format(len(incomes), date)
+    print u'{:<25} {:<15} {:>8} {:>10} {:>14}'.format(u'Bareme', u'Schedule', u'Brackets', u'Tax (s)',
+        u'Incomes / s')
+    for bareme, xls_path in iter_bundled_workbooks(args.dir):
+        vector_by_taxipp_name, unit_by_taxipp_name = parser.merge_sheets_vectors(
+            parser.parse_workbook_sheets(xls_path, bareme, parser.list_sheet_names(xls_path, bareme)))
+        store = parameter_store.ParameterStore.from_vectors(vector_by_taxipp_name, unit_by_taxipp_name)
+        ceiling = tax_schedule.get_number(store, u'pss_a', date) if u'pss_a' in store else None
+        for name, schedule in tax_schedule.build_schedules(store, date, ceiling = ceiling).iteritems():
+            duration = min(timeit.repeat(lambda: schedule.tax(incomes), number = 1, repeat = args.repeat))
+            print u'{:<25} {:<15} {:>8} {:>10.4f} {:>14.3g}'.format(bareme, name, len(schedule.thresholds),
+                duration, len(incomes) / duration)
+
+
+def benchmark_suite(args):
+    """Time every stage of both parsers on every bundled workbook, and compare the results with a baseline.
+
+    Each workbook is benchmarked in a new process, so that the peak RSS is the one of this workbook only. Both
+    pipelines of a workbook are given the same number of cells, counted by count_workbook_cells, so that their cells
+    per second can be compared.
+
+    Return 1 when a regression is found.
+    """
+    results = collections.OrderedDict()
+    print u'{:<50} {:>8} {:>10} {:>12} {:>14}'.format(u'Workbook', u'Cells', u'Total (s)', u'Cells/s',
+        u'Peak RSS (MB)')
+    cells_count_by_path = {}
+    for pipeline, bareme, xls_path in iter_suite_workbooks(args.dir):
+        key = u'{}/{}'.format(pipeline, os.path.basename(xls_path))
+        cells_count = cells_count_by_path.get(xls_path)
+        if cells_count is None:
+            cells_count = cells_count_by_path[xls_path] = count_workbook_cells(xls_path)
+        # A pool with a single worker, used only once, gives a fresh process to each workbook.
+        pool = multiprocessing.Pool(1, maxtasksperchild = 1)
+        try:
+            result = pool.apply(time_workbook_stages, (pipeline, bareme, xls_path, cells_count, args.repeat,
+                args.option))
+        finally:
+            pool.close()
+            pool.join()
+        results[key] = result
+        if 'error' in result:
+            print u'{:<50} failed: {}'.format(key, result['error'])
+            continue
+        if 'skipped' in result:
+            print u'{:<50} skipped: {}'.format(key, result['skipped'])
+            continue
+        print u'{:<50} {:>8} {:>10.4f} {:>12.0f} {:>14.1f}'.format(key, result['cells'], result['seconds'],
+            result['cells_per_second'], result['peak_rss_kb'] / 1024.)
+    report = collections.OrderedDict((
+        ('date', datetime.datetime.now().isoformat()),
+        ('option', args.option),
+        ('python', platform.python_version()),
+        ('repeat', args.repeat),
+        ('results', results),
+        ))
+    if args.output is not None:
+        with io.open(args.output, 'w', encoding = 'utf-8') as output_file:
+            output_file.write(unicode(json.dumps(report, ensure_ascii = False, indent = 2)))
+    if args.baseline is None:
+        return 0
+    with io.open(args.baseline, encoding = 'utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare_results(baseline['results'], results, threshold = args.threshold,
+        rss_threshold = args.rss_threshold, min_duration = args.min_duration)
+    for regression in regressions:
+        print u'Regression: {}'.format(regression)
+    if regressions:
+        return 1
+    print u'No regression compared with {}'.format(args.baseline)
+    return 0
+
+
+def build_monthly_data_frame(vector_by_taxipp_name, end_year = None):
+    """Scatter the vectors of the parameters onto a monthly grid, in a single concat & reindex.
+
+    The grid starts at the first date of the vectors and ends in December of the year of their last date, or of
+    end_year when it is later. Cells without a value are NaN.
+    """
+    if not vector_by_taxipp_name:
+        return pd.DataFrame()
+    taxipp_names = []
+    vectors = []
+    for taxipp_name, vector in vector_by_taxipp_name.iteritems():
+        taxipp_names.append(taxipp_name)
+        # When a date is repeated, keep its last value.
+        vector = vector[~vector.index.duplicated(keep = 'last')]
+        vectors.append(pd.Series(vector.values, index = pd.DatetimeIndex(vector.index)))
+    first_date = min(vector.index.min() for vector in vectors if len(vector))
+    last_year = max(max(vector.index.max().year for vector in vectors if len(vector)), end_year or 0)
+    months = pd.date_range(datetime.datetime(first_date.year, first_date.month, 1),
+        datetime.datetime(last_year, 12, 1), freq = 'MS')
+    return pd.concat(vectors, axis = 1, join_axes = [months], keys = taxipp_names)
+
+
+def build_monthly_data_frame_column_by_column(vector_by_taxipp_name):
+    """Former grid assembly of main(), inserting one column at a time in a 1914-2020 grid."""
+    monthstime = [
+        datetime.datetime(y, m, 1, 0, 0, 0)
+        for y in range(1914, 2021)
+        for m in range(1, 13)
+        ]
+    data_frame = pd.DataFrame(index = monthstime)
+    for taxipp_name, vector in vector_by_taxipp_name.iteritems():
+        data_frame[taxipp_name] = np.nan
+        data_frame.loc[vector.index.values, taxipp_name] = vector.values
+    return data_frame
+
+
+def compare_results(baseline_results, results, threshold = 0.2, rss_threshold = 0.2, min_duration = 0.01):
+    """Return the list of the regressions of results compared with baseline_results.
+
+    A stage regresses when it is slower by more than threshold (a ratio) and by more than min_duration seconds. A
+    workbook regresses when its peak RSS grows by more than rss_threshold.
+    """
+    regressions = []
+    for key, result in results.iteritems():
+        baseline_result = baseline_results.get(key)
+        if baseline_result is None or 'error' in baseline_result or 'skipped' in baseline_result:
+            continue
+        if 'skipped' in result:
+            continue
+        if 'error' in result:
+            regressions.append(u'{} failed: {}'.format(key, result['error']))
+            continue
+        for stage, stage_result in result['stages'].iteritems():
+            baseline_stage_result = baseline_result['stages'].get(stage)
+            if baseline_stage_result is None:
+                continue
+            duration = stage_result['seconds']
+            baseline_duration = baseline_stage_result['seconds']
+            if duration > baseline_duration * (1 + threshold) and duration - baseline_duration > min_duration:
+                regressions.append(u'{} {}: {:.4f}s instead of {:.4f}s (+{:.0%})'.format(key, stage, duration,
+                    baseline_duration, duration / baseline_duration - 1))
+        if result['peak_rss_kb'] > baseline_result['peak_rss_kb'] * (1 + rss_threshold):
+            regressions.append(u'{} peak RSS: {:.1f} MB instead of {:.1f} MB'.format(key,
+                result['peak_rss_kb'] / 1024., baseline_result['peak_rss_kb'] / 1024.))
+    return regressions
+
+
+def convert_cell_safely(converter, cell):
+    """Call a date or year converter, returning the exception it raises instead of raising it."""
+    try:
+        return converter(cell, state = parser.conv.default_state)
+    except Exception as exception:
+        return 'exception', type(exception)
+
+
+def count_workbook_cells(xls_path):
+    """Return the number of cells of all the sheets of a workbook, from their dimensions as given by xlrd."""
+    book = parser.open_workbook(xls_path)
+    try:
+        if parser.is_xlsx_path(xls_path):
+            return sum(
+                nrows * ncols
+                for nrows, ncols, merged_cells in (
+                    book.read_sheet_dimensions(book.part_path_by_sheet_name[sheet_name])
+                    for sheet_name in book.sheet_names()
+                    )
+                )
+        cells_count = 0
+        for sheet_name in book.sheet_names():
+            sheet = book.sheet_by_name(sheet_name)
+            cells_count += sheet.nrows * sheet.ncols
+            book.unload_sheet(sheet_name)
+        return cells_count
+    finally:
+        if parser.is_xlsx_path(xls_path):
+            book.close()
+        else:
+            book.release_resources()
+
+
+def iter_bundled_workbooks(dir):
+    """Iterate over the (bareme, xls_path) couples of the workbooks of a directory, as chosen by main()."""
+    dir = dir.decode('utf-8')
+    for bareme in parser.baremes:
+        xls_path = parser.find_workbook_path(dir, bareme)
+        if os.path.exists(xls_path):
+            yield bareme, xls_path
+
+
+def iter_suite_workbooks(dir):
+    """Iterate over the (pipeline, bareme, xls_path) triples of the suite, for every workbook of a directory.
+
+    Every workbook goes through parse_ipp_tax_benefit_tables ("parse_ipp" pipeline). The XLSX workbooks of the
+    baremes of parser.py also go through parser.py ("pandas" pipeline).
+    """
+    dir = dir.decode('utf-8')
+    bareme_by_slug = dict(
+        (parser.strings.slugify(bareme), bareme)
+        for bareme in parser.baremes
+        )
+    pandas_bareme_by_slug = dict(
+        (parser.strings.slugify(bareme), bareme)
+        for bareme in pandas_parser.baremes
+        )
+    prefix = u'baremes-ipp-'
+    for file_name in sorted(os.listdir(dir)):
+        name, extension = os.path.splitext(file_name)
+        if extension.lower() not in workbook_extensions:
+            continue
+        slug = parser.strings.slugify(name)
+        slug = slug[len(prefix):] if slug.startswith(prefix) else slug
+        xls_path = os.path.join(dir, file_name)
+        yield 'parse_ipp', bareme_by_slug.get(slug, name.split(u' - ', 1)[-1]), xls_path
+        if extension.lower() == u'.xlsx' and slug in pandas_bareme_by_slug:
+            yield 'pandas', pandas_bareme_by_slug[slug], xls_path
+
+
+def time_pandas_stages(bareme, xls_path, option, output_dir, profile):
+    """Run the stages of parser.py on a workbook, timing them in a profiling.Profile."""
+    with profile.stage('open'):
+        xls_file = pd.ExcelFile(xls_path)
+        sheet_names = pandas_parser.list_sheet_names(xls_file, bareme)
+    # Reading the sheets is part of parser.clean_sheet, so decoding and cleaning are a single stage.
+    with profile.stage('decoding'):
+        sheet_by_name = pandas_parser.clean_sheets(xls_file, sheet_names)
+    with profile.stage('indexing'):
+        pandas_parser.index_variable_names(bareme, sheet_by_name)
+    # The grid of parser.py is filled as it is built.
+    with profile.stage('grid'):
+        table = pandas_parser.build_table(sheet_by_name)
+    with profile.stage('csv'):
+        table.to_csv(os.path.join(output_dir, bareme + u'.csv'), encoding = 'utf-8')
+
+
+def time_parse_ipp_stages(bareme, xls_path, option, output_dir, profile):
+    """Run the stages of parse_ipp_tax_benefit_tables on a workbook, timing them in a profiling.Profile.
+
+    Like main(), stop after the validation of a workbook with errors, e.g. the unexpected number formats of Retraite,
+    and return the reason why its table isn't built.
+    """
+    with profile.stage('open'):
+        book = parser.open_workbook(xls_path)
+        number_format_by_xf_index = parser.build_number_format_by_xf_index(book)
+        sheet_names = parser.list_sheet_names(xls_path, bareme)
+    vectors_by_sheet_name = []
+    for sheet_name in sheet_names:
+        if parser.is_xlsx_path(xls_path):
+            # The merged cells of a XLSX sheet are read by a first pass over its XML, that decoding repeats.
+            with profile.stage('merged_cells'):
+                book.read_sheet_dimensions(book.part_path_by_sheet_name[sheet_name])
+            with profile.stage('decoding'):
+                rows = parser.decode_xlsx_sheet(book, sheet_name, number_format_by_xf_index)
+        else:
+            sheet = book.sheet_by_name(sheet_name)
+            with profile.stage('merged_cells'):
+                merged_cells_index = merged_cells.MergedCellsIndex(sheet.merged_cells)
+            with profile.stage('decoding'):
+                rows = parser.decode_xls_sheet(book, sheet, merged_cells_index, number_format_by_xf_index)
+        with profile.stage('classification'):
+            taxipp_names_row, labels_rows, values_rows, notes_rows, descriptions_rows = parser.classify_sheet_rows(
+                sheet_name, rows)
+        with profile.stage('vectors'):
+            vectors_by_sheet_name.append((sheet_name, parser.build_sheet_vectors(bareme, taxipp_names_row,
+                values_rows)))
+    with profile.stage('validation'):
+        issues = validation.validate_sheets(bareme, vectors_by_sheet_name)
+    errors_count = sum(1 for issue in issues if issue['severity'] == 'error')
+    if errors_count:
+        return u'{} validation errors, main() does not build its table'.format(errors_count)
+    with profile.stage('grid'):
+        vector_by_taxipp_name, unit_by_taxipp_name = parser.merge_sheets_vectors(vectors_by_sheet_name)
+        grid = parameter_grid.ParameterGrid.from_vectors(vector_by_taxipp_name, unit_by_taxipp_name,
+            end_year = 2020)
+    with profile.stage('resampling'):
+        grid = grid.fill().resample(option = option)
+    with profile.stage('csv'):
+        grid.to_data_frame().to_csv(os.path.join(output_dir, bareme + u'.csv'), encoding = 'utf-8')
+    return None
+
+
+def time_workbook_stages(pipeline, bareme, xls_path, cells_count, repeat, option):
+    """Run all the stages of a pipeline on a workbook, repeat times, and return the best duration of each stage.
+
+    This is the unit of work of the process pool of benchmark_suite, so it returns a JSON-compatible dict, with an
+    "error" item when the pipeline fails and a "skipped" item when main() doesn't build the table of the workbook.
+    """
+    output_dir = tempfile.mkdtemp(prefix = app_name)
+    duration_by_stage = collections.OrderedDict()
+    try:
+        for index in range(repeat):
+            # Start each run with an empty memo cache of dates.
+            parser.date_or_year_by_cell.clear()
+            profile = profiling.Profile(bareme = bareme, path = xls_path)
+            time_stages = time_pandas_stages if pipeline == 'pandas' else time_parse_ipp_stages
+            skip_reason = time_stages(bareme, xls_path, option, output_dir, profile)
+            if skip_reason is not None:
+                return dict(skipped = skip_reason)
+            for stage, duration in profile.seconds_by_stage.iteritems():
+                duration_by_stage[stage] = min(duration, duration_by_stage.get(stage, duration))
+    except Exception as exception:
+        log.exception(u'Benchmark of {} failed'.format(xls_path))
+        return dict(error = u'{}: {}'.format(type(exception).__name__, exception))
+    finally:
+        shutil.rmtree(output_dir)
+    seconds = sum(duration_by_stage.itervalues())
+    return collections.OrderedDict((
+        ('bareme', bareme),
+        ('cells', cells_count),
+        ('cells_per_second', cells_count / seconds),
+        ('peak_rss_kb', profiling.get_peak_rss() // 1024),
+        ('pipeline', pipeline),
+        ('seconds', seconds),
+        ('stages', collections.OrderedDict(
+            (stage, dict(cells_per_second = cells_count / duration if duration else None, seconds = duration))
+            for stage, duration in duration_by_stage.iteritems()
+            )),
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', choices = ['dates', 'grid', 'schedule', 'suite'], help = 'benchmark to run')
+    parser.add_argument('-b', '--baseline', help = 'JSON results of a previous suite run, to compare with')
+    parser.add_argument('-d', '--dir', default = default_dir, help = 'path of IPP XLS directory')
+    parser.add_argument('--min-duration', default = 0.01, type = float,
+        help = 'ignore slowdowns of a stage shorter than this number of seconds')
+    parser.add_argument('--incomes', default = 10 ** 7, type = int,
+        help = 'number of random incomes of the schedule benchmark')
+    parser.add_argument('-o', '--output', help = 'save the JSON results of the suite in this file')
+    parser.add_argument('--option', choices = ['all_months', 'mean_by_year', 'which_month_in_year'],
+        default = 'mean_by_year', help = 'resampling option of the suite')
+    parser.add_argument('-r', '--repeat', default = 5, type = int, help = 'number of timings, the best one is kept')
+    parser.add_argument('--rss-threshold', default = 0.2, type = float,
+        help = 'maximum relative growth of the peak RSS of a workbook, compared with the baseline')
+    parser.add_argument('--threshold', default = 0.2, type = float,
+        help = 'maximum relative slowdown of a stage, compared with the baseline')
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    parser.add_argument('-y', '--year', default = 2013, type = int, help = 'year of the schedules of the benchmark')
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+
+    return globals()['benchmark_{}'.format(args.benchmark)](args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
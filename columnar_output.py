@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+
+"""Write (and read back) the aggregated tables of IPP parameters as typed columnar files.
+
+Every parameter is stored as a float64 column, NaN meaning "unknown", with a separate boolean mask for the periods
+when it is abolished (the '-' of the CSV tables). A JSON sidecar gives the dtype and unit of each column.
+
+Formats:
+- npy: a directory per bareme, holding one .npy file per column, that can be memory-mapped by numpy.load;
+- feather & parquet: a single file per bareme (require pyarrow).
+"""
+
+
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+abolished_suffix = u'__abolished'
+output_formats = ('feather', 'npy', 'parquet')
+
+
+def get_metadata_path(output_dir, bareme, output_format):
+    if output_format == 'npy':
+        return os.path.join(get_output_path(output_dir, bareme, output_format), u'metadata.json')
+    return os.path.join(output_dir, u'{}.json'.format(bareme))
+
+
+def get_output_path(output_dir, bareme, output_format):
+    return os.path.join(output_dir, u'{}-{}'.format(bareme, output_format) if output_format == 'npy'
+        else u'{}.{}'.format(bareme, output_format))
+
+
+def read_columns(output_dir, bareme, output_format, taxipp_names, mmap_mode = 'r'):
+    """Read only some parameters of a bareme.
+
+    Return a data frame indexed by date, with a float64 column per parameter (NaN when unknown or abolished), and the
+    dict of the metadata of these parameters.
+    """
+    with io.open(get_metadata_path(output_dir, bareme, output_format), encoding = 'utf-8') as metadata_file:
+        metadata = json.load(metadata_file)
+    column_metadata_by_name = metadata['columns']
+    output_path = get_output_path(output_dir, bareme, output_format)
+    if output_format == 'npy':
+        index = np.load(os.path.join(output_path, metadata['index']))
+        data_frame = pd.DataFrame(
+            dict(
+                (taxipp_name, np.load(os.path.join(output_path, column_metadata_by_name[taxipp_name]['file']),
+                    mmap_mode = mmap_mode))
+                for taxipp_name in taxipp_names
+                ),
+            columns = taxipp_names,
+            index = pd.DatetimeIndex(index, name = u'date'),
+            )
+    else:
+        read = pd.read_feather if output_format == 'feather' else pd.read_parquet
+        # pyarrow expects byte strings as column names.
+        data_frame = read(output_path, columns = [
+            column.encode('utf-8')
+            for column in [u'date'] + list(taxipp_names)
+            ]).set_index(u'date')
+    return data_frame, dict(
+        (taxipp_name, column_metadata_by_name[taxipp_name])
+        for taxipp_name in taxipp_names
+        )
+
+
+def write_columns(index, columns, output_dir, bareme, output_format):
+    """Write the (taxipp_name, values, abolished, unit) columns of a bareme, indexed by an array of dates."""
+    assert output_format in output_formats, output_format
+    output_path = get_output_path(output_dir, bareme, output_format)
+    column_metadata_by_name = {}
+    index = np.asarray(index, dtype = 'datetime64[D]')
+    if output_format == 'npy':
+        if not os.path.isdir(output_path):
+            os.makedirs(output_path)
+        np.save(os.path.join(output_path, u'index.npy'), index)
+        for column_index, (taxipp_name, values, abolished, unit) in enumerate(columns):
+            file_name = u'{:05d}.npy'.format(column_index)
+            np.save(os.path.join(output_path, file_name), values)
+            column_metadata = dict(
+                dtype = values.dtype.name,
+                file = file_name,
+                unit = unit,
+                )
+            if abolished.any():
+                column_metadata['abolished_file'] = abolished_file_name = u'{:05d}.abolished.npy'.format(column_index)
+                np.save(os.path.join(output_path, abolished_file_name), abolished)
+            column_metadata_by_name[taxipp_name] = column_metadata
+    else:
+        array_by_name = {u'date': index}
+        column_names = [u'date']
+        for taxipp_name, values, abolished, unit in columns:
+            array_by_name[taxipp_name] = values
+            column_names.append(taxipp_name)
+            column_metadata = dict(
+                dtype = values.dtype.name,
+                unit = unit,
+                )
+            if abolished.any():
+                column_metadata['abolished_column'] = abolished_column = taxipp_name + abolished_suffix
+                array_by_name[abolished_column] = abolished
+                column_names.append(abolished_column)
+            column_metadata_by_name[taxipp_name] = column_metadata
+        typed_data_frame = pd.DataFrame(array_by_name, columns = column_names)
+        # pyarrow expects byte strings as column names.
+        typed_data_frame.columns = [column.encode('utf-8') for column in column_names]
+        if output_format == 'feather':
+            typed_data_frame.to_feather(output_path)
+        else:
+            typed_data_frame.to_parquet(output_path, index = False)
+    with io.open(get_metadata_path(output_dir, bareme, output_format), 'w', encoding = 'utf-8') as metadata_file:
+        metadata_file.write(unicode(json.dumps(
+            dict(
+                bareme = bareme,
+                columns = column_metadata_by_name,
+                format = output_format,
+                index = u'index.npy' if output_format == 'npy' else u'date',
+                ),
+            ensure_ascii = False,
+            indent = 2,
+            sort_keys = True,
+            )))
+
+
+def write_grid(grid, output_dir, bareme, output_format):
+    """Write a parameter_grid.ParameterGrid, whose columns are already typed."""
+    write_columns(
+        grid.dates,
+        (
+            (taxipp_name, np.ascontiguousarray(grid.values[:, column]),
+                np.ascontiguousarray(grid.abolished[:, column]), grid.units[column])
+            for column, taxipp_name in enumerate(grid.names)
+            ),
+        output_dir,
+        bareme,
+        output_format,
+        )
@@ -0,0 +1,282 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""Command line interface to build the IPP parameters of a directory of workbooks, and to look them up.
+
+Subcommands:
+- build: parse the workbooks into the aggregated tables, saving the <bareme>-store directories of change points and
+  the metadata store that query and search read;
+- query: values of a parameter at some dates, or all its change points, from the saved <bareme>-store directories,
+  or as known in each release, from the <bareme>-vintages directories of parse_ipp_tax_benefit_tables --vintages;
+- diff: parameters added, removed or modified from a release to another one;
+- search: parameters matching keywords, from the saved metadata store.
+
+Only build and diff import pandas, numpy and xlrd, when they run. query memory-maps the arrays of the saved stores
+with the standard library and search only loads JSON, so that they start fast enough for shell pipelines:
+
+    python ipp.py query -d Baremes_IPP csg_ij_ded 2012-01
+"""
+
+
+import argparse
+import ast
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+
+
+abolished_value = u'-'
+app_name = os.path.splitext(os.path.basename(__file__))[0]
+# struct format of the arrays of the saved stores, by numpy dtype description
+format_by_npy_descr = {
+    '<M8[D]': 'q',
+    '<f8': 'd',
+    '<i8': 'q',
+    '|b1': '?',
+    }
+log = logging.getLogger(app_name)
+store_dir_suffix = u'-store'
+vintages_dir_suffix = u'-vintages'
+
+
+class NpyArray(object):
+    """Memory-mapped one-dimensional array saved by numpy.save, read without numpy."""
+    def __init__(self, path):
+        with open(path, 'rb') as npy_file:
+            magic = npy_file.read(8)
+            if not magic.startswith('\x93NUMPY'):
+                raise ValueError(u'Not a NPY file: {}'.format(path).encode('utf-8'))
+            header_size_struct = struct.Struct('<H' if ord(magic[6]) == 1 else '<I')
+            header = ast.literal_eval(npy_file.read(header_size_struct.unpack(
+                npy_file.read(header_size_struct.size))[0]))
+            self.offset = npy_file.tell()
+            self.mapped = mmap.mmap(npy_file.fileno(), 0, access = mmap.ACCESS_READ)
+        self.format = format_by_npy_descr[header['descr']]
+        self.item_size = struct.calcsize('<' + self.format)
+        self.size, = header['shape']
+
+    def read(self, start, stop):
+        """Return the items from start to stop (excluded), as a tuple."""
+        return struct.unpack_from('<{}{}'.format(stop - start, self.format), self.mapped,
+            self.offset + start * self.item_size)
+
+
+class SavedStore(object):
+    """Read-only view of a parameter_store.ParameterStore saved in a directory, without numpy."""
+    def __init__(self, dir):
+        self.dir = dir
+        with open(os.path.join(dir, u'metadata.json'), 'rb') as metadata_file:
+            self.metadata = json.load(metadata_file)
+        self.index_by_name = dict((name, index) for index, name in enumerate(self.metadata['names']))
+        self.units = self.metadata['units']
+        self._array_by_name = {}
+
+    def __contains__(self, name):
+        return name in self.index_by_name
+
+    def get_array(self, array_name):
+        array = self._array_by_name.get(array_name)
+        if array is None:
+            array = self._array_by_name[array_name] = NpyArray(os.path.join(self.dir, u'{}.npy'.format(array_name)))
+        return array
+
+    def get_change_points(self, name):
+        """Return the (date, value) change points of a parameter: ISO 8601 dates and floats, or u'-' when abolished."""
+        return self.read_change_points(self.index_by_name[name])
+
+    def get_unit(self, name):
+        return self.units[self.index_by_name[name]]
+
+    def read_change_points(self, index):
+        """Return the change points between the offsets index and index + 1, see get_change_points."""
+        start, stop = self.get_array('offsets').read(index, index + 2)
+        epoch = datetime.date(1970, 1, 1)
+        return [
+            ((epoch + datetime.timedelta(days)).isoformat(), abolished_value if abolished else value)
+            for days, value, abolished in zip(
+                self.get_array('dates').read(start, stop),
+                self.get_array('values').read(start, stop),
+                self.get_array('abolished').read(start, stop),
+                )
+            ]
+
+
+class SavedVintageCube(SavedStore):
+    """Read-only view of a vintage_cube.VintageCube saved in a directory, without numpy.
+
+    Releases are given by their index in releases.
+    """
+    def __init__(self, dir):
+        super(SavedVintageCube, self).__init__(dir)
+        self.releases = self.metadata['releases']
+
+    def get_change_points(self, name, release_index):
+        """Return the change points of a parameter in a release (see SavedStore), or None when it doesn't have it."""
+        vector_id = self.get_vector_id(name, release_index)
+        return None if vector_id < 0 else self.read_change_points(vector_id)
+
+    def get_unit(self, name, release_index):
+        return self.units[self.get_vector_id(name, release_index)]
+
+    def get_vector_id(self, name, release_index):
+        position = release_index * len(self.index_by_name) + self.index_by_name[name]
+        return self.get_array('vector_ids').read(position, position + 1)[0]
+
+
+def build(args):
+    import parse_ipp_tax_benefit_tables
+
+    dir = args.dir
+    status = parse_ipp_tax_benefit_tables.main(dir, '', option = args.option, month = args.month,
+        argv = ['--dir', dir, '--store'] + args.options)
+    if status:
+        return status
+    store = parse_ipp_tax_benefit_tables.write_metadata_store(dir.decode('utf-8'))
+    print u"Voilà, les métadonnées de {} paramètres sont écrites !".format(len(store))
+    return 0
+
+
+def diff(args):
+    import parse_ipp_tax_benefit_tables
+    import sheet_cache
+
+    parse_ipp_tax_benefit_tables.diff_releases(args.old_dir.decode('utf-8'), args.new_dir.decode('utf-8'),
+        cache_dir = None if args.no_cache else sheet_cache.default_cache_dir(),
+        use_saved_stores = not args.reparse)
+    return 0
+
+
+def format_value(value):
+    """Format a value without losing digits: u'-' when abolished and an empty string when unknown."""
+    if value is None:
+        return u''
+    return value if isinstance(value, basestring) else repr(value)
+
+
+def iter_saved_stores(dir, bareme = None, vintages = False):
+    """Iterate over the (bareme, SavedStore) couples of the <bareme>-store directories of a directory.
+
+    When vintages is true, iterate over the (bareme, SavedVintageCube) couples of the <bareme>-vintages directories.
+    """
+    dir_suffix = vintages_dir_suffix if vintages else store_dir_suffix
+    for file_name in sorted(os.listdir(dir)):
+        if file_name.endswith(dir_suffix) and os.path.isdir(os.path.join(dir, file_name)):
+            store_bareme = file_name[:-len(dir_suffix)]
+            if bareme is None or store_bareme == bareme:
+                yield store_bareme, (SavedVintageCube if vintages else SavedStore)(os.path.join(dir, file_name))
+
+
+def print_values(fields, name, change_points, unit, dates):
+    """Print the values of a parameter at some dates, or its change points when there are no dates.
+
+    Each line is made of the given fields, followed by the name, the date, the value and the unit.
+    """
+    if not dates:
+        for date, value in change_points:
+            write_line(fields + [name, date, format_value(value), unit])
+        return
+    for date in dates:
+        # Complete partial dates with the first month and day, like the change points.
+        day = (date + u'-01-01')[:10]
+        value = None
+        for change_date, change_value in change_points:
+            if change_date > day:
+                break
+            value = change_value
+        write_line(fields + [name, date, format_value(value), unit])
+
+
+def query(args):
+    name = args.name.decode('utf-8')
+    dates = [date.decode('utf-8') for date in args.dates]
+    for bareme, store in iter_saved_stores(args.dir.decode('utf-8'),
+            bareme = args.bareme.decode('utf-8') if args.bareme is not None else None, vintages = args.vintages):
+        if name in store:
+            break
+    else:
+        log.error(u'Unknown parameter {}'.format(name))
+        return 1
+    if not args.vintages:
+        print_values([], name, store.get_change_points(name), store.get_unit(name) or u'', dates)
+        return 0
+    for release_index, release in enumerate(store.releases):
+        change_points = store.get_change_points(name, release_index)
+        if change_points is not None:
+            print_values([release], name, change_points, store.get_unit(name, release_index) or u'', dates)
+    return 0
+
+
+def search(args):
+    import metadata_store
+
+    store = metadata_store.MetadataStore.load(os.path.join(args.dir.decode('utf-8'), u'metadata'))
+    positions = store.search(u' '.join(word.decode('utf-8') for word in args.words),
+        bareme = args.bareme.decode('utf-8') if args.bareme is not None else None)
+    for position in positions:
+        sys.stdout.write(store.format_parameter(position).encode('utf-8') + '\n')
+    return 0
+
+
+def write_line(fields):
+    """Write tab-separated fields to the standard output, encoded in UTF-8 even when it is a pipe."""
+    sys.stdout.write(u'\t'.join(fields).encode('utf-8') + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    subparsers = parser.add_subparsers()
+
+    build_parser = subparsers.add_parser('build', help = 'parse the workbooks of a directory into the aggregated '
+        'tables, the parameter stores and the metadata store', description = 'The other options are given to '
+        'parse_ipp_tax_benefit_tables, e.g. --jobs 4 --output-format parquet.')
+    build_parser.add_argument('-d', '--dir', default = '.', help = 'directory of the IPP workbooks and of the output')
+    build_parser.add_argument('-m', '--month', default = 1, type = int,
+        help = 'month (1 to 12) of the which_month_in_year option')
+    build_parser.add_argument('-o', '--option', choices = ('all_months', 'mean_by_year', 'which_month_in_year'),
+        default = 'all_months', help = 'resampling of the aggregated tables')
+    build_parser.set_defaults(function = build)
+
+    diff_parser = subparsers.add_parser('diff', help = 'list the parameters changed from a release to another one')
+    diff_parser.add_argument('old_dir', help = 'directory of the old release')
+    diff_parser.add_argument('new_dir', help = 'directory of the new release')
+    diff_parser.add_argument('--no-cache', action = 'store_true', default = False,
+        help = 'parse every sheet, without reading or writing the cache')
+    diff_parser.add_argument('--reparse', action = 'store_true', default = False,
+        help = 'parse the workbooks even when a release has saved parameter stores')
+    diff_parser.set_defaults(function = diff)
+
+    query_parser = subparsers.add_parser('query', help = 'print the values of a parameter at some dates, or its '
+        'change points, as tab-separated name, date, value and unit')
+    query_parser.add_argument('name', help = 'taxipp_name of the parameter')
+    query_parser.add_argument('dates', nargs = '*', help = 'ISO 8601 dates, like 2012, 2012-01 or 2012-01-15')
+    query_parser.add_argument('-b', '--bareme', help = 'bareme of the parameter, by default the first having it')
+    query_parser.add_argument('-d', '--dir', default = '.', help = 'directory of the <bareme>-store directories')
+    query_parser.add_argument('-V', '--vintages', action = 'store_true', default = False,
+        help = 'print the parameter as known in each release, from the <bareme>-vintages directories, each line '
+        'starting with the release')
+    query_parser.set_defaults(function = query)
+
+    search_parser = subparsers.add_parser('search', help = 'print the parameters matching keywords, as '
+        'tab-separated bareme, sheet, name and labels')
+    search_parser.add_argument('words', nargs = '+', help = 'words to search, without case nor accents')
+    search_parser.add_argument('-b', '--bareme', help = 'only search the parameters of this bareme')
+    search_parser.add_argument('-d', '--dir', default = '.', help = 'directory of the metadata directory')
+    search_parser.set_defaults(function = search)
+
+    args, options = parser.parse_known_args()
+    if args.function is build:
+        args.options = options
+    elif options:
+        parser.error(u'unrecognized arguments: {}'.format(u' '.join(options)))
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+    return args.function(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+
+"""Index of the merged cells of a sheet, resolving a cell to the top-left cell (the anchor) of its merged range.
+
+The ranges are kept as column intervals by row, sorted by first column. A cell is resolved by a binary search in the
+intervals of its row, and the size of the index grows with the number of rows of the ranges, not of their cells.
+"""
+
+
+import bisect
+
+
+class MergedCellsIndex(object):
+    def __init__(self, merged_cells):
+        """Index xlrd ranges: (row_low, row_high, column_low, column_high) tuples, whose high bounds are excluded."""
+        self.column_lows_by_row_index = {}
+        self.intervals_by_row_index = {}
+        for row_low, row_high, column_low, column_high in merged_cells:
+            for row_index in xrange(row_low, row_high):
+                self.intervals_by_row_index.setdefault(row_index, []).append((column_low, column_high, row_low))
+        for row_index, intervals in self.intervals_by_row_index.iteritems():
+            intervals.sort()
+            self.column_lows_by_row_index[row_index] = [
+                column_low
+                for column_low, column_high, row_low in intervals
+                ]
+
+    def get_anchor(self, row_index, column_index):
+        """Return the (row_index, column_index) coordinates of the anchor of a merged cell, or None."""
+        column_lows = self.column_lows_by_row_index.get(row_index)
+        if column_lows is None:
+            return None
+        position = bisect.bisect_right(column_lows, column_index) - 1
+        if position < 0:
+            return None
+        column_low, column_high, row_low = self.intervals_by_row_index[row_index][position]
+        if column_index >= column_high:
+            return None
+        return row_low, column_low
+
+    def get_row_intervals(self, row_index):
+        """Return the (column_low, column_high, anchor_row_index) intervals of the merged ranges of a row."""
+        return self.intervals_by_row_index.get(row_index, ())
@@ -0,0 +1,239 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""Store of the metadata of IPP parameters, with an inverted index for keyword searches.
+
+For each parameter of each sheet, the store keeps its labels and notes, and for each of its change points the legal
+reference, the date of publication in the Journal officiel (JO) and the note of the row of the change. The
+descriptions of the sheets are kept once per sheet. Texts are interned, as the same legal reference is usually shared
+by every parameter of a row.
+
+The inverted index maps each word of the texts of a parameter, slugified by biryani (lower case, without accents), to
+the sorted positions of the parameters where it appears. It is built once with the store, so that a search across all
+baremes doesn't reopen any workbook. The store only uses JSON files and the standard library, so loading it doesn't
+import numpy or pandas:
+
+    python metadata_store.py -d Baremes_IPP/metadata allocations familiales
+"""
+
+
+import argparse
+import bisect
+import io
+import json
+import logging
+import os
+import sys
+
+from biryani1 import strings
+
+
+app_name = os.path.splitext(os.path.basename(__file__))[0]
+log = logging.getLogger(app_name)
+
+
+class MetadataStore(object):
+    """Metadata of parameters, by position.
+
+    A parameter is a dict with its bareme, sheet, name, unit, labels & notes (lists of text indexes) and change points
+    ([date, reference, publication, note] lists, where the last three are text indexes or None).
+    """
+    def __init__(self, parameters, texts, description_by_sheet_by_bareme, tokens, postings):
+        self.description_by_sheet_by_bareme = description_by_sheet_by_bareme
+        self.parameters = parameters
+        self.postings = postings
+        self.texts = texts
+        self.tokens = tokens
+
+    def __len__(self):
+        return len(self.parameters)
+
+    @classmethod
+    def from_sheets(cls, sheets):
+        """Build a store and its index from (bareme, sheet_name, description, parameters) tuples.
+
+        Each parameter is a dict with its name, unit, labels and notes (lists of texts) and change points
+        ((date, reference, publication, note) tuples of an ISO 8601 date and of texts or None).
+        """
+        description_by_sheet_by_bareme = {}
+        index_by_text = {}
+        parameters = []
+        texts = []
+
+        def intern(text):
+            if text is None:
+                return None
+            index = index_by_text.get(text)
+            if index is None:
+                index = index_by_text[text] = len(texts)
+                texts.append(text)
+            return index
+
+        for bareme, sheet_name, description, sheet_parameters in sheets:
+            description_by_sheet_by_bareme.setdefault(bareme, {})[sheet_name] = description
+            for parameter in sheet_parameters:
+                parameters.append(dict(
+                    bareme = bareme,
+                    change_points = [
+                        [date, intern(reference), intern(publication), intern(note)]
+                        for date, reference, publication, note in parameter['change_points']
+                        ],
+                    labels = [intern(label) for label in parameter['labels']],
+                    name = parameter['name'],
+                    notes = [intern(note) for note in parameter['notes']],
+                    sheet = sheet_name,
+                    unit = parameter['unit'],
+                    ))
+        store = cls(parameters, texts, description_by_sheet_by_bareme, [], [])
+        store.build_index()
+        return store
+
+    def build_index(self):
+        positions_by_token = {}
+        for position in xrange(len(self.parameters)):
+            for token in self.iter_parameter_tokens(position):
+                positions = positions_by_token.setdefault(token, [])
+                # Positions are visited in order, so each list stays sorted and without duplicates.
+                if not positions or positions[-1] != position:
+                    positions.append(position)
+        self.tokens = sorted(positions_by_token)
+        self.postings = [positions_by_token[token] for token in self.tokens]
+
+    def format_parameter(self, position):
+        """Return the bareme, sheet, name and labels of a parameter, as a line of tab-separated values."""
+        parameter = self.parameters[position]
+        return u'\t'.join([
+            parameter['bareme'],
+            parameter['sheet'],
+            parameter['name'],
+            u' / '.join(self.texts[index] for index in parameter['labels']),
+            ])
+
+    def get(self, name, bareme = None):
+        """Return the metadata of the parameters with a name, in a bareme or in any, with their texts."""
+        return [
+            self.get_parameter(position)
+            for position, parameter in enumerate(self.parameters)
+            if parameter['name'] == name and (bareme is None or parameter['bareme'] == bareme)
+            ]
+
+    def get_parameter(self, position):
+        """Return the metadata of a parameter, with its texts instead of text indexes."""
+        parameter = self.parameters[position]
+        return dict(
+            bareme = parameter['bareme'],
+            change_points = [
+                [date, self.get_text(reference), self.get_text(publication), self.get_text(note)]
+                for date, reference, publication, note in parameter['change_points']
+                ],
+            description = self.description_by_sheet_by_bareme[parameter['bareme']][parameter['sheet']],
+            labels = [self.texts[index] for index in parameter['labels']],
+            name = parameter['name'],
+            notes = [self.texts[index] for index in parameter['notes']],
+            sheet = parameter['sheet'],
+            unit = parameter['unit'],
+            )
+
+    def get_text(self, index):
+        return None if index is None else self.texts[index]
+
+    def iter_parameter_tokens(self, position):
+        """Iterate over the slugified words of the name, sheet, description and texts of a parameter."""
+        parameter = self.parameters[position]
+        text_indexes = set(parameter['labels'])
+        text_indexes.update(parameter['notes'])
+        for change_point in parameter['change_points']:
+            text_indexes.update(change_point[1:])
+        text_indexes.discard(None)
+        for text in [parameter['name'], parameter['sheet'],
+                self.description_by_sheet_by_bareme[parameter['bareme']][parameter['sheet']]] + [
+                self.texts[index] for index in text_indexes]:
+            for token in tokenize(text):
+                yield token
+        # Also index the whole name, so that a name containing separators can be searched as is.
+        yield strings.slugify(parameter['name'])
+
+    @classmethod
+    def load(cls, dir):
+        # Let json decode the UTF-8 bytes, much faster than a text file of io.
+        with open(os.path.join(dir, u'metadata.json'), 'rb') as metadata_file:
+            metadata = json.load(metadata_file)
+        with open(os.path.join(dir, u'index.json'), 'rb') as index_file:
+            index = json.load(index_file)
+        return cls(metadata['parameters'], metadata['texts'], metadata['description_by_sheet_by_bareme'],
+            index['tokens'], index['postings'])
+
+    def save(self, dir):
+        if not os.path.isdir(dir):
+            os.makedirs(dir)
+        for file_name, content in (
+                (u'metadata.json', dict(
+                    description_by_sheet_by_bareme = self.description_by_sheet_by_bareme,
+                    parameters = self.parameters,
+                    texts = self.texts,
+                    )),
+                (u'index.json', dict(
+                    postings = self.postings,
+                    tokens = self.tokens,
+                    )),
+                ):
+            with io.open(os.path.join(dir, file_name), 'w', encoding = 'utf-8') as json_file:
+                json_file.write(unicode(json.dumps(content, ensure_ascii = False, separators = (',', ':'))))
+
+    def search(self, query, bareme = None):
+        """Return the positions of the parameters matching every word of a query, in a bareme or in any.
+
+        Words are compared without case nor accents, and each word of the query matches the words it begins.
+        """
+        positions = None
+        for term in tokenize(query):
+            term_positions = set()
+            start = bisect.bisect_left(self.tokens, term)
+            for index in xrange(start, len(self.tokens)):
+                if not self.tokens[index].startswith(term):
+                    break
+                term_positions.update(self.postings[index])
+            positions = term_positions if positions is None else positions & term_positions
+            if not positions:
+                return []
+        if positions is None:
+            return []
+        return [
+            position
+            for position in sorted(positions)
+            if bareme is None or self.parameters[position]['bareme'] == bareme
+            ]
+
+
+def tokenize(text):
+    """Return the words of a text, slugified."""
+    if not text:
+        return []
+    return [
+        token
+        for token in strings.slugify(text).split(u'-')
+        if token
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('query', nargs = '+', help = 'words to search, without case nor accents')
+    parser.add_argument('-b', '--bareme', help = 'only search the parameters of this bareme')
+    parser.add_argument('-d', '--dir', default = 'metadata', help = 'directory of the metadata store')
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+
+    store = MetadataStore.load(args.dir.decode('utf-8'))
+    positions = store.search(u' '.join(word.decode('utf-8') for word in args.query),
+        bareme = args.bareme.decode('utf-8') if args.bareme is not None else None)
+    for position in positions:
+        sys.stdout.write(store.format_parameter(position).encode('utf-8') + '\n')
+    log.info(u'{} parameters found'.format(len(positions)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+
+"""Stream the changes of IPP parameters as NDJSON events, one sheet at a time.
+
+Each line is a JSON object {"parameter", "date", "value", "unit", "sheet"}, where date is the ISO 8601 date when the
+parameter takes a new value: a number, or "-" when it is abolished. Missing and not known values continue the previous
+value, so they give no event. The events of a sheet are written as soon as it is parsed, so a loader can start
+reading them while the next sheets are parsed.
+"""
+
+
+import collections
+import json
+
+import parameter_store
+
+
+def iter_sheet_events(sheet_name, vectors):
+    """Iterate over the events of the (taxipp_name, vector, unit) triples of a sheet, in column & date order."""
+    for taxipp_name, vector, unit in vectors:
+        for date, value, abolished in parameter_store.iter_change_points(vector):
+            yield collections.OrderedDict((
+                ('parameter', taxipp_name),
+                ('date', date.isoformat()),
+                ('value', parameter_store.abolished_value if abolished else value),
+                ('unit', unit),
+                ('sheet', sheet_name),
+                ))
+
+
+def write_events(output_file, events):
+    """Write events to a text file, one JSON object per line, and return their number."""
+    count = 0
+    for event in events:
+        output_file.write(unicode(json.dumps(event, ensure_ascii = False)) + u'\n')
+        count += 1
+    output_file.flush()
+    return count
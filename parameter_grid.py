@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+
+"""Monthly grid of the parameters of a bareme, as typed arrays instead of a data frame of objects.
+
+The values of the parameters are a (dates, parameters) float64 array, NaN meaning "no value". Two boolean masks of the
+same shape mark the abolished cells ('-') and the not known cells ('nc'), and the unit of each parameter is kept with
+it. Filling the gaps and resampling the grid are vectorized over these arrays: the sentinels are only rendered back
+when the grid is converted to a data frame, e.g. to write the CSV tables.
+"""
+
+
+import collections
+import datetime
+
+import numpy as np
+import pandas as pd
+
+
+abolished_value = '-'
+months_by_resolution = collections.OrderedDict((
+    ('quarterly', 3),
+    ('annual', 12),
+    ))
+not_known_value = u'nc'
+statistics = ('mean', 'first', 'last', 'min', 'max')
+
+
+class ParameterGrid(object):
+    """Values of parameters (columns) at dates (rows).
+
+    Columns whose vectors mix numbers and sentinels are "mixed": like the former data frames of objects, they are
+    rendered with their integral values as integers, except the cells marked in floats, whose values were floats in
+    their vectors (e.g. FRF amounts converted to EUR, rendered as 311.0).
+    """
+    def __init__(self, dates, names, values, abolished, not_known, units = None, mixed = None, floats = None):
+        self.abolished = abolished
+        self.dates = dates
+        self.floats = floats if floats is not None else np.zeros(values.shape, dtype = np.bool_)
+        self.mixed = mixed if mixed is not None else np.zeros(len(names), dtype = np.bool_)
+        self.names = names
+        self.not_known = not_known
+        self.units = units if units is not None else [None] * len(names)
+        self.values = values
+
+    def aggregate(self, periods, statistic):
+        """Aggregate the (dates, values, abolished, floats) periods given by split_periods with a statistic.
+
+        Statistics: 'mean', 'min' & 'max', where abolished cells count as 0, and 'first' & 'last', which give the
+        first and last cells with a value of each period.
+        """
+        dates, values, abolished, floats = periods
+        shape = (values.shape[0], values.shape[2])
+        mixed = self.mixed
+        if statistic in ('first', 'last'):
+            has_value = ~np.isnan(values) | abolished
+            if statistic == 'first':
+                months = np.argmax(has_value, axis = 1)
+            else:
+                months = values.shape[1] - 1 - np.argmax(has_value[:, ::-1], axis = 1)
+            periods_index, columns_index = np.indices(shape)
+            found = has_value.any(axis = 1)
+            return self.__class__(dates, self.names,
+                np.where(found, values[periods_index, months, columns_index], np.nan),
+                found & abolished[periods_index, months, columns_index], np.zeros(shape, dtype = np.bool_),
+                units = self.units, mixed = mixed, floats = found & floats[periods_index, months, columns_index])
+        values = np.where(abolished, 0, values)
+        if statistic == 'mean':
+            # Add the months up in order, like pandas does.
+            sums = np.zeros(shape)
+            counts = np.zeros(shape, dtype = np.int64)
+            for month_values in values.swapaxes(0, 1):
+                known = ~np.isnan(month_values)
+                sums += np.where(known, month_values, 0)
+                counts += known
+            with np.errstate(invalid = 'ignore'):
+                aggregates = sums / counts
+            # Mixed columns without gaps nor fractional values were averaged by pandas as integers.
+            filled = np.where(self.abolished, 0, self.values)
+            mixed = mixed & ~np.isnan(filled).any(axis = 0) & (filled == np.floor(filled)).all(axis = 0)
+        elif statistic == 'min':
+            aggregates = np.fmin.reduce(values, axis = 1)
+        elif statistic == 'max':
+            aggregates = np.fmax.reduce(values, axis = 1)
+        else:
+            raise ValueError(u'Unknown statistic: {}'.format(statistic).encode('utf-8'))
+        no_values = np.zeros(shape, dtype = np.bool_)
+        return self.__class__(dates, self.names, aggregates, no_values, no_values.copy(), units = self.units,
+            mixed = mixed)
+
+    def build_cube(self, reference_months = ()):
+        """Compute at once every aggregate of a filled grid, by name.
+
+        The aggregates are the monthly grid itself ("monthly"), the quarterly & annual aggregates with each of
+        statistics (e.g. "quarterly_mean", "annual_last") and the reference months of each year (e.g. "month_05").
+        The grid is laid out by quarters and by years only once.
+        """
+        grid_by_name = collections.OrderedDict()
+        grid_by_name['monthly'] = self
+        for resolution, period_months in months_by_resolution.iteritems():
+            periods = self.split_periods(period_months)
+            for statistic in statistics:
+                grid_by_name['{}_{}'.format(resolution, statistic)] = self.aggregate(periods, statistic)
+        for month in reference_months:
+            grid_by_name['month_{:02d}'.format(month)] = self.select_month(month)
+        return grid_by_name
+
+    def fill(self):
+        """Return the grid where each cell without value takes the value of the previous cell of its column.
+
+        Not known cells are filled too. The rows before the first value of any parameter are dropped.
+        """
+        has_value = ~np.isnan(self.values) | self.abolished
+        rows = np.where(has_value, np.arange(len(self.dates))[:, None], -1)
+        np.maximum.accumulate(rows, axis = 0, out = rows)
+        filled = rows >= 0
+        columns = np.arange(len(self.names))
+        values = np.where(filled, self.values[rows, columns], np.nan)
+        abolished = filled & self.abolished[rows, columns]
+        floats = filled & self.floats[rows, columns]
+        first_row = int(np.argmax(filled.any(axis = 1))) if filled.any() else len(self.dates)
+        return self.__class__(self.dates[first_row:], self.names, values[first_row:], abolished[first_row:],
+            np.zeros_like(abolished[first_row:]), units = self.units, mixed = self.mixed, floats = floats[first_row:])
+
+    @classmethod
+    def allocate(cls, names, dates, units = None, end_year = None):
+        """Return a monthly grid without values for some parameters, spanning some dates.
+
+        The grid starts at the first of the dates and ends in December of the year of the last one, or of end_year when
+        it is later. It has no rows when there are no dates.
+        """
+        shape = (0, len(names))
+        if not dates:
+            return cls(np.array([], dtype = 'datetime64[D]'), names, np.empty(shape), np.empty(shape, dtype = np.bool_),
+                np.empty(shape, dtype = np.bool_), units = units)
+        first_month = np.datetime64(min(dates).replace(day = 1), 'M')
+        last_month = np.datetime64(datetime.date(max(max(dates).year, end_year or 0), 12, 1), 'M')
+        months = np.arange(first_month, last_month + 1)
+        shape = (len(months), len(names))
+        return cls(months.astype('datetime64[D]'), names, np.full(shape, np.nan), np.zeros(shape, dtype = np.bool_),
+            np.zeros(shape, dtype = np.bool_), units = units)
+
+    @classmethod
+    def from_vectors(cls, vector_by_taxipp_name, unit_by_taxipp_name = None, end_year = None):
+        """Scatter the vectors (pd.Series of dates to values) of the parameters onto a monthly grid.
+
+        The grid starts at the first date of the vectors and ends in December of the year of their last date, or of
+        end_year when it is later. When a date is repeated in a vector, its last value is kept.
+        """
+        names = list(vector_by_taxipp_name)
+        vectors = [
+            deduplicate(vector)
+            for vector in vector_by_taxipp_name.itervalues()
+            ]
+        grid = cls.allocate(names, [date for vector in vectors for date in get_end_dates(vector)],
+            units = [(unit_by_taxipp_name or {}).get(name) for name in names], end_year = end_year)
+        for column, vector in enumerate(vectors):
+            grid.scatter(column, vector)
+        return grid
+
+    def resample(self, option = 'all_months', month = 1):
+        """Resample a filled grid according to option.
+
+        Options: 'all_months' keeps every month, 'mean_by_year' averages each year (abolished cells counting as 0)
+        and 'which_month_in_year' keeps the given month of each year.
+        """
+        if option == 'mean_by_year':
+            return self.aggregate(self.split_periods(12), 'mean')
+        if option == 'which_month_in_year':
+            return self.select_month(month)
+        return self
+
+    def scatter(self, column, vector):
+        """Write the values of a vector without repeated dates (see deduplicate) in a column of the grid."""
+        months = np.array(vector.index.tolist(), dtype = 'datetime64[M]')
+        rows = (months - self.dates[:1].astype('datetime64[M]')).astype(np.int64)
+        assert (rows >= 0).all(), u'Vector dated before the grid: {}'.format(vector.index.min()).encode('utf-8')
+        if vector.dtype != object:
+            self.values[rows, column] = vector.values
+            return
+        self.mixed[column] = True
+        for row, value in zip(rows, vector.values):
+            if value == abolished_value:
+                self.abolished[row, column] = True
+            elif value == not_known_value:
+                self.not_known[row, column] = True
+            elif value is not None:
+                self.values[row, column] = value
+                self.floats[row, column] = isinstance(value, float)
+
+    def select_month(self, month):
+        """Return the rows of the given month (1 to 12) of each year."""
+        rows = (self.dates.astype('datetime64[M]').astype(np.int64) % 12) == month - 1
+        return self.__class__(self.dates[rows], self.names, self.values[rows], self.abolished[rows],
+            self.not_known[rows], units = self.units, mixed = self.mixed, floats = self.floats[rows])
+
+    def split_periods(self, period_months):
+        """Lay the rows of a monthly grid out by periods of period_months months, aligned on years.
+
+        Return a (dates, values, abolished, floats) tuple, where dates are the first days of the periods and values,
+        abolished & floats are (periods, period_months, parameters) arrays, padded with NaN & False.
+        """
+        months = self.dates.astype('datetime64[M]')
+        first_year = months[:1].astype('datetime64[Y]')
+        offset = int((months[:1] - first_year.astype('datetime64[M]')).astype(np.int64).sum())
+        periods_count = -(-(offset + len(months)) // period_months)
+        shape = (periods_count, period_months, len(self.names))
+        values = np.full(shape, np.nan)
+        values.reshape(-1, len(self.names))[offset:offset + len(months)] = self.values
+        abolished = np.zeros(shape, dtype = np.bool_)
+        abolished.reshape(-1, len(self.names))[offset:offset + len(months)] = self.abolished
+        floats = np.zeros(shape, dtype = np.bool_)
+        floats.reshape(-1, len(self.names))[offset:offset + len(months)] = self.floats
+        dates = (first_year.astype('datetime64[M]') + np.arange(periods_count) * period_months).astype(
+            'datetime64[D]')
+        return dates, values, abolished, floats
+
+    def to_data_frame(self):
+        """Convert the grid to a data frame, rendering abolished and not known cells with the former sentinels."""
+        columns = []
+        for column, name in enumerate(self.names):
+            values = self.values[:, column]
+            if not self.mixed[column]:
+                columns.append(values)
+                continue
+            objects = values.astype(object)
+            integral = np.isfinite(values) & (values == np.floor(values)) & ~self.floats[:, column]
+            objects[integral] = values[integral].astype(np.int64).astype(object)
+            objects[self.abolished[:, column]] = abolished_value
+            objects[self.not_known[:, column]] = not_known_value
+            columns.append(objects)
+        return pd.DataFrame(
+            dict(zip(self.names, columns)),
+            columns = self.names,
+            index = pd.DatetimeIndex(self.dates),
+            )
+
+
+def deduplicate(vector):
+    """Keep the last value of each date of a vector, sorted by date."""
+    return vector[~vector.index.duplicated(keep = 'last')].sort_index()
+
+
+def get_end_dates(vector):
+    """Return the earliest and latest dates of a vector, which bound the grid.
+
+    The rows of a sheet are not always sorted, so these are not always the dates of its first and last rows.
+    """
+    if not len(vector):
+        return []
+    return [vector.index.min(), vector.index.max()]
@@ -0,0 +1,284 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""Local service answering batched lookups of IPP parameters, from memory-mapped parameter stores.
+
+The server loads once the stores saved by parse_ipp_tax_benefit_tables --store (the <bareme>-store directories of a
+directory). Their arrays are memory-mapped, so the pages are shared with every process reading the same stores. It
+listens on a Unix socket or on a localhost TCP port, with a thread per connection.
+
+Messages are frames: the size of a JSON header, as a 4-byte big-endian integer, the header, then a binary payload
+whose size is given by the "payload_size" item of the header. Methods:
+- gather: values of some parameters of a bareme at some dates, the dates being the payload (int64 days since
+  1970-01-01). The response payload is the (names, dates) float64 array of values, followed by the boolean array of
+  abolished flags when "with_abolished" is true;
+- health: status and loaded baremes;
+- metrics: counters of requests, errors, gathered values and time spent.
+
+Client talks to a server. LocalClient has the same interface but calls a ParameterService of the same process, for
+tests.
+"""
+
+
+import argparse
+import json
+import logging
+import os
+import socket
+import SocketServer
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+import parameter_store
+
+
+app_name = os.path.splitext(os.path.basename(__file__))[0]
+frame_size_struct = struct.Struct('>I')
+log = logging.getLogger(app_name)
+store_dir_suffix = u'-store'
+
+
+class ParameterService(object):
+    """Answer the requests of clients, from the parameter store of each bareme."""
+    def __init__(self, store_by_bareme):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.store_by_bareme = store_by_bareme
+        self.counters = dict(
+            errors = 0,
+            gathered_values = 0,
+            requests = 0,
+            seconds = 0.0,
+            )
+        self.requests_by_method = {}
+
+    def gather(self, header, payload):
+        store = self.store_by_bareme.get(header['bareme'])
+        if store is None:
+            raise ValueError(u'Unknown bareme: {}'.format(header['bareme']))
+        names = header['names']
+        unknown_names = [
+            name
+            for name in names
+            if name not in store
+            ]
+        if unknown_names:
+            raise ValueError(u'Unknown parameters in {}: {}'.format(header['bareme'], u', '.join(unknown_names)))
+        dates = np.frombuffer(payload, dtype = np.int64).view('datetime64[D]')
+        with_abolished = header.get('with_abolished', False)
+        if with_abolished:
+            values, abolished = store.gather_many(names, dates, with_abolished = True)
+            response_payload = values.tobytes() + abolished.tobytes()
+        else:
+            values = store.gather_many(names, dates)
+            response_payload = values.tobytes()
+        with self.lock:
+            self.counters['gathered_values'] += values.size
+        return dict(shape = values.shape, with_abolished = with_abolished), response_payload
+
+    def handle(self, header, payload):
+        """Answer a request, returning the (header, payload) couple of the response."""
+        start = time.time()
+        method = header.get('method')
+        try:
+            if method not in ('gather', 'health', 'metrics'):
+                raise ValueError(u'Unknown method: {}'.format(method))
+            if method == 'gather':
+                response_header, response_payload = self.gather(header, payload)
+            else:
+                response_header, response_payload = getattr(self, method)(), b''
+            response_header['status'] = 'ok'
+        except Exception as exception:
+            log.exception(u'Request {} failed'.format(method))
+            response_header = dict(error = u'{}: {}'.format(type(exception).__name__, unicode(exception)),
+                status = 'error')
+            response_payload = b''
+            with self.lock:
+                self.counters['errors'] += 1
+        with self.lock:
+            self.counters['requests'] += 1
+            self.counters['seconds'] += time.time() - start
+            self.requests_by_method[method] = self.requests_by_method.get(method, 0) + 1
+        return response_header, response_payload
+
+    def health(self):
+        return dict(
+            baremes = sorted(self.store_by_bareme),
+            pid = os.getpid(),
+            uptime = time.time() - self.start_time,
+            )
+
+    @classmethod
+    def load(cls, dir, mmap_mode = 'r'):
+        """Load the parameter stores of the <bareme>-store directories of a directory (an unicode path)."""
+        store_by_bareme = {}
+        for file_name in sorted(os.listdir(dir)):
+            if file_name.endswith(store_dir_suffix) and os.path.isdir(os.path.join(dir, file_name)):
+                bareme = file_name[:-len(store_dir_suffix)]
+                store_by_bareme[bareme] = parameter_store.ParameterStore.load(os.path.join(dir, file_name),
+                    mmap_mode = mmap_mode)
+                log.info(u'Loaded {} parameters of {}'.format(len(store_by_bareme[bareme]), bareme))
+        return cls(store_by_bareme)
+
+    def metrics(self):
+        with self.lock:
+            metrics = dict(self.counters, requests_by_method = dict(self.requests_by_method))
+        metrics['change_points_by_bareme'] = dict(
+            (bareme, len(store.dates))
+            for bareme, store in self.store_by_bareme.iteritems()
+            )
+        metrics['parameters_by_bareme'] = dict(
+            (bareme, len(store))
+            for bareme, store in self.store_by_bareme.iteritems()
+            )
+        metrics['uptime'] = time.time() - self.start_time
+        return metrics
+
+
+class BaseClient(object):
+    """Interface of the clients of a ParameterService. Subclasses implement request."""
+    def gather(self, bareme, names, dates, with_abolished = False):
+        """Return the values of some parameters of a bareme at some dates, as a (names, dates) float64 array.
+
+        The value is NaN before the first change point of a parameter and when it is abolished. When with_abolished
+        is true, also return the boolean array of abolished flags.
+        """
+        dates = np.asarray(dates, dtype = 'datetime64[D]')
+        header, payload = self.request(
+            dict(bareme = bareme, method = 'gather', names = list(names), with_abolished = with_abolished),
+            dates.astype(np.int64).tobytes(),
+            )
+        shape = tuple(header['shape'])
+        values = np.frombuffer(payload, dtype = np.float64, count = shape[0] * shape[1]).reshape(shape)
+        if with_abolished:
+            abolished = np.frombuffer(payload, dtype = np.bool_, offset = values.nbytes).reshape(shape)
+            return values, abolished
+        return values
+
+    def health(self):
+        return self.request(dict(method = 'health'))[0]
+
+    def metrics(self):
+        return self.request(dict(method = 'metrics'))[0]
+
+    def request(self, header, payload = b''):
+        """Send a request and return the (header, payload) couple of its response, raising on errors."""
+        raise NotImplementedError
+
+
+class Client(BaseClient):
+    """Client of a parameter server, listening on a Unix socket (a path) or on a TCP port (a (host, port) couple)."""
+    def __init__(self, address):
+        self.socket = socket.socket(socket.AF_UNIX if isinstance(address, basestring) else socket.AF_INET,
+            socket.SOCK_STREAM)
+        self.socket.connect(address)
+        self.input_file = self.socket.makefile('rb')
+        self.output_file = self.socket.makefile('wb')
+
+    def close(self):
+        self.input_file.close()
+        self.output_file.close()
+        self.socket.close()
+
+    def request(self, header, payload = b''):
+        write_frame(self.output_file, header, payload)
+        frame = read_frame(self.input_file)
+        if frame is None:
+            raise IOError(u'Connection closed by the parameter server')
+        return check_response(*frame)
+
+
+class LocalClient(BaseClient):
+    """Client calling a ParameterService of the same process, with the same encoding as Client."""
+    def __init__(self, service):
+        self.service = service
+
+    def close(self):
+        pass
+
+    def request(self, header, payload = b''):
+        # Go through JSON, like a remote request.
+        return check_response(*self.service.handle(json.loads(json.dumps(header)), payload))
+
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        while True:
+            frame = read_frame(self.rfile)
+            if frame is None:
+                return
+            write_frame(self.wfile, *self.server.service.handle(*frame))
+            self.wfile.flush()
+
+
+class TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+def check_response(header, payload):
+    if header.get('status') != 'ok':
+        raise ValueError(u'Parameter server error: {}'.format(header.get('error')).encode('utf-8'))
+    return header, payload
+
+
+def read_frame(input_file):
+    """Read a (header, payload) frame, or return None at the end of the stream."""
+    size_bytes = input_file.read(frame_size_struct.size)
+    if len(size_bytes) < frame_size_struct.size:
+        return None
+    header = json.loads(input_file.read(frame_size_struct.unpack(size_bytes)[0]).decode('utf-8'))
+    payload = input_file.read(header.get('payload_size', 0))
+    return header, payload
+
+
+def write_frame(output_file, header, payload = b''):
+    header = dict(header, payload_size = len(payload))
+    header_bytes = json.dumps(header, ensure_ascii = False).encode('utf-8')
+    output_file.write(frame_size_struct.pack(len(header_bytes)) + header_bytes + payload)
+    output_file.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--dir', default = '.', help = 'directory of the <bareme>-store directories')
+    parser.add_argument('-p', '--port', type = int, help = 'listen on this TCP port of localhost')
+    parser.add_argument('-s', '--socket', default = 'parameter_server.sock', help = 'listen on this Unix socket')
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+
+    service = ParameterService.load(args.dir.decode('utf-8'))
+    if not service.store_by_bareme:
+        log.error(u'No parameter store in {}'.format(args.dir))
+        return 1
+    if args.port is not None:
+        server = TCPServer(('127.0.0.1', args.port), RequestHandler)
+    else:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixServer(args.socket, RequestHandler)
+    server.service = service
+    log.info(u'Serving {} baremes'.format(len(service.store_by_bareme)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.port is None:
+            os.remove(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+
+"""Compact store of IPP parameters, kept as change points instead of a dense monthly grid.
+
+For each taxipp_name, the store keeps the sorted dates when the value of the parameter changes and the new values.
+Like the aggregated tables, a missing value (None, NaN or 'nc') continues the previous value, and '-' marks an
+abolished parameter.
+
+All parameters share the same flat arrays (dates, values and abolished flags), sliced by an offsets array, so that
+a saved store can be memory-mapped.
+"""
+
+
+import datetime
+import hashlib
+import io
+import json
+import math
+import os
+
+import numpy as np
+
+
+abolished_value = u'-'
+
+
+class ParameterStore(object):
+    def __init__(self, names, offsets, dates, values, abolished, units = None):
+        self.abolished = abolished
+        self.dates = dates
+        self.index_by_name = dict((name, index) for index, name in enumerate(names))
+        self.names = names
+        self.offsets = offsets
+        self.units = units if units is not None else [None] * len(names)
+        self.values = values
+
+    def __contains__(self, name):
+        return name in self.index_by_name
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_vectors(cls, vector_by_taxipp_name, unit_by_taxipp_name = None):
+        """Build a store from the pd.Series (dates to values) of the parser."""
+        names = sorted(vector_by_taxipp_name)
+        offsets = [0]
+        dates = []
+        values = []
+        abolished = []
+        for name in names:
+            change_points = iter_change_points(vector_by_taxipp_name[name])
+            for date, value, is_abolished in change_points:
+                dates.append(date)
+                values.append(value)
+                abolished.append(is_abolished)
+            offsets.append(len(dates))
+        return cls(
+            names,
+            np.array(offsets, dtype = np.int64),
+            np.array(dates, dtype = 'datetime64[D]'),
+            np.array(values, dtype = np.float64),
+            np.array(abolished, dtype = np.bool_),
+            units = [
+                (unit_by_taxipp_name or {}).get(name)
+                for name in names
+                ],
+            )
+
+    def gather(self, name, dates, with_abolished = False):
+        """Return the values of a parameter at each of the given dates, as a float64 array.
+
+        The value is NaN before the first change point and when the parameter is abolished. When with_abolished is
+        true, also return the boolean array of abolished flags.
+        """
+        start, stop = self.get_bounds(name)
+        dates = np.asarray(dates, dtype = 'datetime64[D]')
+        positions = np.searchsorted(self.dates[start:stop], dates, side = 'right') - 1
+        known = positions >= 0
+        positions = np.where(known, positions, 0) + start
+        if start == stop:
+            values = np.full(dates.shape, np.nan)
+            abolished = np.zeros(dates.shape, dtype = np.bool_)
+        else:
+            values = np.where(known, self.values[positions], np.nan)
+            abolished = known & self.abolished[positions]
+        if with_abolished:
+            return values, abolished
+        return values
+
+    def gather_many(self, names, dates, with_abolished = False):
+        """Return the values of several parameters at each of the given dates, as a (names, dates) float64 array.
+
+        See gather for the values and the with_abolished flag.
+        """
+        dates = np.asarray(dates, dtype = 'datetime64[D]')
+        values = np.empty((len(names), len(dates)), dtype = np.float64)
+        abolished = np.empty((len(names), len(dates)), dtype = np.bool_)
+        for index, name in enumerate(names):
+            values[index], abolished[index] = self.gather(name, dates, with_abolished = True)
+        if with_abolished:
+            return values, abolished
+        return values
+
+    def get(self, name, date):
+        """Return the value of a parameter at a date: a float, u'-' when abolished or None when unknown."""
+        start, stop = self.get_bounds(name)
+        position = int(np.searchsorted(self.dates[start:stop], to_datetime64(date), side = 'right')) - 1
+        if position < 0:
+            return None
+        if self.abolished[start + position]:
+            return abolished_value
+        return float(self.values[start + position])
+
+    def get_bounds(self, name):
+        index = self.index_by_name[name]
+        return int(self.offsets[index]), int(self.offsets[index + 1])
+
+    def get_change_points(self, name):
+        """Return the (dates, values, abolished) arrays of a parameter."""
+        start, stop = self.get_bounds(name)
+        return self.dates[start:stop], self.values[start:stop], self.abolished[start:stop]
+
+    def get_digest(self, name):
+        """Return a digest of the change points and of the unit of a parameter, to compare it across stores."""
+        start, stop = self.get_bounds(name)
+        digest = hashlib.sha1(json.dumps(self.get_unit(name)))
+        digest.update(np.ascontiguousarray(self.dates[start:stop], dtype = 'datetime64[D]').tobytes())
+        # Abolished change points have a NaN value, so hash them as 0.
+        digest.update(np.where(self.abolished[start:stop], 0, self.values[start:stop]).astype(np.float64).tobytes())
+        digest.update(np.ascontiguousarray(self.abolished[start:stop], dtype = np.bool_).tobytes())
+        return digest.digest()
+
+    def get_unit(self, name):
+        return self.units[self.index_by_name[name]]
+
+    @classmethod
+    def load(cls, dir, mmap_mode = 'r'):
+        with io.open(os.path.join(dir, u'metadata.json'), encoding = 'utf-8') as metadata_file:
+            metadata = json.load(metadata_file)
+        arrays = dict(
+            (array_name, np.load(os.path.join(dir, u'{}.npy'.format(array_name)), mmap_mode = mmap_mode))
+            for array_name in ('abolished', 'dates', 'offsets', 'values')
+            )
+        return cls(metadata['names'], units = metadata['units'], **arrays)
+
+    def save(self, dir):
+        if not os.path.isdir(dir):
+            os.makedirs(dir)
+        for array_name in ('abolished', 'dates', 'offsets', 'values'):
+            np.save(os.path.join(dir, u'{}.npy'.format(array_name)), getattr(self, array_name))
+        with io.open(os.path.join(dir, u'metadata.json'), 'w', encoding = 'utf-8') as metadata_file:
+            metadata_file.write(unicode(json.dumps(
+                dict(names = self.names, units = self.units),
+                ensure_ascii = False,
+                indent = 2,
+                )))
+
+
+def iter_change_points(vector):
+    """Iterate over the (date, value, abolished) change points of a pd.Series of the parser.
+
+    Missing values are skipped, as they continue the previous value, and so are repeated values. For duplicate
+    dates, the last value wins.
+    """
+    value_by_date = {}
+    for date, value in vector.iteritems():
+        value_by_date[date] = value
+    previous = None
+    for date in sorted(value_by_date):
+        value = value_by_date[date]
+        if value is None or value == u'nc' or isinstance(value, float) and math.isnan(value):
+            continue
+        if value == abolished_value:
+            change_point = (np.nan, True)
+        else:
+            change_point = (float(value), False)
+        if change_point != previous:
+            yield (date, ) + change_point
+            previous = change_point
+
+
+def to_datetime64(date):
+    """Convert a date (datetime.date, numpy.datetime64 or ISO 8601 string like 2012-01 or 2012-01-15) to a day."""
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    return np.datetime64(date).astype('datetime64[D]')
@@ -26,7 +26,8 @@
 
 """Extract parameters from IPP's tax benefit tables. 
 
-Note: Currently this script requires an XLS version of the tables. XLSX file must be converted to XLS before use.
+Note: The XLS version of a table is used when it exists. Otherwise its XLSX version is read by xlsx_reader, without
+conversion.
 
 IPP = Institut des politiques publiques
 http://www.ipp.eu/en/tools/ipp-tax-and-benefit-tables/
@@ -36,22 +37,76 @@ http://www.ipp.eu/fr/outils/baremes-ipp/
 
 import argparse
 import collections
+import cPickle as pickle
+import cProfile
 import datetime
+import hashlib
+import io
 import logging
+import multiprocessing
 import os
 import re
+import shutil
 import sys
+import tempfile
 
 from biryani1 import baseconv, custom_conv, datetimeconv, states
 from biryani1 import strings
-import numpy as np
 import pandas as pd
 import xlrd
 
+import columnar_output
+import merged_cells
+import metadata_store
+import ndjson_output
+import parameter_grid
+import parameter_store
+import profiling
+import python_output
+import release_diff
+import sheet_cache
+import validation
+import vintage_cube
+import xlsx_reader
+
 app_name = os.path.splitext(os.path.basename(__file__))[0]
+baremes = [
+    u'Prestations',
+    u'Chomage',
+    u'Impot Revenu',
+    u'prelevements sociaux',
+    u'Taxation indirecte',
+    u'Taxation du capital',
+    u'Taxes locales',
+    u'Marche du travail',
+    ]
 conv = custom_conv(baseconv, datetimeconv, states)
+date_or_year_by_cell = {}
+date_or_year_cache_max_size = 10000
 french_date_re = re.compile(ur'(?P<day>0?[1-9]|[12]\d|3[01])/(?P<month>0?[1-9]|1[0-2])/(?P<year>[12]\d{3})$')
+iso8601_date_re = re.compile(ur'(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})$')
+forbiden_sheets = {
+    u'Impot Revenu': (u'Barème IGR',),
+    u'prelevements sociaux': (u'Abréviations', u'ASSIETTE PU', u'AUBRYI',  u'AUBRYII'),
+    u'Taxation indirecte': (u'TVA par produit',),
+    }
 log = logging.getLogger(app_name)
+# Kind of a metadata column, by the first word of its slugified taxipp_name or label
+metadata_kind_by_word = {
+    u'commentaire': u'note',
+    u'commentaires': u'note',
+    u'jo': u'publication',
+    u'jorf': u'publication',
+    u'note': u'note',
+    u'notes': u'note',
+    u'parution': u'publication',
+    u'publication': u'publication',
+    u'ref': u'reference',
+    u'reference': u'reference',
+    u'references': u'reference',
+    u'remarque': u'note',
+    u'remarques': u'note',
+    }
 N_ = lambda message: message
 parameters = []
 year_re = re.compile(ur'[12]\d{3}$')
@@ -88,6 +143,44 @@ cell_to_date_or_year = conv.condition(
     )
 
 
+def fast_cell_to_date_or_year(value, state = None):
+    """Converter giving the same results as cell_to_date_or_year, much faster.
+
+    Years, french dates & ISO 8601 dates are parsed directly, giving an error for an invalid date like 31/02/2010 on
+    which the biryani converters raise. Other cells go through the biryani converters. Results are memoized in
+    date_or_year_by_cell, which is emptied when it reaches date_or_year_cache_max_size.
+    """
+    if value is None:
+        return None, None
+    key = (type(value), value)
+    result = date_or_year_by_cell.get(key)
+    if result is not None:
+        return result
+    result = None
+    if key[0] is int:
+        if 1914 <= value <= 2020:
+            result = datetime.date(value, 1, 1), None
+    elif isinstance(value, basestring):
+        if not value:
+            result = None, None
+        elif year_re.match(value) is not None:
+            result = datetime.date(int(value), 1, 1), None
+        else:
+            match = french_date_re.match(value) or iso8601_date_re.match(value)
+            if match is not None:
+                try:
+                    result = datetime.date(int(match.group('year')), int(match.group('month')),
+                        int(match.group('day'))), None
+                except ValueError:
+                    result = value, (state or conv.default_state)._(u'Invalid date')
+    if result is None:
+        result = cell_to_date_or_year(value, state = state or conv.default_state)
+    if len(date_or_year_by_cell) >= date_or_year_cache_max_size:
+        date_or_year_by_cell.clear()
+    date_or_year_by_cell[key] = result
+    return result
+
+
 currency_converter = conv.first_match(
     conv.pipe(
         conv.test_isinstance(basestring),
@@ -146,178 +239,335 @@ pss_converters = collections.OrderedDict((
     ))
 
 
-def get_unmerged_cell_coordinates(row_index, column_index, merged_cells_tree):
-    unmerged_cell_coordinates = merged_cells_tree.get(row_index, {}).get(column_index)
-    if unmerged_cell_coordinates is None:
-        return row_index, column_index
-    return unmerged_cell_coordinates
+def build_number_format_by_xf_index(book):
+    """Classify once per workbook the number format of each XF record.
+
+    Return a list, indexed by XF index, of (format_str, unit) couples. See classify_number_format for the units.
+    """
+    if isinstance(book, xlsx_reader.XlsxWorkbook):
+        format_strs = book.format_str_by_xf_index
+    else:
+        format_strs = [
+            book.format_map[xf.format_key].format_str  # This is the "number format string".
+            for xf in book.xf_list
+            ]
+    return [
+        (format_str, classify_number_format(format_str))
+        for format_str in format_strs
+        ]
 
 
-def main(path, date, option = 'all_months', month = 1):
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-d', '--dir', default = path + date, help = 'path of IPP XLS directory')
-    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
-    args = parser.parse_args()
-    #args.dir = path
-    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+def build_parameter_store(dir, bareme, cache_dir = None, use_saved_store = False):
+    """Parse the workbook of a bareme in a release directory into a ParameterStore, empty when it is missing.
 
-    forbiden_sheets = {
-        u'Impot Revenu': (u'Barème IGR',),
-        u'prelevements sociaux': (u'Abréviations', u'ASSIETTE PU', u'AUBRYI',  u'AUBRYII'),
-        u'Taxation indirecte': (u'TVA par produit',),
-        }
-    baremes = [u'Prestations', u'Chomage', u'Impot Revenu', u'prelevements sociaux', u'Taxation indirecte', u'Taxation du capital', u'Taxes locales', u'Marche du travail']
+    When use_saved_store is true and the directory has the <bareme>-store directory saved by --store, load it instead.
+    """
+    store_dir = os.path.join(dir, bareme + u'-store')
+    if use_saved_store and os.path.isdir(store_dir):
+        return parameter_store.ParameterStore.load(store_dir)
+    xls_path = find_workbook_path(dir, bareme)
+    if not os.path.exists(xls_path):
+        log.warning(u'No workbook for {} in {}'.format(bareme, dir))
+        return parameter_store.ParameterStore.from_vectors({})
+    vector_by_taxipp_name, unit_by_taxipp_name = merge_sheets_vectors(parse_workbook_sheets(xls_path, bareme,
+        list_sheet_names(xls_path, bareme), cache_dir = cache_dir))
+    return parameter_store.ParameterStore.from_vectors(vector_by_taxipp_name, unit_by_taxipp_name)
+
+
+def build_sheet_metadata(bareme, taxipp_names_row, labels_rows, values_rows, notes_rows, descriptions_rows,
+        vectors):
+    """Extract the metadata of the parameters of a sheet, whose vectors are given by build_sheet_vectors.
+
+    Return the (description, parameters) couple expected by metadata_store.MetadataStore.from_sheets.
+
+    The legal reference, the JO publication date and the note of a change point are read in the row of the change,
+    in the nearest column of each kind at the right of the parameter, else at its left. The kind of a column is given
+    by its taxipp_name or its labels (e.g. "ref_leg", "Références législatives", "Parution au JORF", "Notes").
+    """
+    column_indexes_by_kind = {}
+    for column_index, taxipp_name in enumerate(taxipp_names_row):
+        if is_parameter_name(taxipp_name):
+            continue
+        for cell in [taxipp_name] + [row[column_index] for row in labels_rows]:
+            if isinstance(cell, basestring):
+                kind = metadata_kind_by_word.get(strings.slugify(cell).split(u'-')[0])
+                if kind is not None:
+                    column_indexes_by_kind.setdefault(kind, []).append(column_index)
+                    break
+    dates = build_values_dates(bareme, values_rows)
+    # Like iter_change_points, keep the last row of a date.
+    row_index_by_date = dict(
+        (date, row_index)
+        for row_index, date in enumerate(dates)
+        )
+    parameters = []
+    parameter_column_indexes = [
+        column_index
+        for column_index, taxipp_name in enumerate(taxipp_names_row)
+        if is_parameter_name(taxipp_name)
+        ]
+    for column_index, (taxipp_name, vector, unit) in zip(parameter_column_indexes, vectors):
+        metadata_column_indexes = []
+        for kind in (u'reference', u'publication', u'note'):
+            column_indexes = column_indexes_by_kind.get(kind, [])
+            right_column_indexes = [
+                index
+                for index in column_indexes
+                if index > column_index
+                ]
+            metadata_column_indexes.append(right_column_indexes[0] if right_column_indexes
+                else column_indexes[-1] if column_indexes else None)
+        change_points = []
+        for date, value, abolished in parameter_store.iter_change_points(vector):
+            row = values_rows[row_index_by_date[date]]
+            reference, publication, note = (
+                to_metadata_text(row[metadata_column_index]) if metadata_column_index is not None else None
+                for metadata_column_index in metadata_column_indexes
+                )
+            if publication is not None and (french_date_re.match(publication) or iso8601_date_re.match(publication)):
+                publication_date, error = fast_cell_to_date_or_year(publication)
+                if error is None:
+                    publication = publication_date.isoformat()
+                else:
+                    # Keep the text of an invalid date, like 31/02/2010.
+                    log.warning(u'Invalid JO date {} of {} in {} at {}: {}'.format(publication, taxipp_name, bareme,
+                        date, error))
+            change_points.append((date.isoformat(), reference, publication, note))
+        labels = []
+        for row in labels_rows:
+            label = to_metadata_text(row[column_index])
+            # Merged label cells are repeated in the rows below.
+            if label is not None and label not in labels:
+                labels.append(label)
+        parameters.append(dict(
+            change_points = change_points,
+            labels = labels,
+            name = taxipp_name,
+            notes = [
+                column_note
+                for column_note in (to_metadata_text(row[column_index]) for row in notes_rows)
+                if column_note is not None
+                ],
+            unit = unit,
+            ))
+    description_lines = []
+    for row in descriptions_rows:
+        for cell in row:
+            text = to_metadata_text(cell)
+            # Merged description cells are repeated in the columns & rows they span.
+            if text is not None and text not in description_lines:
+                description_lines.append(text)
+    return u'\n'.join(description_lines) or None, parameters
+
+
+def build_sheet_vectors(bareme, taxipp_names_row, values_rows, profile = None):
+    """Build the vector of each parameter of a sheet from its values rows.
+
+    Return the list of (taxipp_name, vector, unit) triples of the sheet, in column order.
+
+    The unit of a parameter is None, u'EUR' (FRF values being converted to EUR by transform_cell_value) or u'%'. When
+    the cells of a column have different units, the unit of the most recent one is kept. It is False when a cell of the
+    column has an unexpected number format.
+
+    When a profiling.Profile is given, count the FRF values converted to EUR.
+    """
+    dates = build_values_dates(bareme, values_rows)
+    vectors = []
+    for column_index, taxipp_name in enumerate(taxipp_names_row):
+        if is_parameter_name(taxipp_name):
+            vector = []
+            unit = None
+            for date, row in zip(dates, values_rows):
+                cell = row[column_index]
+                value, cell_unit = transform_cell_value(date, cell)
+                vector.append(value if not isinstance(value, basestring) or value == u'nc' else '-')
+                if cell_unit is not None and unit is not False:
+                    unit = cell_unit
+                    if profile is not None and cell[1] == u'FRF':
+                        profile.count('frf_conversions')
+            vectors.append((taxipp_name, pd.Series(vector, index = dates), unit))
+    return vectors
+
+
+def build_vintage_cubes(release_dirs, dir, cache_dir = None):
+    """Save the vintage_cube.VintageCube of each bareme in a list of release directories, in <bareme>-vintages.
+
+    The store of a bareme in a release is its saved <bareme>-store directory when there is one, else it is parsed.
+    """
     for bareme in baremes:
-        log.info(u'Parsing file {}'.format(bareme))
-        xls_path = os.path.join(args.dir.decode('utf-8'), u"Baremes IPP - {0}.xls".format(bareme))
-#       xls_path = os.path.join(path, u"Baremes IPP - {0}.xls".format(bareme))
-        book = xlrd.open_workbook(filename = xls_path, formatting_info = True)
-        sheet_names = [
-            sheet_name
-            for sheet_name in book.sheet_names()
-            if not sheet_name.startswith((u'Sommaire', u'Outline'))
-                and not sheet_name in forbiden_sheets.get(bareme, [])
-            ]
-        vector_by_taxipp_name = {}
-        for sheet_name in sheet_names:
-            log.info(u'  Parsing sheet {}'.format(sheet_name))
-            sheet = book.sheet_by_name(sheet_name)
-
-            # Extract coordinates of merged cells.
-            merged_cells_tree = {}
-            for row_low, row_high, column_low, column_high in sheet.merged_cells:
-                for row_index in range(row_low, row_high):
-                    cell_coordinates_by_merged_column_index = merged_cells_tree.setdefault(
-                        row_index, {})
-                    for column_index in range(column_low, column_high):
-                        cell_coordinates_by_merged_column_index[column_index] = (row_low, column_low)
-
-            descriptions_rows = []
-            labels_rows = []
-            notes_rows = []
-            state = 'taxipp_names'
-            taxipp_names_row = None
-            values_rows = []
-            for row_index in range(sheet.nrows):
-                ncols = len(sheet.row_values(row_index))
-                if state == 'taxipp_names':
-                    taxipp_names_row = [
-                        taxipp_name
-                        for taxipp_name in (
-                            transform_xls_cell_to_str(book, sheet, merged_cells_tree, row_index, column_index)
-                            for column_index in range(ncols)
-                            )
-                        ]
-                    state = 'labels'
-                    continue
-                if state == 'labels':
-                    first_cell_value = transform_xls_cell_to_json(book, sheet, merged_cells_tree, row_index, 0)
-                    date_or_year, error = conv.pipe(
-                        conv.test_isinstance((int, basestring)),
-                        cell_to_date_or_year,
-                        conv.not_none,
-                        )(first_cell_value, state = conv.default_state)
-                    if error is not None:
-                        # First cell of row is not a date => Assume it is a label.
-                        labels_rows.append([
-                            transform_xls_cell_to_str(book, sheet, merged_cells_tree, row_index, column_index)
-                            for column_index in range(ncols)
-                            ])
+        cube = vintage_cube.VintageCube.from_stores(collections.OrderedDict(
+            (get_release_name(release_dir), build_parameter_store(release_dir, bareme, cache_dir = cache_dir,
+                use_saved_store = True))
+            for release_dir in release_dirs
+            ))
+        cube.save(os.path.join(dir, bareme + u'-vintages'))
+        print u"Voilà, le cube de {} est créé : {} paramètres dans {} versions, {} vecteurs distincts !".format(
+            bareme, len(cube), len(cube.releases), len(cube.offsets) - 1)
+
+
+def build_values_dates(bareme, values_rows):
+    """Return the date of each values row of a sheet, as the first day of its month."""
+    return [
+        conv.check(fast_cell_to_date_or_year)(
+            row[1] if bareme == u'Impot Revenu' else row[0],
+            state = conv.default_state,
+            ).replace(day = 1)
+        for row in values_rows
+        ]
+
+
+def check_label_cell(cell):
+    """Return a cell of a labels row as a string: a label may be a number, like the years of birth of the columns of
+    sheet SAM of Retraite."""
+    if isinstance(cell, tuple):
+        # A number with a unit
+        cell = cell[0]
+    if isinstance(cell, (float, int)) and not isinstance(cell, bool):
+        return unicode(cell)
+    return check_str_cell(cell)
+
+
+def check_str_cell(cell):
+    assert cell is None or isinstance(cell, basestring), u'Expected a string. Got: {}'.format(cell).encode('utf-8')
+    return cell
+
+
+def classify_number_format(format_str):
+    """Return the unit of a number format string: None (plain number), u'EUR', u'FRF' or u'%'.
+
+    Return False when the format is unexpected.
+    """
+    if format_str in (
+            u'0',
+            u'General',
+            u'GENERAL',
+            u'_-* #,##0\ _€_-;\-* #,##0\ _€_-;_-* \-??\ _€_-;_-@_-',
+            ) or format_str.endswith(u'0.00'):
+        return None
+    if u'€' in format_str:
+        return u'EUR'
+    if u'FRF' in format_str or ur'\F\R\F' in format_str:
+        return u'FRF'
+    if format_str.endswith(u'%'):
+        return u'%'
+    return False
+
+
+def classify_sheet_rows(sheet_name, rows, profile = None):
+    """Split the rows of decoded cells of a sheet between the states of an IPP sheet.
+
+    Return the (taxipp_names_row, labels_rows, values_rows, notes_rows, descriptions_rows) tuple.
+
+    When a profiling.Profile is given, record the time spent in each state and count the first cells that are not
+    dates.
+    """
+    descriptions_rows = []
+    labels_rows = []
+    notes_rows = []
+    state = 'taxipp_names'
+    state_start = profiling.timer() if profile is not None else None
+    taxipp_names_row = None
+    values_rows = []
+    for row_index, row in enumerate(rows):
+        if state == 'taxipp_names':
+            taxipp_names_row = [check_str_cell(cell) for cell in row]
+            if profile is not None:
+                state_start = profile.add_time(state, state_start)
+            state = 'labels'
+            continue
+        if state == 'labels':
+            first_cell_value = row[0]
+            if isinstance(first_cell_value, (int, basestring)):
+                date_or_year, error = fast_cell_to_date_or_year(first_cell_value)
+            else:
+                date_or_year, error = None, None
+            if error is not None or date_or_year is None:
+                # First cell of row is not a date => Assume it is a label.
+                if profile is not None and error is not None:
+                    profile.count('date_conversion_failures')
+                labels_rows.append([check_label_cell(cell) for cell in row])
+                continue
+            if profile is not None:
+                state_start = profile.add_time(state, state_start)
+            state = 'values'
+        if state == 'values':
+            first_cell_value = row[0]
+            if first_cell_value is None or isinstance(first_cell_value, (int, basestring)):
+                date_or_year, error = fast_cell_to_date_or_year(first_cell_value)
+                if error is None:
+                    # First cell of row is a valid date or year.
+                    values_row = row
+                    if date_or_year is not None:
+                        # Out-of-range years are reported by validation.validate_sheets.
+                        values_rows.append(values_row)
                         continue
-                    state = 'values'
-                if state == 'values':
-                    first_cell_value = transform_xls_cell_to_json(book, sheet, merged_cells_tree, row_index, 0)
-                    if first_cell_value is None or isinstance(first_cell_value, (int, basestring)):
-                        date_or_year, error = cell_to_date_or_year(first_cell_value, state = conv.default_state)
-                        if error is None:
-                            # First cell of row is a valid date or year.
-                            values_row = [
-                                transform_xls_cell_to_json(book, sheet, merged_cells_tree, row_index, column_index)
-                                for column_index in range(ncols)
-                                ]
-                            if date_or_year is not None:
-                                assert date_or_year.year < 2601, 'Invalid date {} in {} at row {}'.format(date_or_year,
-                                    sheet_name, row_index + 1)
-                                values_rows.append(values_row)
-                                continue
-                            if all(value in (None, u'') for value in values_row):
-                                # If first cell is empty and all other cells in line are also empty, ignore this line.
-                                continue
-                            # First cell has no date and other cells in row are not empty => Assume it is a note.
-                    state = 'notes'
-                if state == 'notes':
-                    first_cell_value = transform_xls_cell_to_json(book, sheet, merged_cells_tree, row_index, 0)
-                    if isinstance(first_cell_value, basestring) and first_cell_value.strip().lower() == 'notes':
-                        notes_rows.append([
-                            transform_xls_cell_to_str(book, sheet, merged_cells_tree, row_index, column_index)
-                            for column_index in range(ncols)
-                            ])
+                    if all(value in (None, u'') for value in values_row):
+                        # If first cell is empty and all other cells in line are also empty, ignore this line.
                         continue
-                    state = 'description'
-                assert state == 'description'
-                descriptions_rows.append([
-                    transform_xls_cell_to_str(book, sheet, merged_cells_tree, row_index, column_index)
-                    for column_index in range(ncols)
-                    ])
-
-            dates = [
-                conv.check(cell_to_date_or_year)(
-                    row[1] if bareme == u'Impot Revenu' else row[0],
-                    state = conv.default_state,
-                    ).replace(day = 1)
-                for row in values_rows
-                ]
-            for column_index, taxipp_name in enumerate(taxipp_names_row):
-                if taxipp_name and strings.slugify(taxipp_name) not in ('date', 'date-ir', 'date-rev', 'note', 'ref-leg', 'notes') :
-                    vector = [
-                        transform_cell_value(date, row[column_index])
-                        for date, row in zip(dates, values_rows)
-                        ]
-                    vector = [
-                        cell if not isinstance(cell, basestring) or cell == u'nc' else '-'
-                        for cell in vector
-                        ]
-                    vector_by_taxipp_name[taxipp_name] = pd.Series(vector, index = dates)
-        monthstime = [
-                datetime.datetime(y, m, 1,0,0,0)
-                for y in range(1914, 2021)
-                for m in range(1, 13)
-                ]
-        data_frame = pd.DataFrame(index = monthstime)
-        for taxipp_name, vector in vector_by_taxipp_name.iteritems():
-            data_frame[taxipp_name] = np.nan
-            data_frame.loc[vector.index.values, taxipp_name] = vector.values
-        data_frame.replace(u'nc', np.nan, inplace=True)
-        data_frame.fillna(method = 'pad', inplace = True)
-        data_frame.dropna(axis = 0, how = 'all', inplace = True)
-        if option == 'mean_by_year':
-            data_frame.replace('-', 0, inplace=True)
-            data_frame = data_frame.resample('AS', how='mean')
-        if option == 'which_month_in_year':
-            print month
-            data_frame =  data_frame.iloc[data_frame.index.month == month]
-        data_frame.to_csv(args.dir + "/"  + bareme + '.csv', encoding = 'utf-8')
-        print u"Voilà, la table agrégée de {} est créée !".format(bareme)
+                    # First cell has no date and other cells in row are not empty => Assume it is a note.
+                elif profile is not None:
+                    profile.count('date_conversion_failures')
+            if profile is not None:
+                state_start = profile.add_time(state, state_start)
+            state = 'notes'
+        if state == 'notes':
+            first_cell_value = row[0]
+            if isinstance(first_cell_value, basestring) and first_cell_value.strip().lower() == 'notes':
+                notes_rows.append([check_str_cell(cell) for cell in row])
+                continue
+            if profile is not None:
+                state_start = profile.add_time(state, state_start)
+            state = 'description'
+        assert state == 'description'
+        descriptions_rows.append([check_str_cell(cell) for cell in row])
+    if profile is not None:
+        profile.add_time(state, state_start)
 
-    return 0
+    return taxipp_names_row, labels_rows, values_rows, notes_rows, descriptions_rows
 
 
-def transform_cell_value(date, cell_value):
-    if isinstance(cell_value, tuple):
-        value, currency = cell_value
-        if currency == u'FRF':
-            if date < datetime.date(1960, 1, 1):
-                return round(value / (100 * 6.55957), 2)
-            return round(value / 6.55957, 2)
-        return value
-    return cell_value
+def compact_vector(vector):
+    """Return a vector of the change points of a vector only, which gives the same ParameterStore."""
+    change_points = list(parameter_store.iter_change_points(vector))
+    return pd.Series(
+        [
+            parameter_store.abolished_value if abolished else value
+            for date, value, abolished in change_points
+            ],
+        index = [date for date, value, abolished in change_points],
+        dtype = object,
+        )
+
+
+def decode_sheet(book, sheet_name, number_format_by_xf_index, profile = None):
+    """Return the matrix of the cells of a sheet converted to JSON, for a xlrd book or a xlsx_reader.XlsxWorkbook.
+
+    When a profiling.Profile is given, count the decoded cells and the merged cells that took the value of another.
+    """
+    if isinstance(book, xlsx_reader.XlsxWorkbook):
+        rows = decode_xlsx_sheet(book, sheet_name, number_format_by_xf_index)
+        merged_ranges = book.merged_cells_by_sheet_name[sheet_name]
+    else:
+        sheet = book.sheet_by_name(sheet_name)
+        rows = decode_xls_sheet(book, sheet, merged_cells.MergedCellsIndex(sheet.merged_cells),
+            number_format_by_xf_index)
+        merged_ranges = sheet.merged_cells
+    if profile is not None:
+        profile.count('cells_decoded', sum(len(row) for row in rows))
+        profile.count('merged_cells_expanded', sum(
+            (row_high - row_low) * (column_high - column_low) - 1
+            for row_low, row_high, column_low, column_high in merged_ranges
+            ))
+    return rows
 
 
-def transform_xls_cell_to_json(book, sheet, merged_cells_tree, row_index, column_index):
-    """Convert an XLS cell (type & value) to an unicode string.
+def decode_xls_cell(book, type, value, number_format = None):
+    """Convert an XLS cell (type & value) to JSON.
 
     Code taken from http://code.activestate.com/recipes/546518-simple-conversion-of-excel-files-into-csv-and-yaml/
 
+    number_format is the (format_str, unit) couple of the cell, required for NUMBER cells only.
+
     Type Codes:
     EMPTY   0
     TEXT    1 a Unicode string
@@ -326,14 +576,6 @@ def transform_xls_cell_to_json(book, sheet, merged_cells_tree, row_index, column
     BOOLEAN 4 int; 1 means TRUE, 0 means FALSE
     ERROR   5
     """
-    unmerged_cell_coordinates = merged_cells_tree.get(row_index, {}).get(column_index)
-    if unmerged_cell_coordinates is None:
-        unmerged_row_index = row_index
-        unmerged_column_index = column_index
-    else:
-        unmerged_row_index, unmerged_column_index = unmerged_cell_coordinates
-    type = sheet.row_types(unmerged_row_index)[unmerged_column_index]
-    value = sheet.row_values(unmerged_row_index)[unmerged_column_index]
     if type == 0:
         value = None
     elif type == 1:
@@ -344,27 +586,19 @@ def transform_xls_cell_to_json(book, sheet, merged_cells_tree, row_index, column
         value_int = int(value)
         if value_int == value:
             value = value_int
-        xf_index = sheet.cell_xf_index(row_index, column_index)
-        xf = book.xf_list[xf_index]  # Get an XF object.
-        format_key = xf.format_key
-        format = book.format_map[format_key]  # Get a Format object.
-        format_str = format.format_str  # This is the "number format string".
-        if format_str in (
-                u'0',
-                u'General',
-                u'GENERAL',
-                u'_-* #,##0\ _€_-;\-* #,##0\ _€_-;_-* \-??\ _€_-;_-@_-',
-                ) or format_str.endswith(u'0.00'):
+        format_str, unit = number_format
+        if unit is None:
             return value
-        if u'€' in format_str:
-            return (value, u'EUR')
-        if u'FRF' in format_str or ur'\F\R\F' in format_str:
-            return (value, u'FRF')
-        assert format_str.endswith(u'%'), 'Unexpected format "{}" for value: {}'.format(format_str, value)
-        return (value, u'%')
+        # An unexpected format (unit False) is kept, to be reported by validation.validate_sheets.
+        return (value, unit)
     elif type == 3:
         # DATE
-        y, m, d, hh, mm, ss = xlrd.xldate_as_tuple(value, book.datemode)
+        try:
+            y, m, d, hh, mm, ss = xlrd.xldate_as_tuple(value, book.datemode)
+        except xlrd.xldate.XLDateAmbiguous:
+            # A date before 1900-03-01, like 17 in a labels row of sheet Decote_RG of Retraite, is ambiguous because
+            # of the 1900 leap year bug of Excel: read it as Excel shows it.
+            y, m, d, hh, mm, ss = xlrd.xldate.xldate_as_datetime(value, book.datemode).timetuple()[:6]
         date = u'{0:04d}-{1:02d}-{2:02d}'.format(y, m, d) if any(n != 0 for n in (y, m, d)) else None
         value = u'T'.join(
             fragment
@@ -384,10 +618,705 @@ def transform_xls_cell_to_json(book, sheet, merged_cells_tree, row_index, column
     return value
 
 
-def transform_xls_cell_to_str(book, sheet, merged_cells_tree, row_index, column_index):
-    cell = transform_xls_cell_to_json(book, sheet, merged_cells_tree, row_index, column_index)
-    assert cell is None or isinstance(cell, basestring), u'Expected a string. Got: {}'.format(cell).encode('utf-8')
-    return cell
+def decode_xls_sheet(book, sheet, merged_cells_index, number_format_by_xf_index):
+    """Read a whole XLS sheet once and return the matrix (a list of rows) of its cells converted to JSON.
+
+    Merged cells are resolved to the type & value of their top-left cell, but keep their own number format.
+    """
+    types_by_row_index = [sheet.row_types(row_index) for row_index in range(sheet.nrows)]
+    values_by_row_index = [sheet.row_values(row_index) for row_index in range(sheet.nrows)]
+    rows = []
+    for row_index, (row_types, row_values) in enumerate(zip(types_by_row_index, values_by_row_index)):
+        intervals = merged_cells_index.get_row_intervals(row_index)
+        if intervals:
+            row_types = list(row_types)
+            row_values = list(row_values)
+            for column_low, column_high, anchor_row_index in intervals:
+                anchor_type = types_by_row_index[anchor_row_index][column_low]
+                anchor_value = values_by_row_index[anchor_row_index][column_low]
+                for column_index in range(column_low, min(column_high, len(row_values))):
+                    row_types[column_index] = anchor_type
+                    row_values[column_index] = anchor_value
+        row = []
+        for column_index, (type, value) in enumerate(zip(row_types, row_values)):
+            number_format = None
+            if type == 2:
+                number_format = number_format_by_xf_index[sheet.cell_xf_index(row_index, column_index)]
+            row.append(decode_xls_cell(book, type, value, number_format = number_format))
+        rows.append(row)
+    return rows
+
+
+def decode_xlsx_sheet(workbook, sheet_name, number_format_by_xf_index):
+    """Stream a sheet of a XLSX workbook and return the matrix (a list of rows) of its cells converted to JSON.
+
+    Cells are converted like those of XLS sheets, by decode_xls_cell.
+    """
+    return [
+        [
+            decode_xls_cell(workbook, type, value,
+                number_format = number_format_by_xf_index[xf_index] if type == 2 else None)
+            for type, value, xf_index in row
+            ]
+        for row in workbook.iter_sheet_rows(sheet_name)
+        ]
+
+
+def diff_releases(old_dir, new_dir, cache_dir = None, use_saved_stores = False):
+    """Print the parameters of each bareme that are added, removed or modified from a release to another one.
+
+    Each line gives the bareme, the status, the taxipp_name and, for a modified parameter, the first date when its
+    values differ, separated by tabs. See build_parameter_store for use_saved_stores.
+    """
+    counts = collections.Counter()
+    for bareme in baremes:
+        differences = release_diff.diff_stores(
+            build_parameter_store(old_dir, bareme, cache_dir = cache_dir, use_saved_store = use_saved_stores),
+            build_parameter_store(new_dir, bareme, cache_dir = cache_dir, use_saved_store = use_saved_stores),
+            )
+        for taxipp_name, status, first_date in differences:
+            counts[status] += 1
+            sys.stdout.write(u'\t'.join((bareme, status, taxipp_name,
+                u'' if first_date is None else unicode(first_date))).encode('utf-8') + '\n')
+    log.info(u'{} parameters changed: {}'.format(sum(counts.itervalues()), u', '.join(
+        u'{} {}'.format(counts[status], status)
+        for status in release_diff.statuses
+        )))
+
+
+def find_workbook_path(dir, bareme):
+    """Return the path of the workbook of a bareme: its XLS version when it exists, else its XLSX version.
+
+    Workbook file names are matched without accents, e.g. "Barèmes IPP - Chômage.xlsx" for bareme "Chomage".
+    """
+    xls_path = os.path.join(dir, u"Baremes IPP - {0}.xls".format(bareme))
+    if os.path.exists(xls_path):
+        return xls_path
+    slug = strings.slugify(u"Baremes IPP - {0}".format(bareme))
+    for file_name in sorted(os.listdir(dir)):
+        name, extension = os.path.splitext(file_name)
+        if extension.lower() == u'.xlsx' and strings.slugify(name) == slug:
+            return os.path.join(dir, file_name)
+    # Let open_workbook report the missing XLS file.
+    return xls_path
+
+
+def get_release_name(release_dir):
+    """Return the name of a release: the name of its directory."""
+    return os.path.basename(os.path.normpath(release_dir))
+
+
+def get_unmerged_cell_coordinates(row_index, column_index, merged_cells_index):
+    unmerged_cell_coordinates = merged_cells_index.get_anchor(row_index, column_index)
+    if unmerged_cell_coordinates is None:
+        return row_index, column_index
+    return unmerged_cell_coordinates
+
+
+def hash_xls_sheet(sheet, number_format_by_xf_index):
+    """Hash the raw content of an XLS sheet: cell types, values & units and merged cells."""
+    sheet_hash = hashlib.sha1(repr(sorted(sheet.merged_cells)))
+    for row_index in range(sheet.nrows):
+        row_types = sheet.row_types(row_index)
+        sheet_hash.update(repr((
+            row_types,
+            sheet.row_values(row_index),
+            [
+                number_format_by_xf_index[sheet.cell_xf_index(row_index, column_index)][1]
+                for column_index, type in enumerate(row_types)
+                if type == 2
+                ],
+            )))
+    return sheet_hash.hexdigest()
+
+
+def is_parameter_name(taxipp_name):
+    """Tell whether the taxipp_name of a column is a parameter, not a date, reference or notes column."""
+    return bool(taxipp_name) and strings.slugify(taxipp_name) not in ('date', 'date-ir', 'date-rev', 'note', 'ref-leg',
+        'notes')
+
+
+def is_xlsx_path(xls_path):
+    return xls_path.lower().endswith(u'.xlsx')
+
+
+def iter_sheets_metadata(xls_path, bareme, sheet_names):
+    """Open an IPP workbook and yield the (bareme, sheet_name, description, parameters) metadata of some sheets.
+
+    See build_sheet_metadata. The sheet cache only holds vectors, so every sheet is decoded.
+    """
+    book = open_workbook(xls_path)
+    number_format_by_xf_index = build_number_format_by_xf_index(book)
+    for sheet_name in sheet_names:
+        log.info(u'  Extracting metadata of sheet {}'.format(sheet_name))
+        taxipp_names_row, labels_rows, values_rows, notes_rows, descriptions_rows = classify_sheet_rows(sheet_name,
+            decode_sheet(book, sheet_name, number_format_by_xf_index))
+        vectors = build_sheet_vectors(bareme, taxipp_names_row, values_rows)
+        description, parameters = build_sheet_metadata(bareme, taxipp_names_row, labels_rows, values_rows,
+            notes_rows, descriptions_rows, vectors)
+        yield bareme, sheet_name, description, parameters
+
+
+def iter_spilled_sheets(spill_dir, spilled_sheets):
+    """Yield the (sheet_name, vectors) couples of the sheets spilled by spill_workbook_sheets, one sheet at a time."""
+    for sheet_index, (sheet_name, spilled_vectors) in enumerate(spilled_sheets):
+        with open(os.path.join(spill_dir, '{}.pickle'.format(sheet_index)), 'rb') as spill_file:
+            yield sheet_name, unserialize_vectors(pickle.load(spill_file))
+
+
+def iter_spilled_vectors(spill_dir, spilled_sheets, spilled_vector_by_taxipp_name):
+    """Yield the (taxipp_name, vector) couples kept by merge_sheets_vectors, loading one spilled sheet at a time."""
+    for sheet_index, (sheet_name, vectors) in enumerate(iter_spilled_sheets(spill_dir, spilled_sheets)):
+        for vector_index, (taxipp_name, vector, unit) in enumerate(vectors):
+            if spilled_vector_by_taxipp_name[taxipp_name][:2] == (sheet_index, vector_index):
+                yield taxipp_name, vector
+
+
+def iter_workbook_sheets(xls_path, bareme, sheet_names, cache_dir = None):
+    """Open an IPP workbook and yield the (sheet_name, vectors) couple of each of some sheets, once it is parsed.
+
+    Unlike parse_workbook_sheets, the vectors of the previous sheets are not kept, so the workbook isn't cached as a
+    whole: only its sheets are, when cache_dir is given. The workbook is released when the iteration ends or is
+    stopped.
+    """
+    cache = None if cache_dir is None else sheet_cache.SheetCache(cache_dir)
+    book = open_workbook(xls_path)
+    try:
+        number_format_by_xf_index = build_number_format_by_xf_index(book)
+        for sheet_name in sheet_names:
+            yield sheet_name, load_sheet_vectors(book, xls_path, bareme, sheet_name, number_format_by_xf_index,
+                cache = cache)
+    finally:
+        if is_xlsx_path(xls_path):
+            book.close()
+        else:
+            book.release_resources()
+
+
+def list_sheet_names(xls_path, bareme):
+    """Return the names of the sheets of a workbook that hold parameters."""
+    if is_xlsx_path(xls_path):
+        book = xlsx_reader.XlsxWorkbook(xls_path)
+    else:
+        book = xlrd.open_workbook(filename = xls_path, on_demand = True)
+    sheet_names = [
+        sheet_name
+        for sheet_name in book.sheet_names()
+        if not sheet_name.startswith((u'Sommaire', u'Outline'))
+            and not sheet_name in forbiden_sheets.get(bareme, [])
+        ]
+    if is_xlsx_path(xls_path):
+        book.close()
+    else:
+        book.release_resources()
+    return sheet_names
+
+
+def load_sheet_vectors(book, xls_path, bareme, sheet_name, number_format_by_xf_index, cache = None,
+        profile = None):
+    """Parse a sheet of a workbook, or load its vectors from a sheet_cache.SheetCache when the sheet is unchanged.
+
+    When a profiling.Profile is given, the time spent reading and writing the cache is recorded in it too.
+    """
+    if cache is None:
+        return parse_sheet(book, bareme, sheet_name, number_format_by_xf_index, profile = profile)
+    start = profiling.timer()
+    sheet_key = sheet_cache.make_key('sheet', bareme, book.datemode,
+        book.get_sheet_fingerprint(sheet_name) if is_xlsx_path(xls_path)
+            else hash_xls_sheet(book.sheet_by_name(sheet_name), number_format_by_xf_index))
+    serialized_vectors = cache.get(sheet_key)
+    if profile is not None:
+        start = profile.add_time('cache', start)
+    if serialized_vectors is None:
+        vectors = parse_sheet(book, bareme, sheet_name, number_format_by_xf_index, profile = profile)
+        cache.set(sheet_key, serialize_vectors(vectors))
+        return vectors
+    log.info(u'  Loaded sheet {} from cache'.format(sheet_name))
+    vectors = unserialize_vectors(serialized_vectors)
+    if profile is not None:
+        profile.add_time('cache', start)
+    return vectors
+
+
+def main(path, date, option = 'all_months', month = 1, argv = None):
+    """Parse the IPP workbooks and write their aggregated tables, with the command line arguments, or argv."""
+    parser = argparse.ArgumentParser()
+    mode_group = parser.add_mutually_exclusive_group()
+    parser.add_argument('--cache-dir', default = sheet_cache.default_cache_dir(),
+        help = 'directory of the cache of parsed sheets')
+    parser.add_argument('--cache-max-age', default = 30, type = float,
+        help = 'remove cache entries unused since this number of days')
+    parser.add_argument('--cache-max-size', default = 500, type = float, help = 'maximum size of the cache, in MB')
+    parser.add_argument('--cprofile', help = 'save cProfile statistics of the run (of the main process only) in this '
+        'file')
+    parser.add_argument('--cube', action = 'store_true', default = False,
+        help = 'instead of the option of main(), write every aggregate table of each bareme, <bareme>-<aggregate>: '
+        'monthly, quarterly & annual mean, first, last, min & max, and reference months')
+    parser.add_argument('-d', '--dir', default = path + date, help = 'path of IPP XLS directory')
+    mode_group.add_argument('--diff', help = 'only list the parameters changed since the release in this directory, '
+        'without building the tables')
+    parser.add_argument('--end-year', default = 2020, type = int,
+        help = 'extend the monthly tables at least until the end of this year (0 to stop at the last change)')
+    parser.add_argument('-f', '--output-format', choices = columnar_output.output_formats + ('csv',),
+        default = 'csv', help = 'format of the aggregated tables')
+    parser.add_argument('--issues', help = 'save the issues found by the validation of the parameters in this NDJSON '
+        'file')
+    parser.add_argument('--low-memory', action = 'store_true', default = False,
+        help = 'parse the sheets one at a time in the main process (ignoring --jobs), unloading each sheet and '
+        'spilling its vectors to a temporary directory before the next one, and print the peak resident memory')
+    mode_group.add_argument('--metadata', action = 'store_true', default = False,
+        help = 'only build the store of the labels, notes, descriptions, legal references & JO dates of the parameters '
+        'of every bareme, with its search index, in a metadata directory, without building the tables')
+    parser.add_argument('-j', '--jobs', default = 1, type = int,
+        help = 'number of worker processes parsing workbooks and sheets in parallel')
+    mode_group.add_argument('--ndjson', action = 'store_true', default = False,
+        help = 'only stream the changes of the parameters of each sheet, as soon as it is parsed, to <bareme>.ndjson, '
+        'without building the tables')
+    parser.add_argument('--no-cache', action = 'store_true', default = False,
+        help = 'parse every sheet, without reading or writing the cache')
+    parser.add_argument('--profile', help = 'save a JSON report of the time spent in each stage of each workbook '
+        'and sheet, with counters of decoded cells, merged cells, date conversion failures and FRF conversions')
+    parser.add_argument('--python', action = 'store_true', default = False,
+        help = 'also generate an importable Python package of the parameters of each bareme, named ipp_<bareme>')
+    parser.add_argument('--reference-months', metavar = 'MONTH', nargs = '+', type = int,
+        help = 'months (1 to 12) of the reference month tables of --cube, by default the month of main()')
+    parser.add_argument('-s', '--store', action = 'store_true', default = False,
+        help = 'also save the change points of the parameters of each bareme, in a <bareme>-store directory')
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    mode_group.add_argument('--vintages', metavar = 'RELEASE_DIR', nargs = '+', help = 'only build the cube of the '
+        'parameters of each bareme in these release directories, from the oldest one, in a <bareme>-vintages '
+        'directory; releases are named after their directories and their saved <bareme>-store directories are used')
+    args = parser.parse_args(argv)
+    #args.dir = path
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+
+    cache_dir = None if args.no_cache else args.cache_dir
+    if args.vintages is not None:
+        release_dirs = [release_dir.decode('utf-8') for release_dir in args.vintages]
+        if len(set(get_release_name(release_dir) for release_dir in release_dirs)) < len(release_dirs):
+            parser.error(u'release directories must have different names')
+    if args.cprofile is not None:
+        cprofiler = cProfile.Profile()
+        cprofiler.enable()
+    run_start = profiling.timer()
+    issues = []
+    workbook_profiles = []
+    try:
+        if args.diff is not None:
+            diff_releases(args.diff.decode('utf-8'), args.dir.decode('utf-8'), cache_dir = cache_dir)
+        elif args.vintages is not None:
+            build_vintage_cubes(release_dirs, args.dir.decode('utf-8'), cache_dir = cache_dir)
+        else:
+            xls_path_and_sheet_names_by_bareme = {}
+            for bareme in baremes:
+                xls_path = find_workbook_path(args.dir.decode('utf-8'), bareme)
+                xls_path_and_sheet_names_by_bareme[bareme] = (xls_path, list_sheet_names(xls_path, bareme))
+            if args.metadata:
+                store = write_metadata_store(args.dir.decode('utf-8'),
+                    xls_path_and_sheet_names_by_bareme = xls_path_and_sheet_names_by_bareme)
+                print u"Voilà, les métadonnées de {} paramètres sont écrites !".format(len(store))
+            elif args.ndjson:
+                for bareme in baremes:
+                    xls_path, sheet_names = xls_path_and_sheet_names_by_bareme[bareme]
+                    with io.open(os.path.join(args.dir, bareme + '.ndjson'), 'w', encoding = 'utf-8') as events_file:
+                        for sheet_name, vectors in iter_workbook_sheets(xls_path, bareme, sheet_names,
+                                cache_dir = cache_dir):
+                            count = ndjson_output.write_events(events_file, ndjson_output.iter_sheet_events(
+                                sheet_name, vectors))
+                            log.info(u'  Wrote {} events of sheet {}'.format(count, sheet_name))
+                    print u"Voilà, les changements de {} sont écrits !".format(bareme)
+            else:
+                write_tables(args, option, month, xls_path_and_sheet_names_by_bareme, cache_dir, issues,
+                    workbook_profiles)
+    finally:
+        # Whatever the mode, and even when it fails.
+        if args.cprofile is not None:
+            cprofiler.disable()
+            cprofiler.dump_stats(args.cprofile)
+        if args.profile is not None:
+            profiling.write_report(args.profile, workbook_profiles, profiling.timer() - run_start)
+        if cache_dir is not None:
+            sheet_cache.SheetCache(cache_dir).evict(max_size = args.cache_max_size * 1024 * 1024,
+                max_age = args.cache_max_age * 24 * 3600)
+    if args.issues is not None:
+        with io.open(args.issues, 'w', encoding = 'utf-8') as issues_file:
+            ndjson_output.write_events(issues_file, issues)
+
+    return 1 if any(issue['severity'] == 'error' for issue in issues) else 0
+
+
+def log_issues(bareme, issues):
+    """Log the validation issues of a bareme, each error and a count of the warnings, and return the number of errors.
+
+    Warnings are logged one by one at the info level, with --verbose.
+    """
+    errors_count = 0
+    for issue in issues:
+        text = validation.format_issue(issue)
+        if issue['severity'] == 'error':
+            errors_count += 1
+            log.error(text)
+        else:
+            log.info(text)
+    if len(issues) > errors_count:
+        log.warning(u'{} validation warnings in {}, listed with --verbose or --issues'.format(
+            len(issues) - errors_count, bareme))
+    return errors_count
+
+
+def merge_sheets_vectors(vectors_by_sheet_name):
+    """Merge the (taxipp_name, vector, unit) triples of the sheets of a workbook, in sheet & column order.
+
+    Return the vector_by_taxipp_name and unit_by_taxipp_name dicts.
+
+    The vector of the last occurrence of a taxipp_name found in several sheets is kept, the duplicates being reported by
+    validation.validate_sheets.
+    """
+    unit_by_taxipp_name = {}
+    vector_by_taxipp_name = {}
+    for sheet_name, vectors in vectors_by_sheet_name:
+        for taxipp_name, vector, unit in vectors:
+            unit_by_taxipp_name[taxipp_name] = unit
+            vector_by_taxipp_name[taxipp_name] = vector
+    return vector_by_taxipp_name, unit_by_taxipp_name
+
+
+def open_workbook(xls_path):
+    """Open a workbook for parsing: a xlrd book for a XLS file, a xlsx_reader.XlsxWorkbook for a XLSX file."""
+    if is_xlsx_path(xls_path):
+        return xlsx_reader.XlsxWorkbook(xls_path)
+    return xlrd.open_workbook(filename = xls_path, formatting_info = True, on_demand = True)
+
+
+def parse_sheet(book, bareme, sheet_name, number_format_by_xf_index, profile = None):
+    """Parse a sheet of an IPP workbook, either a xlrd book or a xlsx_reader.XlsxWorkbook.
+
+    Return the list of (taxipp_name, vector, unit) triples of the sheet, in column order.
+
+    When a profiling.Profile is given, record the time of each stage and the counters of the sheet in it.
+    """
+    log.info(u'  Parsing sheet {}'.format(sheet_name))
+    if profile is None:
+        return parse_sheet_rows(bareme, sheet_name, decode_sheet(book, sheet_name, number_format_by_xf_index))
+    with profile.stage('decoding'):
+        rows = decode_sheet(book, sheet_name, number_format_by_xf_index, profile = profile)
+    taxipp_names_row, labels_rows, values_rows, notes_rows, descriptions_rows = classify_sheet_rows(sheet_name, rows,
+        profile = profile)
+    with profile.stage('vectors'):
+        return build_sheet_vectors(bareme, taxipp_names_row, values_rows, profile = profile)
+
+
+def parse_sheet_rows(bareme, sheet_name, rows):
+    """Parse the rows of decoded cells of a sheet of an IPP workbook.
+
+    Return the list of (taxipp_name, vector, unit) triples of the sheet, in column order.
+    """
+    taxipp_names_row, labels_rows, values_rows, notes_rows, descriptions_rows = classify_sheet_rows(sheet_name, rows)
+    return build_sheet_vectors(bareme, taxipp_names_row, values_rows)
+
+
+def parse_workbook_sheets(xls_path, bareme, sheet_names, cache_dir = None, profile = False):
+    """Open an IPP workbook and parse some of its sheets.
+
+    Return the list of (sheet_name, vectors) couples, in the order of sheet_names. When profile is true, also return
+    the profiling.Profile of the workbook and of its sheets, converted to JSON.
+
+    When cache_dir is given, vectors are loaded from the cache when the workbook, or else the sheet, is unchanged.
+
+    This function is also the unit of work of the process pool, so it only takes picklable arguments.
+    """
+    workbook_profile = profiling.Profile() if profile else None
+    start = profiling.timer()
+    if cache_dir is None:
+        cache = None
+    else:
+        cache = sheet_cache.SheetCache(cache_dir)
+        workbook_key = sheet_cache.make_key('workbook', sheet_cache.hash_file(xls_path), bareme, sheet_names)
+        serialized_vectors_by_sheet_name = cache.get(workbook_key)
+        if serialized_vectors_by_sheet_name is not None:
+            log.info(u'  Loaded sheets of {} from cache'.format(bareme))
+            vectors_by_sheet_name = [
+                (sheet_name, unserialize_vectors(serialized_vectors))
+                for sheet_name, serialized_vectors in serialized_vectors_by_sheet_name
+                ]
+            if workbook_profile is None:
+                return vectors_by_sheet_name
+            workbook_profile.add_time('cache', start)
+            return vectors_by_sheet_name, workbook_profile.to_json()
+    book = open_workbook(xls_path)
+    number_format_by_xf_index = build_number_format_by_xf_index(book)
+    if workbook_profile is not None:
+        workbook_profile.add_time('open', start)
+    vectors_by_sheet_name = []
+    for sheet_name in sheet_names:
+        sheet_profile = None if workbook_profile is None else profiling.Profile(sheet = sheet_name)
+        vectors = load_sheet_vectors(book, xls_path, bareme, sheet_name, number_format_by_xf_index, cache = cache,
+            profile = sheet_profile)
+        vectors_by_sheet_name.append((sheet_name, vectors))
+        if sheet_profile is not None:
+            workbook_profile.children.append(sheet_profile.to_json())
+    if cache is not None:
+        start = profiling.timer()
+        cache.set(workbook_key, [
+            (sheet_name, serialize_vectors(sheet_vectors))
+            for sheet_name, sheet_vectors in vectors_by_sheet_name
+            ])
+        if workbook_profile is not None:
+            workbook_profile.add_time('cache', start)
+    if workbook_profile is None:
+        return vectors_by_sheet_name
+    return vectors_by_sheet_name, workbook_profile.to_json()
+
+
+def serialize_vectors(vectors):
+    """Convert the vectors of a sheet to (taxipp_name, dates, values, unit) tuples of plain lists."""
+    return [
+        (taxipp_name, list(vector.index), vector.tolist(), unit)
+        for taxipp_name, vector, unit in vectors
+        ]
+
+
+def unserialize_vectors(serialized_vectors):
+    return [
+        (taxipp_name, pd.Series(values, index = dates), unit)
+        for taxipp_name, dates, values, unit in serialized_vectors
+        ]
+
+
+def spill_workbook_sheets(xls_path, bareme, sheet_names, spill_dir, cache_dir = None, profile = None):
+    """Parse the sheets of an IPP workbook one at a time, writing the vectors of each one in spill_dir.
+
+    Each sheet is unloaded once parsed, and its vectors are saved as plain lists, so that the memory used doesn't
+    grow with the number of sheets. Return the (sheet_name, spilled_vectors) couples of the sheets, where the
+    spilled vectors are (taxipp_name, (sheet_index, vector_index, end_dates), unit) triples, standing for the vectors
+    in merge_sheets_vectors. end_dates are the dates of the vector that bound the grid.
+
+    When the profiling.Profile of the workbook is given, the profile of each sheet is added to it.
+    """
+    if not os.path.isdir(spill_dir):
+        os.makedirs(spill_dir)
+    cache = None if cache_dir is None else sheet_cache.SheetCache(cache_dir)
+    book = open_workbook(xls_path)
+    number_format_by_xf_index = build_number_format_by_xf_index(book)
+    spilled_sheets = []
+    for sheet_index, sheet_name in enumerate(sheet_names):
+        sheet_profile = None if profile is None else profiling.Profile(sheet = sheet_name)
+        vectors = load_sheet_vectors(book, xls_path, bareme, sheet_name, number_format_by_xf_index, cache = cache,
+            profile = sheet_profile)
+        if sheet_profile is not None:
+            profile.children.append(sheet_profile.to_json())
+        if is_xlsx_path(xls_path):
+            book.merged_cells_by_sheet_name.pop(sheet_name, None)
+        else:
+            book.unload_sheet(sheet_name)
+        with open(os.path.join(spill_dir, '{}.pickle'.format(sheet_index)), 'wb') as spill_file:
+            pickle.dump(serialize_vectors(vectors), spill_file, pickle.HIGHEST_PROTOCOL)
+        spilled_sheets.append((sheet_name, [
+            (taxipp_name, (sheet_index, vector_index, parameter_grid.get_end_dates(parameter_grid.deduplicate(
+                vector))), unit)
+            for vector_index, (taxipp_name, vector, unit) in enumerate(vectors)
+            ]))
+    if is_xlsx_path(xls_path):
+        book.close()
+    else:
+        book.release_resources()
+    return spilled_sheets
+
+
+def to_metadata_text(cell):
+    """Convert a decoded cell of a metadata column to a stripped text, or None when it is empty."""
+    if cell is None:
+        return None
+    if isinstance(cell, tuple):
+        cell = cell[0]
+    text = cell.strip() if isinstance(cell, basestring) else unicode(cell)
+    return text or None
+
+
+def transform_cell_value(date, cell_value):
+    """Split a cell into its value and its unit (None, u'EUR' or u'%'), converting FRF amounts to EUR."""
+    if isinstance(cell_value, tuple):
+        value, unit = cell_value
+        if unit == u'FRF':
+            if date < datetime.date(1960, 1, 1):
+                return round(value / (100 * 6.55957), 2), u'EUR'
+            return round(value / 6.55957, 2), u'EUR'
+        return value, unit
+    return cell_value, None
+
+
+def transform_xls_cell_to_json(book, sheet, merged_cells_index, row_index, column_index):
+    """Convert a single XLS cell to JSON.
+
+    Note: To convert a whole sheet, use decode_xls_sheet, which reads each row only once.
+    """
+    unmerged_row_index, unmerged_column_index = get_unmerged_cell_coordinates(row_index, column_index,
+        merged_cells_index)
+    cell = sheet.cell(unmerged_row_index, unmerged_column_index)
+    number_format = None
+    if cell.ctype == 2:
+        format_str = book.format_map[book.xf_list[sheet.cell_xf_index(row_index, column_index)].format_key].format_str
+        number_format = (format_str, classify_number_format(format_str))
+    return decode_xls_cell(book, cell.ctype, cell.value, number_format = number_format)
+
+
+def transform_xls_cell_to_str(book, sheet, merged_cells_index, row_index, column_index):
+    return check_str_cell(transform_xls_cell_to_json(book, sheet, merged_cells_index, row_index, column_index))
+
+
+def write_metadata_store(dir, xls_path_and_sheet_names_by_bareme = None):
+    """Build the metadata store of the parameters of every bareme of a directory, save it in its metadata directory
+    and return it."""
+    if xls_path_and_sheet_names_by_bareme is None:
+        xls_path_and_sheet_names_by_bareme = {}
+        for bareme in baremes:
+            xls_path = find_workbook_path(dir, bareme)
+            xls_path_and_sheet_names_by_bareme[bareme] = (xls_path, list_sheet_names(xls_path, bareme))
+    store = metadata_store.MetadataStore.from_sheets(
+        sheet_metadata
+        for bareme in baremes
+        for sheet_metadata in iter_sheets_metadata(xls_path_and_sheet_names_by_bareme[bareme][0], bareme,
+            xls_path_and_sheet_names_by_bareme[bareme][1])
+        )
+    store.save(os.path.join(dir, u'metadata'))
+    return store
+
+
+def write_tables(args, option, month, xls_path_and_sheet_names_by_bareme, cache_dir, issues, workbook_profiles):
+    """Parse the workbooks and write the aggregated tables of main, with its command line arguments.
+
+    The validation issues and the profiling.Profile of each workbook are appended to the given lists.
+    """
+    profile = args.profile is not None
+    if args.jobs > 1 and not args.low_memory:
+        # Submit every workbook at once, large workbooks being split into chunks of sheets.
+        pool = multiprocessing.Pool(args.jobs)
+        async_results_by_bareme = {}
+        for bareme in baremes:
+            xls_path, sheet_names = xls_path_and_sheet_names_by_bareme[bareme]
+            chunk_size = max(1, -(-len(sheet_names) // args.jobs))
+            async_results_by_bareme[bareme] = [
+                pool.apply_async(parse_workbook_sheets, (xls_path, bareme, sheet_names[index:index + chunk_size],
+                    cache_dir, profile))
+                for index in range(0, len(sheet_names), chunk_size)
+                ]
+        pool.close()
+    else:
+        pool = None
+
+    spill_dir = tempfile.mkdtemp(prefix = app_name + '-') if args.low_memory else None
+    for bareme in baremes:
+        log.info(u'Parsing file {}'.format(bareme))
+        xls_path, sheet_names = xls_path_and_sheet_names_by_bareme[bareme]
+        workbook_profile = profiling.Profile(bareme = bareme, path = xls_path)
+        workbook_profiles.append(workbook_profile)
+        if args.low_memory:
+            bareme_spill_dir = os.path.join(spill_dir, str(baremes.index(bareme)))
+            with workbook_profile.stage('spill'):
+                spilled_sheets = spill_workbook_sheets(xls_path, bareme, sheet_names, bareme_spill_dir,
+                    cache_dir = cache_dir, profile = workbook_profile if profile else None)
+            with workbook_profile.stage('validation'):
+                sheets_issues = validation.validate_sheets(bareme, iter_spilled_sheets(bareme_spill_dir,
+                    spilled_sheets))
+            issues.extend(sheets_issues)
+            if log_issues(bareme, sheets_issues):
+                print u"La table agrégée de {} n'est pas créée, à cause d'erreurs de validation !".format(bareme)
+                continue
+            spilled_vector_by_taxipp_name, unit_by_taxipp_name = merge_sheets_vectors(spilled_sheets)
+            if args.python:
+                with workbook_profile.stage('python'):
+                    python_output.write_package(iter_spilled_sheets(bareme_spill_dir, spilled_sheets), args.dir,
+                        bareme)
+            if args.store:
+                with workbook_profile.stage('store'):
+                    parameter_store.ParameterStore.from_vectors(
+                        dict(
+                            (taxipp_name, compact_vector(vector))
+                            for taxipp_name, vector in iter_spilled_vectors(bareme_spill_dir, spilled_sheets,
+                                spilled_vector_by_taxipp_name)
+                            ),
+                        unit_by_taxipp_name,
+                        ).save(os.path.join(args.dir, bareme + '-store'))
+            with workbook_profile.stage('grid'):
+                grid = parameter_grid.ParameterGrid.allocate(
+                    list(spilled_vector_by_taxipp_name),
+                    [
+                        end_date
+                        for sheet_index, vector_index, end_dates in spilled_vector_by_taxipp_name.itervalues()
+                        for end_date in end_dates
+                        ],
+                    units = [unit_by_taxipp_name[taxipp_name] for taxipp_name in spilled_vector_by_taxipp_name],
+                    end_year = args.end_year,
+                    )
+                column_by_taxipp_name = dict(
+                    (taxipp_name, column)
+                    for column, taxipp_name in enumerate(grid.names)
+                    )
+                for taxipp_name, vector in iter_spilled_vectors(bareme_spill_dir, spilled_sheets,
+                        spilled_vector_by_taxipp_name):
+                    grid.scatter(column_by_taxipp_name[taxipp_name], parameter_grid.deduplicate(vector))
+            shutil.rmtree(bareme_spill_dir)
+        else:
+            if pool is None:
+                results = [parse_workbook_sheets(xls_path, bareme, sheet_names, cache_dir = cache_dir,
+                    profile = profile)]
+            else:
+                results = [
+                    async_result.get()
+                    for async_result in async_results_by_bareme.pop(bareme)
+                    ]
+            vectors_by_sheet_name = []
+            for result in results:
+                if profile:
+                    result, profile_json = result
+                    workbook_profile.merge(profile_json)
+                vectors_by_sheet_name.extend(result)
+            with workbook_profile.stage('validation'):
+                sheets_issues = validation.validate_sheets(bareme, vectors_by_sheet_name)
+            issues.extend(sheets_issues)
+            if log_issues(bareme, sheets_issues):
+                print u"La table agrégée de {} n'est pas créée, à cause d'erreurs de validation !".format(bareme)
+                continue
+            vector_by_taxipp_name, unit_by_taxipp_name = merge_sheets_vectors(vectors_by_sheet_name)
+            if args.python:
+                with workbook_profile.stage('python'):
+                    python_output.write_package(vectors_by_sheet_name, args.dir, bareme)
+            if args.store:
+                with workbook_profile.stage('store'):
+                    parameter_store.ParameterStore.from_vectors(vector_by_taxipp_name, unit_by_taxipp_name).save(
+                        os.path.join(args.dir, bareme + '-store'))
+            with workbook_profile.stage('grid'):
+                grid = parameter_grid.ParameterGrid.from_vectors(vector_by_taxipp_name, unit_by_taxipp_name,
+                    end_year = args.end_year)
+        if option == 'which_month_in_year':
+            print month
+        with workbook_profile.stage('resampling'):
+            grid = grid.fill()
+            if args.cube:
+                grid_by_table_name = collections.OrderedDict(
+                    (u'{}-{}'.format(bareme, aggregate_name), aggregate_grid)
+                    for aggregate_name, aggregate_grid in grid.build_cube(
+                        reference_months = args.reference_months or [month]).iteritems()
+                    )
+            else:
+                grid_by_table_name = {bareme: grid.resample(option = option, month = month)}
+        with workbook_profile.stage('validation'):
+            grid_issues = validation.validate_grid(bareme, grid)
+        issues.extend(grid_issues)
+        log_issues(bareme, grid_issues)
+        with workbook_profile.stage('output'):
+            for table_name, grid in grid_by_table_name.iteritems():
+                if args.output_format == 'csv':
+                    grid.to_data_frame().to_csv(args.dir + "/"  + table_name + '.csv', encoding = 'utf-8')
+                else:
+                    columnar_output.write_grid(grid, args.dir, table_name, args.output_format)
+        workbook_profile.attributes['peak_rss'] = profiling.get_peak_rss()
+        print u"Voilà, la table agrégée de {} est créée !".format(bareme)
+    if pool is not None:
+        pool.join()
+    if spill_dir is not None:
+        shutil.rmtree(spill_dir)
+        print u"Mémoire résidente maximale : {:.1f} Mo".format(profiling.get_peak_rss() / 1024.0 / 1024.0)
 
 
 if __name__ == "__main__":
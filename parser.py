@@ -2,12 +2,24 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import collections
 import datetime
-import math
 import os
 
 import numpy as np
 import pandas as pd
+
+import validation
+
+
+baremes = [u'Prestations', u'prélèvements sociaux', u'Impôt Revenu']
+float_types = (float, np.float64)
+forbiden_sheets = {
+    u'Impôt Revenu': (u'Barème IGR',),
+    u'prélèvements sociaux': (u'Abréviations', u'ASSIETTE PU', u'AUBRYI'),
+    }
+text_types = (str, unicode)
+
 # Architecture :
 # un xlsx contient des sheets qui contiennent des variables, chaque sheet ayant un vecteur de dates
 
@@ -15,7 +27,7 @@ import pandas as pd
 def clean_date(date_time):
     ''' Conversion des dates spécifiées en année au format year/01/01
     Remise des jours au premier du mois '''
-    if len(str(date_time)) == 4 :
+    if len(str(date_time)) == 4:
         return datetime.date(date_time, 1, 1)
     else:
         return date_time.date().replace(day = 1)
@@ -27,35 +39,33 @@ def clean_sheet(xls_file, sheet_name):
     sheet = xls_file.parse(sheet_name, index_col = None)
 
     # Conserver les bonnes colonnes : on drop tous les "Unnamed"
-    for col in sheet.columns.values:
-        if col[0:7] == 'Unnamed':
-            sheet = sheet.drop([col], 1)
-            
     # Pour l'instant on drop également tous les ref_leg, jorf et notes
-    for var_to_drop in ['ref_leg', 'jorf', 'Notes', 'notes', 'date_ir'] : 
-        if var_to_drop in sheet.columns.values:
-            sheet = sheet.drop(var_to_drop, axis = 1)
+    columns_to_drop = [col for col in sheet.columns.values if col[0:7] == 'Unnamed']
+    columns_to_drop += [
+        var_to_drop
+        for var_to_drop in ['ref_leg', 'jorf', 'Notes', 'notes', 'date_ir']
+        if var_to_drop in sheet.columns.values
+        ]
+    if columns_to_drop:
+        sheet = sheet.drop(columns_to_drop, axis = 1)
 
-    
     # Pour impôt sur le revenu, il y a date_IR et date_rev : on utilise date_rev, que l'on renome date pour plus de cohérence
     if 'date_rev' in sheet.columns.values:
             sheet = sheet.rename(columns={'date_rev':u'date'})
 
     # Conserver les bonnes lignes : on drop s'il y a du texte ou du NaN dans la colonne des dates
-    def is_var_nan(row,col):
-        return isinstance(sheet.iloc[row, col], float) and math.isnan(sheet.iloc[row, col])
-    
-    sheet['date_absente'] = False
-    for i in range(0,sheet.shape[0]):
-        sheet.loc[i,['date_absente']] = isinstance(sheet.iat[i,0], basestring) or is_var_nan(i,0)
-    sheet = sheet[sheet.date_absente == False]
-    sheet = sheet.drop(['date_absente'], axis = 1)
+    first_column = sheet.iloc[:, 0]
+    first_column_types = first_column.map(type)
+    date_absente = first_column_types.isin(text_types) | (first_column_types.isin(float_types) & first_column.isnull())
+    sheet = sheet[~date_absente.values]
 
     # S'il y a du texte au milieu du tableau (explications par exemple) => on le transforme en NaN
-    for col in range(0, sheet.shape[1]):
-        for row in range(0,sheet.shape[0]):
-            if isinstance(sheet.iloc[row,col], unicode):
-                sheet.iat[row,col] = np.nan
+    # Le texte ne peut se trouver que dans des colonnes de type object : on repère d'un bloc les cellules de texte,
+    # puis on les masque toutes à la fois, sans changer le type des autres colonnes.
+    object_columns = [col for col, dtype in sheet.dtypes.iteritems() if dtype == object]
+    if object_columns:
+        is_unicode = sheet[object_columns].applymap(lambda value: isinstance(value, unicode))
+        sheet = sheet.mask(is_unicode.reindex(columns = sheet.columns, fill_value = False))
 
     # Gérer la suppression et la création progressive de dispositifs
 
@@ -73,41 +83,91 @@ def clean_sheet(xls_file, sheet_name):
 
 
 def sheet_to_dic(xls_file, sheet):
+    dic = cleaned_sheet_to_dic(clean_sheet(xls_file, sheet))
+    for var in dic:
+        print dic[var]
+    return dic
+
+
+def cleaned_sheet_to_dic(sheet):
     dic = {}
-    sheet = clean_sheet(xls_file, sheet)
     sheet.index = sheet['date']
     for var in sheet.columns.values:
         dic[var] = sheet[var]
-    for var in sheet.columns:
-        print sheet[var]
     return dic
 
 
-def dic_of_same_variable_names(xls_file, sheet_names):
-    dic = {}
-    all_variables = np.zeros(1)
-    multiple_names = []
-    for sheet_name in  sheet_names:
-        dic[sheet_name]= clean_sheet(xls_file, sheet_name)
-        sheet = clean_sheet(xls_file, sheet_name)
-        columns =  np.delete(sheet.columns.values,0)
-        all_variables = np.append(all_variables,columns)
-    for i in range(0,len(all_variables)):
-        var = all_variables[i]
-        new_variables = np.delete(all_variables,i)
-        if var in new_variables:
-            multiple_names.append(str(var))
-    multiple_names = list(set(multiple_names))
-    dic_var_to_sheet={}
-    for sheet_name in sheet_names:
-        sheet = clean_sheet(xls_file, sheet_name)
-        columns =  np.delete(sheet.columns.values,0)
-        for var in multiple_names:
-            if var in columns:
-                if var in dic_var_to_sheet.keys():
-                    dic_var_to_sheet[var].append(sheet_name)
-                else:
-                    dic_var_to_sheet[var] = [sheet_name]
+def clean_sheets(xls_file, sheet_names):
+    ''' Nettoyage de chaque feuille une seule fois, dans l'ordre du classeur '''
+    return collections.OrderedDict(
+        (sheet_name, clean_sheet(xls_file, sheet_name))
+        for sheet_name in sheet_names
+        )
+
+
+def index_variable_names(bareme, sheet_by_name, locations_by_variable = None):
+    ''' Index des noms de variables : nom -> liste des (barème, feuille, colonne) où la variable apparaît
+
+    La première colonne (date) de chaque feuille n'est pas indexée. Passer le même locations_by_variable pour
+    plusieurs barèmes permet de repérer les noms communs à plusieurs classeurs. '''
+    if locations_by_variable is None:
+        locations_by_variable = {}
+    for sheet_name, sheet in sheet_by_name.iteritems():
+        for col, var in enumerate(sheet.columns.values[1:], 1):
+            locations_by_variable.setdefault(var, []).append((bareme, sheet_name, col))
+    return locations_by_variable
+
+
+def duplicate_variable_names(locations_by_variable):
+    ''' Noms de variables présents plusieurs fois dans l'index '''
+    return dict(
+        (var, locations)
+        for var, locations in locations_by_variable.iteritems()
+        if len(locations) > 1
+        )
+
+
+def list_sheet_names(xls_file, bareme):
+    ''' Retrait des onglets qu'on ne souhaite pas importer '''
+    sheets_to_remove = (u'Sommaire', u'Outline')
+    if bareme in forbiden_sheets.keys():
+        sheets_to_remove += forbiden_sheets[bareme]
+
+    return [
+        sheet_name
+        for sheet_name in xls_file.sheet_names
+        if not sheet_name.startswith(sheets_to_remove)
+        ]
+
+
+def build_table(sheet_by_name):
+    ''' Table agrégée d'un barème, mois par mois de 1914 à 2020, à partir de ses feuilles nettoyées '''
+    # Création du dictionnaire key = 'nom de la variable' / value = 'vecteur des valeurs indexés par les dates'
+    mega_dic = {}
+    for sheet in sheet_by_name.itervalues():
+        mega_dic.update(cleaned_sheet_to_dic(sheet))
+    date_list = [
+        datetime.date(year, month, 1)
+        for year in range(1914, 2021)
+        for month in range(1, 13)
+        ]
+    table = pd.DataFrame(index = date_list)
+    for var_name, v in mega_dic.iteritems():
+        table[var_name] = np.nan
+        table.loc[v.index.values, var_name] = v.values
+    table = table.fillna(method = 'pad')
+    table = table.dropna(axis = 0, how = 'all')
+    return table
+
+
+def dic_of_same_variable_names(xls_file, sheet_names, sheet_by_name = None):
+    if sheet_by_name is None:
+        sheet_by_name = clean_sheets(xls_file, sheet_names)
+    dic_var_to_sheet = {}
+    for var, locations in duplicate_variable_names(index_variable_names(None, sheet_by_name)).iteritems():
+        for bareme, sheet_name, col in locations:
+            if sheet_name not in dic_var_to_sheet.setdefault(var, []):
+                dic_var_to_sheet[var].append(sheet_name)
     return dic_var_to_sheet
 
 
@@ -118,44 +178,31 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
 
-    baremes = [u'Prestations', u'prélèvements sociaux', u'Impôt Revenu']
-    forbiden_sheets = {u'Impôt Revenu' : (u'Barème IGR',),
-                       u'prélèvements sociaux' : (u'Abréviations', u'ASSIETTE PU', u'AUBRYI')}
-    for bareme in baremes :
+    # Chaque feuille n'est nettoyée qu'une fois, puis indexée par nom de variable, pour tous les barèmes
+    sheet_by_name_by_bareme = collections.OrderedDict()
+    locations_by_variable = {}
+    for bareme in baremes:
         xls_path = os.path.join(args.dir, u"Barèmes IPP - {0}.xlsx".format(bareme))
         xls_file = pd.ExcelFile(xls_path)
-        
-        # Retrait des onglets qu'on ne souhaite pas importer
-        sheets_to_remove = (u'Sommaire', u'Outline') 
-        if bareme in forbiden_sheets.keys():
-            sheets_to_remove += forbiden_sheets[bareme]
-
-        sheet_names = [
-            sheet_name
-            for sheet_name in xls_file.sheet_names
-            if not sheet_name.startswith(sheets_to_remove)
-            ]
-        
-        # Test si deux variables ont le même nom
-        test_duplicate = dic_of_same_variable_names(xls_file, sheet_names)
-        assert not test_duplicate, u'Au moins deux variables ont le même nom dans le classeur {} : u{}'.format(
-            bareme,test_duplicate)
-
-        # Création du dictionnaire key = 'nom de la variable' / value = 'vecteur des valeurs indexés par les dates'
-        mega_dic = {}
-        for sheet_name in sheet_names:
-            mega_dic.update(sheet_to_dic(xls_file, sheet_name))
-        date_list = [
-            datetime.date(year, month, 1)
-            for year in range(1914, 2021)
-            for month in range(1, 13)
-            ]
-        table = pd.DataFrame(index = date_list) 
-        for var_name, v in mega_dic.iteritems():
-            table[var_name] = np.nan
-            table.loc[v.index.values, var_name] = v.values
-        table = table.fillna(method = 'pad')
-        table = table.dropna(axis = 0, how = 'all')
+        sheet_names = list_sheet_names(xls_file, bareme)
+        sheet_by_name_by_bareme[bareme] = sheet_by_name = clean_sheets(xls_file, sheet_names)
+        index_variable_names(bareme, sheet_by_name, locations_by_variable)
+
+    # Test si deux variables ont le même nom : on signale chaque doublon comme une anomalie de validation (dans un
+    # même classeur, la dernière feuille l'emporte dans la table agrégée)
+    issues = []
+    for var, locations in sorted(duplicate_variable_names(locations_by_variable).iteritems()):
+        for (previous_bareme, previous_sheet_name, _), (bareme, sheet_name, _) in zip(locations, locations[1:]):
+            issues.append(validation.make_issue('duplicate_name', bareme,
+                u'Duplicate taxipp_name, overriding the one of sheet {}'.format(previous_sheet_name)
+                if bareme == previous_bareme
+                else u'Duplicate taxipp_name, also in {} / {}'.format(previous_bareme, previous_sheet_name),
+                sheet_name = sheet_name, taxipp_name = var))
+    for issue in issues:
+        print validation.format_issue(issue)
+
+    for bareme, sheet_by_name in sheet_by_name_by_bareme.iteritems():
+        table = build_table(sheet_by_name)
         table.to_csv(bareme + '.csv')
         print u"Voilà, la table agrégée de {} est créée !".format(bareme)
 
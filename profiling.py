@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+
+"""Opt-in instrumentation of the parsing of IPP workbooks: wall time of each stage and counters.
+
+A Profile is kept per workbook, with a child Profile per sheet. The stages of a sheet are its decoding, the states of
+the taxipp_names/labels/values/notes/description machine and the building of its vectors. The stages of a workbook
+are its opening, the grid, the resampling and the output, plus the total of the stages of its sheets. The report also
+gives the peak resident set size (RSS) of the main process, in bytes.
+
+Profiles are converted to JSON-compatible dicts to cross process boundaries and to be saved as a report.
+"""
+
+
+import collections
+import contextlib
+import datetime
+import io
+import json
+import resource
+import sys
+import timeit
+
+
+counter_names = (
+    'cells_decoded',
+    'merged_cells_expanded',
+    'date_conversion_failures',
+    'frf_conversions',
+    )
+timer = timeit.default_timer
+
+
+class Profile(object):
+    def __init__(self, **attributes):
+        self.attributes = attributes
+        self.children = []
+        self.counters = collections.OrderedDict(
+            (counter_name, 0)
+            for counter_name in counter_names
+            )
+        self.seconds_by_stage = collections.OrderedDict()
+
+    def add_time(self, stage, start):
+        """Add the time elapsed since start to a stage, and return the current time."""
+        now = timer()
+        self.seconds_by_stage[stage] = self.seconds_by_stage.get(stage, 0) + now - start
+        return now
+
+    def count(self, counter_name, increment = 1):
+        self.counters[counter_name] += increment
+
+    def merge(self, profile_json):
+        """Add the stages, counters and sheets of a profile converted to JSON, e.g. by a worker process."""
+        for stage, seconds in profile_json['seconds_by_stage'].iteritems():
+            self.seconds_by_stage[stage] = self.seconds_by_stage.get(stage, 0) + seconds
+        for counter_name in counter_names:
+            self.counters[counter_name] += profile_json['counters'][counter_name]
+        self.children.extend(profile_json.get('sheets', []))
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        start = timer()
+        try:
+            yield
+        finally:
+            self.add_time(stage, start)
+
+    def to_json(self):
+        profile_json = collections.OrderedDict(sorted(self.attributes.iteritems()))
+        profile_json['counters'] = self.counters.copy()
+        profile_json['seconds_by_stage'] = self.seconds_by_stage.copy()
+        if self.children:
+            profile_json['sheets'] = list(self.children)
+        return profile_json
+
+
+def add_totals(profile_json):
+    """Add the stages and counters of the sheets of a profile converted to JSON to its own, and its total time."""
+    for sheet_json in profile_json.get('sheets', []):
+        add_totals(sheet_json)
+        for counter_name in counter_names:
+            profile_json['counters'][counter_name] += sheet_json['counters'][counter_name]
+        for stage, seconds in sheet_json['seconds_by_stage'].iteritems():
+            profile_json['seconds_by_stage'][stage] = profile_json['seconds_by_stage'].get(stage, 0) + seconds
+    profile_json['seconds'] = sum(profile_json['seconds_by_stage'].itervalues())
+    return profile_json
+
+
+def get_peak_rss():
+    """Return the peak resident set size of the current process, in bytes."""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, in bytes on Mac OS X.
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def write_report(report_path, workbook_profiles, seconds):
+    """Save the profiles of the workbooks of a run as a JSON report, slowest sheets first in each workbook."""
+    workbooks_json = []
+    for workbook_profile in workbook_profiles:
+        workbook_json = add_totals(workbook_profile.to_json())
+        if 'sheets' in workbook_json:
+            workbook_json['sheets'] = sorted(workbook_json['sheets'], key = lambda sheet_json: -sheet_json['seconds'])
+        workbooks_json.append(workbook_json)
+    with io.open(report_path, 'w', encoding = 'utf-8') as report_file:
+        report_file.write(unicode(json.dumps(
+            collections.OrderedDict((
+                ('date', datetime.datetime.now().isoformat()),
+                ('peak_rss', get_peak_rss()),
+                ('seconds', seconds),
+                ('workbooks', workbooks_json),
+                )),
+            ensure_ascii = False,
+            indent = 2,
+            )))
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+
+"""Generate an importable Python package of the parameters of a bareme, as change points.
+
+The package of a bareme (e.g. ipp_prestations) has a submodule per sheet, holding for each parameter a
+(unit, dates, values) triple of tuples: the ISO 8601 dates when the parameter changes and its new values (floats, or
+u'-' when abolished). Sheet modules are imported on first access, and the generated code only uses the standard
+library, so reading a parameter neither loads the whole bareme nor imports pandas, numpy or xlrd:
+
+    import ipp_prestations
+    ipp_prestations.value_at(u'af_maj', '2012-05-01')
+"""
+
+
+import compileall
+import io
+import keyword
+import os
+import re
+import shutil
+
+from biryani1 import strings
+
+import parameter_store
+
+
+identifier_re = re.compile(r'[A-Za-z_][A-Za-z0-9_]*$')
+package_code = u'''
+
+class LazyPackage(types.ModuleType):
+    """Package importing the module of a sheet on first access, and giving its parameters as attributes."""
+    def __getattr__(self, name):
+        if name in sheet_name_by_module_name:
+            return importlib.import_module('{}.{}'.format(self.__name__, name))
+        if name in module_name_by_taxipp_name:
+            return get(name)
+        raise AttributeError(name)
+
+
+def get(taxipp_name):
+    """Return the (unit, dates, values) triple of a parameter."""
+    module = importlib.import_module('{}.{}'.format(__name__, module_name_by_taxipp_name[taxipp_name]))
+    return module.parameter_by_taxipp_name[taxipp_name]
+
+
+def value_at(taxipp_name, date):
+    """Return the value of a parameter at a date: a float, u'-' when abolished or None when unknown.
+
+    The date is a datetime.date or an ISO 8601 string, like 2012, 2012-05 or 2012-05-15.
+    """
+    if hasattr(date, 'isoformat'):
+        date = date.isoformat()[:10]
+    # Complete partial dates with the first month and day.
+    date = (date + '-01-01')[:10]
+    unit, dates, values = get(taxipp_name)
+    position = bisect.bisect_right(dates, date)
+    if position == 0:
+        return None
+    return values[position - 1]
+
+
+# Python 2 clears the globals of a module when it is deleted, so the lazy package keeps a reference to this one.
+module = sys.modules[__name__]
+sys.modules[__name__] = LazyPackage(__name__, __doc__)
+sys.modules[__name__].__dict__.update(module.__dict__)
+'''
+package_reserved_names = set([
+    'abolished_value',
+    'bareme',
+    'bisect',
+    'get',
+    'importlib',
+    'LazyPackage',
+    'module',
+    'module_name_by_taxipp_name',
+    'sheet_name_by_module_name',
+    'sys',
+    'types',
+    'value_at',
+    ])
+sheet_reserved_names = set([
+    'parameter_by_taxipp_name',
+    'sheet_name',
+    ])
+
+
+def get_package_name(bareme):
+    return u'ipp_' + strings.slugify(bareme, separator = u'_')
+
+
+def is_identifier(name, reserved_names):
+    return identifier_re.match(name) is not None and not keyword.iskeyword(name) and name not in reserved_names
+
+
+def to_module_name(sheet_name, module_names):
+    """Return a module name for a sheet, that is a Python identifier and not already in module_names."""
+    module_name = strings.slugify(sheet_name, separator = u'_') or u'sheet'
+    if not is_identifier(module_name, package_reserved_names):
+        module_name = u'sheet_' + module_name
+    unique_module_name = module_name
+    index = 1
+    while unique_module_name in module_names:
+        index += 1
+        unique_module_name = u'{}_{}'.format(module_name, index)
+    return unique_module_name
+
+
+def write_package(vectors_by_sheet_name, output_dir, bareme):
+    """Generate the package of a bareme from its (sheet_name, vectors) couples, and return its path.
+
+    When a parameter is in several sheets, the package gives the one of the last sheet, like merge_sheets_vectors.
+    """
+    package_path = os.path.join(output_dir, get_package_name(bareme))
+    if os.path.isdir(package_path):
+        shutil.rmtree(package_path)
+    os.makedirs(package_path)
+    module_name_by_taxipp_name = {}
+    sheet_name_by_module_name = {}
+    for sheet_name, vectors in vectors_by_sheet_name:
+        module_name = to_module_name(sheet_name, sheet_name_by_module_name)
+        sheet_name_by_module_name[module_name] = sheet_name
+        # When a parameter is repeated in a sheet, keep its last column.
+        taxipp_names = []
+        parameter_by_taxipp_name = {}
+        for taxipp_name, vector, unit in vectors:
+            if taxipp_name not in parameter_by_taxipp_name:
+                taxipp_names.append(taxipp_name)
+            dates = []
+            values = []
+            for date, value, abolished in parameter_store.iter_change_points(vector):
+                dates.append(date.isoformat()[:10])
+                values.append(parameter_store.abolished_value if abolished else value)
+            parameter_by_taxipp_name[taxipp_name] = (unit, tuple(dates), tuple(values))
+            module_name_by_taxipp_name[taxipp_name] = module_name
+        lines = [
+            u'# -*- coding: utf-8 -*-',
+            u'',
+            u'',
+            u'"""Parameters of sheet {} of IPP bareme {}, as change points.'.format(sheet_name, bareme),
+            u'',
+            u'Generated by legislation-ipp-to-code: do not edit.',
+            u'"""',
+            u'',
+            u'',
+            u'sheet_name = {!r}'.format(sheet_name),
+            u'parameter_by_taxipp_name = {',
+            ]
+        lines.extend(
+            u'    {!r}: {!r},'.format(taxipp_name, parameter_by_taxipp_name[taxipp_name])
+            for taxipp_name in taxipp_names
+            )
+        lines.append(u'    }')
+        lines.extend(
+            u'{0} = parameter_by_taxipp_name[{0!r}]'.format(taxipp_name)
+            for taxipp_name in taxipp_names
+            if is_identifier(taxipp_name, sheet_reserved_names)
+            )
+        write_module(os.path.join(package_path, module_name + u'.py'), lines)
+    lines = [
+        u'# -*- coding: utf-8 -*-',
+        u'',
+        u'',
+        u'"""IPP parameters of bareme {}, as change points.'.format(bareme),
+        u'',
+        u'Generated by legislation-ipp-to-code: do not edit.',
+        u'',
+        u'Each sheet is a submodule, imported on first access. Parameters are read with get() and value_at(), or as',
+        u'attributes of the package. A parameter is a (unit, dates, values) triple: the ISO 8601 dates when it changes',
+        u'and its new values, a float or u\'-\' when abolished.',
+        u'"""',
+        u'',
+        u'',
+        u'import bisect',
+        u'import importlib',
+        u'import sys',
+        u'import types',
+        u'',
+        u'',
+        u'abolished_value = {!r}'.format(parameter_store.abolished_value),
+        u'bareme = {!r}'.format(bareme),
+        u'module_name_by_taxipp_name = {',
+        ]
+    lines.extend(
+        u'    {!r}: {!r},'.format(taxipp_name, str(module_name))
+        for taxipp_name, module_name in sorted(module_name_by_taxipp_name.iteritems())
+        )
+    lines.append(u'    }')
+    lines.append(u'sheet_name_by_module_name = {')
+    lines.extend(
+        u'    {!r}: {!r},'.format(str(module_name), sheet_name)
+        for module_name, sheet_name in sorted(sheet_name_by_module_name.iteritems())
+        )
+    lines.append(u'    }')
+    write_module(os.path.join(package_path, u'__init__.py'), lines + package_code.split(u'\n'))
+    # Compile the modules now, so that their first import doesn't have to.
+    compileall.compile_dir(package_path, quiet = True)
+    return package_path
+
+
+def write_module(module_path, lines):
+    with io.open(module_path, 'w', encoding = 'utf-8') as module_file:
+        module_file.write(u'\n'.join(lines).rstrip(u'\n') + u'\n')
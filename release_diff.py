@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+
+"""Differences between the parameters of two releases of the IPP tables.
+
+The parameters of a bareme in each release are a ParameterStore of change points. The change points of each parameter
+are hashed in both releases, and only the parameters whose digests differ are compared, date by date, to find their
+first difference. No monthly grid is built.
+"""
+
+
+import numpy as np
+
+
+statuses = ('added', 'removed', 'modified')
+
+
+def diff_stores(old_store, new_store):
+    """Compare the parameters of two releases of a bareme.
+
+    Return the (taxipp_name, status, first_date) triples of the parameters that are added, removed or modified, sorted
+    by name. first_date is the first date (a numpy.datetime64) when the values of a modified parameter differ, or None
+    when only its unit changed or when it is added or removed.
+    """
+    differences = []
+    for taxipp_name in sorted(set(old_store.names) | set(new_store.names)):
+        if taxipp_name not in old_store:
+            differences.append((taxipp_name, 'added', None))
+        elif taxipp_name not in new_store:
+            differences.append((taxipp_name, 'removed', None))
+        elif old_store.get_digest(taxipp_name) != new_store.get_digest(taxipp_name):
+            differences.append((taxipp_name, 'modified', find_first_difference(old_store, new_store, taxipp_name)))
+    return differences
+
+
+def find_first_difference(old_store, new_store, taxipp_name):
+    """Return the first date when the values of a parameter differ in two stores, or None when they never differ."""
+    dates = np.union1d(old_store.get_change_points(taxipp_name)[0], new_store.get_change_points(taxipp_name)[0])
+    old_values, old_abolished = old_store.gather(taxipp_name, dates, with_abolished = True)
+    new_values, new_abolished = new_store.gather(taxipp_name, dates, with_abolished = True)
+    differ = (old_abolished != new_abolished) | ~((old_values == new_values)
+        | np.isnan(old_values) & np.isnan(new_values))
+    if not differ.any():
+        return None
+    return dates[np.argmax(differ)]
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+
+"""Content-addressed on-disk cache of the vectors parsed from IPP workbooks and sheets.
+
+Entries are pickle files named after the SHA-1 of their key. A key is built from the content of the workbook (or of
+the sheet) and from parser_version, so a modified input never hits a stale entry.
+"""
+
+
+import cPickle as pickle
+import hashlib
+import logging
+import os
+import tempfile
+import time
+
+
+log = logging.getLogger(__name__)
+# Increment when a change of the parser modifies the vectors it produces, to invalidate existing entries.
+parser_version = 2
+
+
+class SheetCache(object):
+    def __init__(self, dir):
+        self.dir = dir
+        if not os.path.isdir(dir):
+            os.makedirs(dir)
+
+    def evict(self, max_size = None, max_age = None):
+        """Remove the entries not used since max_age seconds, then the least recently used entries until the cache
+        is smaller than max_size bytes."""
+        entries = []
+        for file_name in os.listdir(self.dir):
+            if not file_name.endswith('.pickle'):
+                continue
+            file_path = os.path.join(self.dir, file_name)
+            stat = os.stat(file_path)
+            entries.append((stat.st_mtime, stat.st_size, file_path))
+        entries.sort()
+        now = time.time()
+        size = sum(entry[1] for entry in entries)
+        removed_count = 0
+        for mtime, file_size, file_path in entries:
+            if (max_age is None or now - mtime <= max_age) and (max_size is None or size <= max_size):
+                break
+            try:
+                os.remove(file_path)
+            except OSError:
+                # Entry already removed by a concurrent run.
+                pass
+            size -= file_size
+            removed_count += 1
+        if removed_count:
+            log.info(u'Evicted {} entries from cache {}'.format(removed_count, self.dir))
+        return removed_count
+
+    def get(self, key):
+        file_path = self.get_file_path(key)
+        try:
+            with open(file_path, 'rb') as cache_file:
+                value = pickle.load(cache_file)
+        except (EOFError, IOError, pickle.UnpicklingError):
+            return None
+        # Mark entry as recently used, for eviction.
+        os.utime(file_path, None)
+        return value
+
+    def get_file_path(self, key):
+        return os.path.join(self.dir, '{}.pickle'.format(key))
+
+    def set(self, key, value):
+        # Write to a temporary file then rename it, so that concurrent workers never read a partial entry.
+        file_descriptor, temporary_file_path = tempfile.mkstemp(dir = self.dir, suffix = '.tmp')
+        with os.fdopen(file_descriptor, 'wb') as cache_file:
+            pickle.dump(value, cache_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(temporary_file_path, self.get_file_path(key))
+
+
+def default_cache_dir():
+    return os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+        'legislation-ipp-to-code',
+        )
+
+
+def hash_file(file_path):
+    file_hash = hashlib.sha1()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def make_key(*fragments):
+    key_hash = hashlib.sha1(repr((parser_version,) + fragments))
+    return key_hash.hexdigest()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+
+"""Marginal rate schedules (barèmes) of IPP parameters, applied to NumPy arrays of incomes.
+
+Schedules are built at a date from a ParameterStore, where amounts are already converted to euros:
+- the income tax schedules of Impôt Revenu, pairing the thresholds tranche<i><suffix> with the rates txmarg<i><suffix>
+  (e.g. tranche1..tranche14 & txmarg1..txmarg14, tranche1_HR & txmarg1_HR);
+- the contribution schedules of prélèvements sociaux, grouping the rates <prefix>_<low>_<high> of a prefix (e.g.
+  cnav_s_0_ and cnav_s_0_1). Each column is a rate between two bounds, in multiples of the social security ceiling
+  (an empty high bound is unbounded), and the rates of overlapping columns add up.
+
+A schedule is evaluated on an array of any size without looping over its items: the bracket of each income is found by
+a binary search in the thresholds, and the tax by a lookup in the cumulated tax of the brackets below it.
+"""
+
+
+import collections
+import logging
+import re
+
+import numpy as np
+
+import parameter_store
+
+
+# (low, high) bounds of the contribution columns whose names drop the decimal point of a bound, as given by their labels
+# in the sheets RET-PL ("Sous 0,85 PSS", "Entre 0,85 et 5 PSS") and RET-COMP-PL ("Sous 3,5 PSS") of prelevements
+# sociaux
+bounds_by_taxipp_name = {
+    u'ret_plib_0_85': (0, 0.85),
+    u'ret_plib_85_5': (0.85, 5),
+    u'retc_chird_85_5': (0.85, 5),
+    u'retc_med_0_35': (0, 3.5),
+    }
+bracket_name_re = re.compile(ur'(?P<prefix>.+?)_(?P<low>\d+)_(?P<high>(\d+(_\d+)?)?)$')
+# Number of incomes evaluated at once, to bound the size of the temporary arrays
+chunk_size = 2 ** 20
+income_tax_name_re = re.compile(ur'(?P<kind>tranche|txmarg)(?P<index>\d+)(?P<suffix>.*)$')
+log = logging.getLogger(__name__)
+
+
+class Schedule(object):
+    """Marginal rates by bracket: rates[i] applies to the part of an income between thresholds[i] and the next one.
+
+    Incomes below the first threshold are not taxed.
+    """
+    def __init__(self, thresholds, rates, name = None):
+        thresholds = np.asarray(thresholds, dtype = np.float64)
+        rates = np.asarray(rates, dtype = np.float64)
+        if thresholds.ndim != 1 or thresholds.shape != rates.shape or len(thresholds) == 0:
+            raise ValueError(u'Schedule {} needs as many thresholds as rates'.format(name).encode('utf-8'))
+        if np.any(np.diff(thresholds) <= 0):
+            raise ValueError(u'Thresholds of schedule {} are not increasing: {}'.format(name, thresholds).encode(
+                'utf-8'))
+        self.name = name
+        self.rates = rates
+        self.thresholds = thresholds
+        # Bracket 0 is below the first threshold, so that searchsorted gives directly the bracket of an income.
+        self.bracket_lows = np.concatenate((thresholds[:1], thresholds))
+        self.bracket_rates = np.concatenate(([0.0], rates))
+        self.bracket_taxes = np.concatenate(([0.0, 0.0], np.cumsum(np.diff(thresholds) * rates[:-1])))
+
+    def __repr__(self):
+        return '{}({!r}, {!r}, name = {!r})'.format(self.__class__.__name__, self.thresholds.tolist(),
+            self.rates.tolist(), self.name)
+
+    def average_rate(self, incomes):
+        """Return the tax divided by the income, 0 for incomes that are not positive."""
+        incomes = np.asarray(incomes, dtype = np.float64)
+        taxes = self.tax(incomes)
+        return np.divide(taxes, incomes, out = np.zeros_like(taxes), where = incomes > 0)
+
+    def evaluate(self, incomes, with_tax):
+        incomes = np.asarray(incomes, dtype = np.float64)
+        flat_incomes = incomes.ravel()
+        results = np.empty(flat_incomes.shape, dtype = np.float64)
+        for start in xrange(0, len(flat_incomes), chunk_size):
+            chunk = flat_incomes[start:start + chunk_size]
+            brackets = np.searchsorted(self.thresholds, chunk, side = 'right')
+            result = results[start:start + chunk_size]
+            np.take(self.bracket_rates, brackets, out = result)
+            if with_tax:
+                result *= chunk - self.bracket_lows.take(brackets)
+                result += self.bracket_taxes.take(brackets)
+        return results.reshape(incomes.shape)
+
+    @classmethod
+    def from_brackets(cls, brackets, name = None):
+        """Build a schedule from (low, high, rate) brackets, where high may be infinite, adding overlapping rates."""
+        lows, highs, rates = (np.array(items, dtype = np.float64) for items in zip(*brackets))
+        thresholds = np.unique(np.concatenate((lows, highs[np.isfinite(highs)])))
+        in_bracket = (lows[:, None] <= thresholds) & (thresholds < highs[:, None])
+        return cls(thresholds, np.dot(rates, in_bracket), name = name)
+
+    def marginal_rate(self, incomes):
+        return self.evaluate(incomes, with_tax = False)
+
+    def scale(self, factor):
+        """Return the same schedule, with thresholds multiplied by a factor (e.g. a ceiling for contributions)."""
+        return self.__class__(self.thresholds * factor, self.rates, name = self.name)
+
+    def tax(self, incomes):
+        return self.evaluate(incomes, with_tax = True)
+
+
+def build_schedules(store, date, ceiling = None):
+    """Return the schedules in force at a date, by name, from a ParameterStore.
+
+    Income tax schedules are named after their rates (txmarg, txmarg_HR) and contribution schedules after their
+    prefix. Brackets that are unknown or abolished at this date are left out, with a warning when only their threshold
+    or only their rate is. So are the income tax brackets whose threshold is not above the threshold of the bracket
+    before them: an empty cell continues the value of its column, so a bracket left empty instead of abolished in its
+    sheet keeps its former, stale, threshold. The thresholds of contribution schedules are multiples of the social
+    security ceiling, unless its value at this date is given.
+    """
+    schedule_by_name = collections.OrderedDict()
+    income_tax_names, bracket_names_by_prefix = group_schedule_names(store)
+    for suffix, names_by_index in sorted(income_tax_names.iteritems()):
+        points = []
+        for index, (threshold_name, rate_name) in sorted(names_by_index.iteritems()):
+            threshold = get_number(store, threshold_name, date)
+            rate = get_number(store, rate_name, date)
+            if threshold is None or rate is None:
+                if threshold is not None or rate is not None:
+                    log.warning(u'Ignoring bracket {} at {}, whose {} is unknown or abolished'.format(threshold_name,
+                        date, u'threshold' if threshold is None else u'rate'))
+                continue
+            if points and threshold <= points[-1][0]:
+                log.warning(u'Ignoring bracket {} at {}, whose threshold {} is not above the one of the bracket '
+                    u'before it'.format(threshold_name, date, threshold))
+                continue
+            points.append((threshold, rate))
+        if points:
+            name = u'txmarg' + suffix
+            schedule_by_name[name] = Schedule(*zip(*points), name = name)
+    for prefix, bracket_names in bracket_names_by_prefix.iteritems():
+        brackets = []
+        for taxipp_name, low, high in bracket_names:
+            rate = get_number(store, taxipp_name, date)
+            if rate is None:
+                continue
+            if low >= high:
+                log.warning(u'Ignoring bracket {}, whose bounds are not increasing'.format(taxipp_name))
+                continue
+            brackets.append((low, high, rate))
+        if brackets:
+            schedule = Schedule.from_brackets(brackets, name = prefix)
+            schedule_by_name[prefix] = schedule if ceiling is None else schedule.scale(ceiling)
+    return schedule_by_name
+
+
+def get_number(store, taxipp_name, date):
+    """Return the value of a parameter at a date, or None when it is unknown or abolished."""
+    value = store.get(taxipp_name, date)
+    return None if value is None or value == parameter_store.abolished_value else value
+
+
+def group_schedule_names(store):
+    """Group the parameters of a store that are brackets of a schedule.
+
+    Return the couple of:
+    - the income tax (threshold_name, rate_name) couples, by index, by suffix;
+    - the contribution (taxipp_name, low, high) triples, by prefix, for rates only.
+    """
+    income_tax_names = {}
+    for taxipp_name in store.names:
+        match = income_tax_name_re.match(taxipp_name)
+        if match is None or match.group('kind') != u'tranche':
+            continue
+        rate_name = u'txmarg{}{}'.format(match.group('index'), match.group('suffix'))
+        if rate_name in store:
+            income_tax_names.setdefault(match.group('suffix'), {})[int(match.group('index'))] = (taxipp_name,
+                rate_name)
+    bracket_names_by_prefix = collections.OrderedDict()
+    for taxipp_name in store.names:
+        match = bracket_name_re.match(taxipp_name)
+        if match is None or store.get_unit(taxipp_name) != u'%':
+            continue
+        bounds = bounds_by_taxipp_name.get(taxipp_name)
+        if bounds is None:
+            bounds = (
+                parse_bound(match.group('low')),
+                parse_bound(match.group('high')) if match.group('high') else np.inf,
+                )
+        bracket_names_by_prefix.setdefault(match.group('prefix'), []).append((taxipp_name, ) + tuple(bounds))
+    return income_tax_names, bracket_names_by_prefix
+
+
+def parse_bound(token):
+    """Convert the bound of a contribution column (e.g. 0, 4, 4_75 for 4.75) to a multiple of the ceiling.
+
+    See bounds_by_taxipp_name for the columns whose bounds are written without their decimal point.
+    """
+    return float(token.replace(u'_', u'.'))
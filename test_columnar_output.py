@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the typed columnar files of the aggregated tables."""
+
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+import columnar_output
+import test_parameter_grid
+
+
+class ColumnarOutputTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def check_round_trip(self, output_format):
+        grid = test_parameter_grid.build_grid().fill()
+        columnar_output.write_grid(grid, self.dir, u'Chomage', output_format)
+        data_frame, column_metadata_by_name = columnar_output.read_columns(self.dir, u'Chomage', output_format,
+            [u'taux', u'montant'])
+        self.assertEqual(list(data_frame.columns), [u'taux', u'montant'])
+        self.assertTrue((data_frame.index.values == grid.dates.astype('datetime64[ns]')).all())
+        for taxipp_name in (u'montant', u'taux'):
+            self.assertEqual(data_frame[taxipp_name].dtype, np.float64)
+            self.assertTrue(np.allclose(data_frame[taxipp_name].values, grid.values[:, grid.names.index(taxipp_name)],
+                equal_nan = True))
+        self.assertEqual(column_metadata_by_name[u'montant'][u'unit'], u'EUR')
+        self.assertEqual(column_metadata_by_name[u'taux'][u'unit'], u'%')
+        # Only montant is abolished.
+        self.assertTrue(any(key.startswith(u'abolished_') for key in column_metadata_by_name[u'montant']))
+        self.assertFalse(any(key.startswith(u'abolished_') for key in column_metadata_by_name[u'taux']))
+        with io.open(columnar_output.get_metadata_path(self.dir, u'Chomage', output_format), encoding = 'utf-8') \
+                as metadata_file:
+            metadata = json.load(metadata_file)
+        self.assertEqual(metadata[u'bareme'], u'Chomage')
+        self.assertEqual(metadata[u'format'], output_format)
+        return grid, column_metadata_by_name
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_feather(self):
+        self.check_round_trip('feather')
+
+    def test_npy(self):
+        grid, column_metadata_by_name = self.check_round_trip('npy')
+        output_path = columnar_output.get_output_path(self.dir, u'Chomage', 'npy')
+        abolished = np.load(os.path.join(output_path, column_metadata_by_name[u'montant'][u'abolished_file']))
+        self.assertEqual(abolished.tolist(), grid.abolished[:, grid.names.index(u'montant')].tolist())
+        # A single column can be read alone.
+        data_frame, _ = columnar_output.read_columns(self.dir, u'Chomage', 'npy', [u'taux'], mmap_mode = 'r')
+        self.assertEqual(len(data_frame), len(grid.dates))
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_parquet(self):
+        self.check_round_trip('parquet')
+
+
+if __name__ == '__main__':
+    unittest.main()
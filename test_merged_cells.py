@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the index of the merged cells of a sheet."""
+
+
+import unittest
+
+from merged_cells import MergedCellsIndex
+
+
+class MergedCellsIndexTestCase(unittest.TestCase):
+    def test_get_anchor(self):
+        # xlrd ranges: rows 0 & 1 of columns 1 to 3, and row 1 of columns 5 & 6
+        index = MergedCellsIndex([(0, 2, 1, 4), (1, 2, 5, 7)])
+        self.assertEqual(index.get_anchor(0, 1), (0, 1))
+        self.assertEqual(index.get_anchor(1, 3), (0, 1))
+        self.assertEqual(index.get_anchor(1, 6), (1, 5))
+        self.assertIsNone(index.get_anchor(0, 0))
+        self.assertIsNone(index.get_anchor(1, 4))
+        self.assertIsNone(index.get_anchor(0, 5))
+        self.assertIsNone(index.get_anchor(2, 1))
+
+    def test_get_row_intervals(self):
+        index = MergedCellsIndex([(1, 2, 5, 7), (0, 2, 1, 4)])
+        self.assertEqual(index.get_row_intervals(0), [(1, 4, 0)])
+        self.assertEqual(index.get_row_intervals(1), [(1, 4, 0), (5, 7, 1)])
+        self.assertEqual(list(index.get_row_intervals(2)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
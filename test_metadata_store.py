@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the store of the metadata of parameters and of its keyword searches."""
+
+
+import shutil
+import tempfile
+import unittest
+
+import metadata_store
+
+
+def build_store():
+    return metadata_store.MetadataStore.from_sheets([
+        (u'Prestations', u'AF', u'Allocations familiales', [
+            dict(
+                change_points = [
+                    (u'2010-01-01', u'Décret n° 2009-1234', u'JO du 31/12/2009', None),
+                    (u'2012-01-01', u'Décret n° 2011-99', None, u'Revalorisation'),
+                    ],
+                labels = [u'Majoration pour âge'],
+                name = u'af_maj',
+                notes = [],
+                unit = u'%',
+                ),
+            dict(
+                change_points = [(u'2010-01-01', u'Décret n° 2009-1234', None, None)],
+                labels = [u'Plafond de ressources'],
+                name = u'af_plaf',
+                notes = [u'Par enfant'],
+                unit = u'EUR',
+                ),
+            ]),
+        (u'Chomage', u'ARE', u'Allocation de retour à l\'emploi', [
+            dict(
+                change_points = [(u'2009-04-01', None, None, None)],
+                labels = [u'Majoration'],
+                name = u'af_maj',
+                notes = [],
+                unit = u'EUR',
+                ),
+            ]),
+        ])
+
+
+class MetadataStoreTestCase(unittest.TestCase):
+    def test_interned_texts(self):
+        store = build_store()
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.texts.count(u'Décret n° 2009-1234'), 1)
+        self.assertEqual(store.parameters[0]['change_points'][0][1], store.parameters[1]['change_points'][0][1])
+
+    def test_get(self):
+        store = build_store()
+        self.assertEqual([parameter['bareme'] for parameter in store.get(u'af_maj')], [u'Prestations', u'Chomage'])
+        parameter, = store.get(u'af_maj', bareme = u'Prestations')
+        self.assertEqual(parameter['description'], u'Allocations familiales')
+        self.assertEqual(parameter['labels'], [u'Majoration pour âge'])
+        self.assertEqual(parameter['change_points'][1], [u'2012-01-01', u'Décret n° 2011-99', None, u'Revalorisation'])
+
+    def test_search(self):
+        store = build_store()
+        # Words are compared without case nor accents.
+        self.assertEqual(store.search(u'AGE'), [0])
+        self.assertEqual(store.search(u'majoration'), [0, 2])
+        self.assertEqual(store.search(u'majoration', bareme = u'Chomage'), [2])
+        # Every word must match.
+        self.assertEqual(store.search(u'majoration decret'), [0])
+        self.assertEqual(store.search(u'majoration inconnu'), [])
+        self.assertEqual(store.search(u''), [])
+        # Texts of change points, notes, sheets and descriptions are searched too.
+        self.assertEqual(store.search(u'2009 1234'), [0, 1])
+        self.assertEqual(store.search(u'enfant'), [1])
+        self.assertEqual(store.search(u'are'), [2])
+        self.assertEqual(store.search(u'emploi'), [2])
+        # A name is also searched as is.
+        self.assertEqual(store.search(u'af_plaf'), [1])
+
+    def test_prefix_search(self):
+        store = build_store()
+        self.assertEqual(store.search(u'major'), [0, 2])
+        self.assertEqual(store.search(u'revalo'), [0])
+        self.assertEqual(store.search(u'af'), [0, 1, 2])
+        self.assertEqual(store.search(u'af pla'), [1])
+        self.assertEqual(store.search(u'allocation'), [0, 1, 2])
+        self.assertEqual(store.search(u'allocations'), [0, 1])
+
+    def test_save_and_load(self):
+        store = build_store()
+        dir = tempfile.mkdtemp()
+        try:
+            store.save(dir)
+            loaded_store = metadata_store.MetadataStore.load(dir)
+        finally:
+            shutil.rmtree(dir)
+        self.assertEqual(len(loaded_store), len(store))
+        self.assertEqual(loaded_store.tokens, store.tokens)
+        self.assertEqual(loaded_store.search(u'major'), [0, 2])
+        self.assertEqual(loaded_store.get(u'af_plaf'), store.get(u'af_plaf'))
+        self.assertEqual(loaded_store.format_parameter(1), u'Prestations\tAF\taf_plaf\tPlafond de ressources')
+
+
+if __name__ == '__main__':
+    unittest.main()
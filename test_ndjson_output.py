@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the NDJSON events of the changes of the parameters."""
+
+
+import datetime
+import io
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import ndjson_output
+
+
+class NdjsonOutputTestCase(unittest.TestCase):
+    def test_write_events(self):
+        dates = [datetime.date(2010, 1, 1), datetime.date(2011, 1, 1), datetime.date(2012, 1, 1),
+            datetime.date(2013, 1, 1)]
+        vectors = [
+            (u'af_maj', pd.Series([100, 100, 110.5, np.nan], index = dates), u'EUR'),
+            (u'af_taux', pd.Series([0.32, u'nc', None, u'-'], index = dates, dtype = object), u'%'),
+            ]
+        output_file = io.StringIO()
+        count = ndjson_output.write_events(output_file, ndjson_output.iter_sheet_events(u'Allocations familiales',
+            vectors))
+        self.assertEqual(count, 4)
+        lines = output_file.getvalue().splitlines()
+        self.assertEqual(len(lines), count)
+        # Keys keep their order and text is not escaped.
+        self.assertEqual(lines[0], u'{"parameter": "af_maj", "date": "2010-01-01", "value": 100.0, "unit": "EUR", '
+            u'"sheet": "Allocations familiales"}')
+        self.assertEqual(
+            [
+                (event['parameter'], event['date'], event['value'])
+                for event in (json.loads(line) for line in lines)
+                ],
+            [
+                (u'af_maj', u'2010-01-01', 100),
+                (u'af_maj', u'2012-01-01', 110.5),
+                (u'af_taux', u'2010-01-01', 0.32),
+                (u'af_taux', u'2013-01-01', u'-'),
+                ],
+            )
+
+    def test_unicode(self):
+        output_file = io.StringIO()
+        ndjson_output.write_events(output_file, [dict(sheet = u'Barème')])
+        self.assertEqual(output_file.getvalue(), u'{"sheet": "Barème"}\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the monthly grid of the parameters of a bareme."""
+
+
+import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import parameter_grid
+
+
+def build_grid():
+    return parameter_grid.ParameterGrid.from_vectors(
+        dict(
+            # Rows are not sorted, and an amount converted from FRF is a float.
+            montant = pd.Series(
+                [u'-', 311.0, 100],
+                index = [datetime.date(2010, 9, 1), datetime.date(2010, 6, 1), datetime.date(2010, 1, 1)],
+                dtype = object,
+                ),
+            taux = pd.Series([0.5, 0.25], index = [datetime.date(2010, 3, 1), datetime.date(2011, 1, 1)]),
+            ),
+        dict(montant = u'EUR', taux = u'%'),
+        )
+
+
+class ParameterGridTestCase(unittest.TestCase):
+    def test_bounds(self):
+        grid = build_grid()
+        self.assertEqual(grid.dates[0], np.datetime64('2010-01-01'))
+        self.assertEqual(grid.dates[-1], np.datetime64('2011-12-01'))
+        self.assertEqual(grid.values.shape, (24, 2))
+
+    def test_fill_and_data_frame(self):
+        data_frame = build_grid().fill().to_data_frame()
+        montants = data_frame[u'montant']
+        self.assertEqual(montants[datetime.date(2010, 5, 1)], 100)
+        self.assertIsInstance(montants[datetime.date(2010, 5, 1)], (int, long))
+        self.assertIsInstance(montants[datetime.date(2010, 6, 1)], float)
+        self.assertEqual(montants[datetime.date(2010, 8, 1)], 311.0)
+        self.assertEqual(montants[datetime.date(2011, 12, 1)], parameter_grid.abolished_value)
+        taux = data_frame[u'taux']
+        self.assertTrue(np.isnan(taux[datetime.date(2010, 2, 1)]))
+        self.assertEqual(taux[datetime.date(2010, 12, 1)], 0.5)
+        self.assertEqual(taux[datetime.date(2011, 1, 1)], 0.25)
+
+    def test_resample(self):
+        grid = build_grid().fill()
+        montant_column = grid.names.index(u'montant')
+        taux_column = grid.names.index(u'taux')
+        yearly_grid = grid.resample(option = 'mean_by_year')
+        self.assertEqual(yearly_grid.dates.tolist(), [datetime.date(2010, 1, 1), datetime.date(2011, 1, 1)])
+        # Abolished months count as 0.
+        self.assertAlmostEqual(yearly_grid.values[0, montant_column], (5 * 100 + 3 * 311.0) / 12)
+        self.assertEqual(yearly_grid.values[1, montant_column], 0)
+        self.assertAlmostEqual(yearly_grid.values[0, taux_column], 0.5)
+        may_grid = grid.resample(option = 'which_month_in_year', month = 5)
+        self.assertEqual(may_grid.values[:, taux_column].tolist(), [0.5, 0.25])
+        last_grid = grid.build_cube()['quarterly_last']
+        self.assertEqual(len(last_grid.dates), 8)
+        self.assertEqual(last_grid.values[1, montant_column], 311.0)
+        self.assertTrue(last_grid.abolished[2, montant_column])
+
+
+if __name__ == '__main__':
+    unittest.main()
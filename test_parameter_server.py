@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the parameter server, through a local client and through a Unix socket."""
+
+
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import parameter_server
+import parameter_store
+
+
+dates = ['2009-06-01', '2010-03-01', '2011-02-01', '2012-07-01']
+
+
+def build_service():
+    store = parameter_store.ParameterStore.from_vectors(
+        dict(
+            plafond = pd.Series([1000, 1100, u'-'], index = [datetime.date(2010, 1, 1), datetime.date(2011, 1, 1),
+                datetime.date(2012, 1, 1)], dtype = object),
+            taux = pd.Series([0.05], index = [datetime.date(2009, 1, 1)]),
+            ),
+        dict(plafond = u'EUR', taux = u'%'),
+        )
+    return parameter_server.ParameterService(dict(Chomage = store))
+
+
+class ClientTestMixin(object):
+    def test_gather(self):
+        values = self.client.gather(u'Chomage', [u'taux', u'plafond'], dates)
+        self.assertEqual(values.shape, (2, 4))
+        self.assertEqual(values[0].tolist(), [0.05] * 4)
+        self.assertTrue(np.isnan(values[1, 0]))
+        self.assertEqual(values[1, 1:3].tolist(), [1000.0, 1100.0])
+        self.assertTrue(np.isnan(values[1, 3]))
+
+    def test_gather_with_abolished(self):
+        values, abolished = self.client.gather(u'Chomage', [u'plafond'], dates, with_abolished = True)
+        self.assertEqual(values[0, 1:3].tolist(), [1000.0, 1100.0])
+        self.assertEqual(abolished.tolist(), [[False, False, False, True]])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            self.client.gather(u'Chomage', [u'inconnu'], dates)
+        with self.assertRaises(ValueError):
+            self.client.gather(u'Retraite', [u'taux'], dates)
+        # The connection is still usable after an error.
+        self.assertEqual(self.client.health()['baremes'], [u'Chomage'])
+
+    def test_health_and_metrics(self):
+        self.assertEqual(self.client.health()['baremes'], [u'Chomage'])
+        self.client.gather(u'Chomage', [u'taux', u'plafond'], dates)
+        with self.assertRaises(ValueError):
+            self.client.request(dict(method = 'inconnue'))
+        metrics = self.client.metrics()
+        self.assertEqual(metrics['errors'], 1)
+        self.assertEqual(metrics['gathered_values'], 8)
+        # The metrics request is counted once answered.
+        self.assertEqual(metrics['requests'], 3)
+        self.assertEqual(metrics['requests_by_method'], dict(gather = 1, health = 1, inconnue = 1))
+        self.assertEqual(metrics['change_points_by_bareme'], dict(Chomage = 4))
+        self.assertEqual(metrics['parameters_by_bareme'], dict(Chomage = 2))
+
+
+class LocalClientTestCase(ClientTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.client = parameter_server.LocalClient(build_service())
+
+    def tearDown(self):
+        self.client.close()
+
+
+class ClientTestCase(ClientTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        socket_path = os.path.join(self.dir, 'parameter_server.sock')
+        self.server = parameter_server.UnixServer(socket_path, parameter_server.RequestHandler)
+        self.server.service = build_service()
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.client = parameter_server.Client(socket_path)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the change-point parameter store."""
+
+
+import datetime
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import parameter_store
+
+
+def build_store():
+    return parameter_store.ParameterStore.from_vectors(
+        dict(
+            plafond = pd.Series(
+                [1000, None, 1200, 1200, u'nc', 1250, u'-'],
+                index = [
+                    datetime.date(2010, 1, 1),
+                    datetime.date(2010, 6, 1),
+                    datetime.date(2011, 1, 1),
+                    datetime.date(2012, 1, 1),
+                    datetime.date(2012, 6, 1),
+                    # Duplicate date: the last row wins.
+                    datetime.date(2013, 1, 1),
+                    datetime.date(2013, 1, 1),
+                    ],
+                dtype = object,
+                ),
+            taux = pd.Series([0.05, 0.075], index = [datetime.date(2012, 1, 1), datetime.date(2005, 1, 1)]),
+            ),
+        dict(plafond = u'EUR', taux = u'%'),
+        )
+
+
+class ParameterStoreTestCase(unittest.TestCase):
+    def test_change_points(self):
+        store = build_store()
+        self.assertEqual(store.names, [u'plafond', u'taux'])
+        dates, values, abolished = store.get_change_points(u'plafond')
+        self.assertEqual(dates.tolist(), [datetime.date(2010, 1, 1), datetime.date(2011, 1, 1),
+            datetime.date(2013, 1, 1)])
+        self.assertEqual(values[:2].tolist(), [1000.0, 1200.0])
+        self.assertEqual(abolished.tolist(), [False, False, True])
+        # Unsorted rows are sorted by date.
+        dates, values, abolished = store.get_change_points(u'taux')
+        self.assertEqual(dates.tolist(), [datetime.date(2005, 1, 1), datetime.date(2012, 1, 1)])
+        self.assertEqual(values.tolist(), [0.075, 0.05])
+
+    def test_get_and_gather(self):
+        store = build_store()
+        self.assertIsNone(store.get(u'plafond', u'2009-12'))
+        self.assertEqual(store.get(u'plafond', u'2010-06-15'), 1000.0)
+        self.assertEqual(store.get(u'plafond', datetime.date(2012, 12, 31)), 1200.0)
+        self.assertEqual(store.get(u'plafond', u'2014'), parameter_store.abolished_value)
+        values, abolished = store.gather(u'plafond', ['2009-01-01', '2011-01-01', '2013-01-01'],
+            with_abolished = True)
+        self.assertTrue(np.isnan(values[0]))
+        self.assertEqual(values[1], 1200.0)
+        self.assertTrue(np.isnan(values[2]))
+        self.assertEqual(abolished.tolist(), [False, False, True])
+        values = store.gather_many([u'taux', u'plafond'], ['2011-01-01'])
+        self.assertEqual(values.tolist(), [[0.075], [1200.0]])
+
+    def test_save_and_load(self):
+        store = build_store()
+        dir = tempfile.mkdtemp()
+        try:
+            store.save(dir)
+            loaded_store = parameter_store.ParameterStore.load(dir)
+            self.assertEqual(loaded_store.names, store.names)
+            self.assertEqual(loaded_store.get_unit(u'taux'), u'%')
+            self.assertEqual(loaded_store.get(u'taux', u'2012-02'), 0.05)
+            self.assertEqual(loaded_store.get_digest(u'plafond'), store.get_digest(u'plafond'))
+            self.assertNotEqual(loaded_store.get_digest(u'plafond'), store.get_digest(u'taux'))
+            del loaded_store
+        finally:
+            shutil.rmtree(dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the conversion of the cells of the IPP tax and benefit tables."""
+
+
+import datetime
+import unittest
+
+import parse_ipp_tax_benefit_tables as parser
+
+
+class CellToDateOrYearTestCase(unittest.TestCase):
+    def setUp(self):
+        parser.date_or_year_by_cell.clear()
+
+    def test_same_as_biryani(self):
+        for cell in (
+                None,
+                1914,
+                2020,
+                1913,
+                u'1/7/1945',
+                u'01/07/1945',
+                u'31/12/2010',
+                u'1945-07-01',
+                u'1945-7-1',
+                u'Texte',
+                3.5,
+                ):
+            value, error = parser.fast_cell_to_date_or_year(cell)
+            expected_value, expected_error = parser.cell_to_date_or_year(cell, state = parser.conv.default_state)
+            self.assertEqual(value, expected_value, cell)
+            self.assertEqual(error is None, expected_error is None, cell)
+            # The memoized result is the same.
+            self.assertEqual(parser.fast_cell_to_date_or_year(cell), (value, error))
+
+    def test_dates(self):
+        self.assertEqual(parser.fast_cell_to_date_or_year(1945), (datetime.date(1945, 1, 1), None))
+        # The biryani converters raise on a year given as text.
+        self.assertEqual(parser.fast_cell_to_date_or_year(u'1945'), (datetime.date(1945, 1, 1), None))
+        self.assertEqual(parser.fast_cell_to_date_or_year(u'1/7/1945'), (datetime.date(1945, 7, 1), None))
+        self.assertEqual(parser.fast_cell_to_date_or_year(u'1945-07-01'), (datetime.date(1945, 7, 1), None))
+
+    def test_invalid_dates(self):
+        for cell in (u'31/02/2010', u'2010-02-31'):
+            value, error = parser.fast_cell_to_date_or_year(cell)
+            self.assertEqual(value, cell)
+            self.assertIsNotNone(error)
+
+    def test_cache_max_size(self):
+        date_or_year_cache_max_size = parser.date_or_year_cache_max_size
+        parser.date_or_year_cache_max_size = 2
+        try:
+            for year in (1945, 1946, 1947):
+                parser.fast_cell_to_date_or_year(year)
+            self.assertEqual(len(parser.date_or_year_by_cell), 1)
+        finally:
+            parser.date_or_year_cache_max_size = date_or_year_cache_max_size
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the profiles of the parsing of IPP workbooks."""
+
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import parse_ipp_tax_benefit_tables as parser
+import profiling
+
+
+xls_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Baremes_IPP', 'Baremes IPP - Chomage.xls')
+
+
+class ProfileTestCase(unittest.TestCase):
+    def test_stages_and_counters(self):
+        profile = profiling.Profile(bareme = u'Chomage')
+        with profile.stage('open'):
+            pass
+        profile.add_time('open', profiling.timer())
+        profile.count('cells_decoded', 10)
+        profile.count('frf_conversions')
+        profile_json = profile.to_json()
+        self.assertEqual(profile_json['bareme'], u'Chomage')
+        self.assertEqual(profile_json['seconds_by_stage'].keys(), ['open'])
+        self.assertEqual(profile_json['counters'].keys(), list(profiling.counter_names))
+        self.assertEqual(profile_json['counters']['cells_decoded'], 10)
+        self.assertEqual(profile_json['counters']['frf_conversions'], 1)
+        self.assertNotIn('sheets', profile_json)
+
+    def test_merge_and_add_totals(self):
+        sheet_profile = profiling.Profile(sheet = u'Sheet')
+        sheet_profile.seconds_by_stage['decoding'] = 2
+        sheet_profile.count('cells_decoded', 10)
+        worker_profile = profiling.Profile()
+        worker_profile.seconds_by_stage['open'] = 1
+        worker_profile.count('cells_decoded', 1)
+        worker_profile.children.append(sheet_profile.to_json())
+        profile = profiling.Profile(bareme = u'Chomage')
+        profile.seconds_by_stage['open'] = 3
+        profile.merge(worker_profile.to_json())
+        profile_json = profiling.add_totals(profile.to_json())
+        self.assertEqual(profile_json['seconds_by_stage'], dict(decoding = 2, open = 4))
+        self.assertEqual(profile_json['seconds'], 6)
+        self.assertEqual(profile_json['counters']['cells_decoded'], 11)
+        self.assertEqual(profile_json['sheets'][0]['seconds'], 2)
+
+
+class ParseWorkbookProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_parse_workbook_sheets(self):
+        sheet_names = parser.list_sheet_names(xls_path, u'Chomage')
+        vectors_by_sheet_name, profile_json = parser.parse_workbook_sheets(xls_path, u'Chomage', sheet_names,
+            profile = True)
+        # Profiling does not change the vectors.
+        self.assertEqual(
+            [
+                (sheet_name, parser.serialize_vectors(vectors))
+                for sheet_name, vectors in vectors_by_sheet_name
+                ],
+            [
+                (sheet_name, parser.serialize_vectors(vectors))
+                for sheet_name, vectors in parser.parse_workbook_sheets(xls_path, u'Chomage', sheet_names)
+                ],
+            )
+        self.assertIn('open', profile_json['seconds_by_stage'])
+        self.assertEqual([sheet_json['sheet'] for sheet_json in profile_json['sheets']], sheet_names)
+        for sheet_json in profile_json['sheets']:
+            self.assertIn('decoding', sheet_json['seconds_by_stage'])
+            self.assertIn('vectors', sheet_json['seconds_by_stage'])
+            self.assertGreater(sheet_json['counters']['cells_decoded'], 0)
+        workbook_profile = profiling.Profile(bareme = u'Chomage')
+        workbook_profile.merge(profile_json)
+        report_path = os.path.join(self.dir, 'report.json')
+        profiling.write_report(report_path, [workbook_profile], 1.5)
+        with io.open(report_path, encoding = 'utf-8') as report_file:
+            report = json.load(report_file)
+        self.assertEqual(report['seconds'], 1.5)
+        self.assertGreater(report['peak_rss'], 0)
+        workbook_json, = report['workbooks']
+        self.assertEqual(workbook_json['counters']['cells_decoded'], sum(
+            sheet_json['counters']['cells_decoded']
+            for sheet_json in profile_json['sheets']
+            ))
+        sheet_seconds = [sheet_json['seconds'] for sheet_json in workbook_json['sheets']]
+        self.assertEqual(sheet_seconds, sorted(sheet_seconds, reverse = True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the generated Python package of the parameters of a bareme."""
+
+
+import datetime
+import shutil
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+import python_output
+
+
+def build_vectors_by_sheet_name():
+    dates = [datetime.date(2010, 1, 1), datetime.date(2011, 1, 1), datetime.date(2012, 7, 1)]
+    return [
+        (u'Allocations familiales', [
+            (u'af_maj', pd.Series([100, 100, 110.5], index = dates), u'EUR'),
+            (u'af_taux', pd.Series([0.32, None, u'-'], index = dates, dtype = object), u'%'),
+            ]),
+        # A sheet whose name is not an identifier, and a parameter in two sheets.
+        (u'Get', [
+            (u'af_maj', pd.Series([120], index = dates[:1]), u'EUR'),
+            (u'for', pd.Series([1], index = dates[:1]), u'EUR'),
+            ]),
+        ]
+
+
+class PythonOutputTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.package_path = python_output.write_package(build_vectors_by_sheet_name(), self.dir, u'Prestations')
+        sys.path.insert(0, self.dir)
+
+    def tearDown(self):
+        sys.path.remove(self.dir)
+        for module_name in sys.modules.keys():
+            if module_name.split('.')[0] == 'ipp_prestations':
+                del sys.modules[module_name]
+        shutil.rmtree(self.dir)
+
+    def test_module_names(self):
+        self.assertEqual(python_output.get_package_name(u'Impôt Revenu'), u'ipp_impot_revenu')
+        self.assertEqual(python_output.to_module_name(u'Get', set()), u'sheet_get')
+        self.assertEqual(python_output.to_module_name(u'A-B', set([u'a_b'])), u'a_b_2')
+
+    def test_import(self):
+        import ipp_prestations
+        self.assertEqual(ipp_prestations.bareme, u'Prestations')
+        self.assertEqual(ipp_prestations.sheet_name_by_module_name, dict(
+            allocations_familiales = u'Allocations familiales',
+            sheet_get = u'Get',
+            ))
+        # Sheet modules are imported on first access.
+        self.assertNotIn('ipp_prestations.allocations_familiales', sys.modules)
+        self.assertEqual(ipp_prestations.get(u'af_taux'), (u'%', ('2010-01-01', '2012-07-01'), (0.32, u'-')))
+        self.assertIn('ipp_prestations.allocations_familiales', sys.modules)
+        self.assertEqual(ipp_prestations.allocations_familiales.sheet_name, u'Allocations familiales')
+        self.assertEqual(ipp_prestations.af_taux, ipp_prestations.get(u'af_taux'))
+        # The parameter of the last sheet wins.
+        self.assertEqual(ipp_prestations.af_maj, (u'EUR', ('2010-01-01', ), (120.0, )))
+        self.assertEqual(ipp_prestations.allocations_familiales.af_maj,
+            (u'EUR', ('2010-01-01', '2012-07-01'), (100.0, 110.5)))
+        # A parameter that is a keyword is only in parameter_by_taxipp_name.
+        self.assertEqual(ipp_prestations.get(u'for'), (u'EUR', ('2010-01-01', ), (1.0, )))
+        with self.assertRaises(AttributeError):
+            ipp_prestations.unknown
+
+    def test_value_at(self):
+        import ipp_prestations
+        self.assertIsNone(ipp_prestations.value_at(u'af_taux', u'2009-12-31'))
+        self.assertEqual(ipp_prestations.value_at(u'af_taux', u'2010'), 0.32)
+        self.assertEqual(ipp_prestations.value_at(u'af_taux', datetime.date(2012, 6, 30)), 0.32)
+        self.assertEqual(ipp_prestations.value_at(u'af_taux', u'2012-07'), ipp_prestations.abolished_value)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the differences between the parameters of two releases."""
+
+
+import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import parameter_store
+import release_diff
+
+
+dates = [datetime.date(2010, 1, 1), datetime.date(2011, 1, 1), datetime.date(2012, 1, 1)]
+
+
+def build_store(vector_by_taxipp_name, unit_by_taxipp_name = None):
+    return parameter_store.ParameterStore.from_vectors(
+        vector_by_taxipp_name,
+        unit_by_taxipp_name or dict((taxipp_name, u'EUR') for taxipp_name in vector_by_taxipp_name),
+        )
+
+
+class DiffStoresTestCase(unittest.TestCase):
+    def test_statuses(self):
+        old_store = build_store(dict(
+            abolished = pd.Series([1, 1, 1], index = dates),
+            removed = pd.Series([1, 1, 1], index = dates),
+            same = pd.Series([1, 2, u'-'], index = dates, dtype = object),
+            unit = pd.Series([1, 1, 1], index = dates),
+            value = pd.Series([1, 2, 3], index = dates),
+            ))
+        new_store = build_store(
+            dict(
+                abolished = pd.Series([1, 1, u'-'], index = dates, dtype = object),
+                added = pd.Series([1, 1, 1], index = dates),
+                # Repeated values and missing values are not change points.
+                same = pd.Series([1, np.nan, 2, u'-'], index = [dates[0], dates[1], dates[1], dates[2]],
+                    dtype = object),
+                unit = pd.Series([1, 1, 1], index = dates),
+                value = pd.Series([1, 2, 4], index = dates),
+                ),
+            dict(abolished = u'EUR', added = u'EUR', same = u'EUR', unit = u'%', value = u'EUR'),
+            )
+        self.assertEqual(release_diff.diff_stores(old_store, new_store), [
+            (u'abolished', 'modified', np.datetime64('2012-01-01')),
+            (u'added', 'added', None),
+            (u'removed', 'removed', None),
+            (u'unit', 'modified', None),
+            (u'value', 'modified', np.datetime64('2012-01-01')),
+            ])
+
+    def test_first_difference(self):
+        old_store = build_store(dict(taux = pd.Series([1, 2], index = dates[1:])))
+        # A value before the first change point of the old release.
+        new_store = build_store(dict(taux = pd.Series([0, 1, 3], index = dates)))
+        self.assertEqual(release_diff.find_first_difference(old_store, new_store, u'taux'),
+            np.datetime64('2010-01-01'))
+        self.assertIsNone(release_diff.find_first_difference(old_store, old_store, u'taux'))
+
+
+if __name__ == '__main__':
+    unittest.main()
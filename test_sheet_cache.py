@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the on-disk cache of parsed sheets, and of its use by parse_ipp_tax_benefit_tables."""
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import parse_ipp_tax_benefit_tables as parser
+import sheet_cache
+
+
+xls_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Baremes_IPP', 'Baremes IPP - Chomage.xls')
+
+
+class SheetCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = sheet_cache.SheetCache(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_get_and_set(self):
+        key = sheet_cache.make_key('sheet', u'Chomage', 0)
+        self.assertIsNone(self.cache.get(key))
+        self.cache.set(key, [(u'taux', [1, 2])])
+        self.assertEqual(self.cache.get(key), [(u'taux', [1, 2])])
+        self.assertEqual([file_name for file_name in os.listdir(self.dir)], ['{}.pickle'.format(key)])
+
+    def test_make_key(self):
+        key = sheet_cache.make_key('sheet', u'Chomage', 0)
+        self.assertEqual(sheet_cache.make_key('sheet', u'Chomage', 0), key)
+        self.assertNotEqual(sheet_cache.make_key('sheet', u'Chomage', 1), key)
+        parser_version = sheet_cache.parser_version
+        sheet_cache.parser_version += 1
+        try:
+            self.assertNotEqual(sheet_cache.make_key('sheet', u'Chomage', 0), key)
+        finally:
+            sheet_cache.parser_version = parser_version
+
+    def test_evict(self):
+        for index in range(3):
+            self.cache.set(str(index), u'x' * 1000)
+        now = time.time()
+        # Entry 0 is the least recently used one.
+        for index, age in enumerate((3000, 2000, 1000)):
+            os.utime(self.cache.get_file_path(str(index)), (now - age, now - age))
+        self.assertEqual(self.cache.evict(max_age = 2500), 1)
+        self.assertIsNone(self.cache.get('0'))
+        self.assertEqual(self.cache.evict(max_size = 1500), 1)
+        self.assertIsNone(self.cache.get('1'))
+        self.assertIsNotNone(self.cache.get('2'))
+
+
+class ParseWithCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.parse_sheet = parser.parse_sheet
+        self.parsed_sheet_names = []
+
+        def parse_sheet(book, bareme, sheet_name, *args, **kwargs):
+            self.parsed_sheet_names.append(sheet_name)
+            return self.parse_sheet(book, bareme, sheet_name, *args, **kwargs)
+
+        parser.parse_sheet = parse_sheet
+
+    def tearDown(self):
+        parser.parse_sheet = self.parse_sheet
+        shutil.rmtree(self.dir)
+
+    def parse(self, sheet_names):
+        return [
+            (sheet_name, [(taxipp_name, vector.to_dict(), unit) for taxipp_name, vector, unit in vectors])
+            for sheet_name, vectors in parser.parse_workbook_sheets(xls_path, u'Chomage', sheet_names,
+                cache_dir = self.dir)
+            ]
+
+    def test_hit_and_invalidation(self):
+        sheet_names = parser.list_sheet_names(xls_path, u'Chomage')
+        vectors_by_sheet_name = self.parse(sheet_names)
+        self.assertEqual(self.parsed_sheet_names, sheet_names)
+        # The workbook is unchanged: nothing is parsed again.
+        del self.parsed_sheet_names[:]
+        self.assertEqual(self.parse(sheet_names), vectors_by_sheet_name)
+        self.assertEqual(self.parsed_sheet_names, [])
+        # Another selection of sheets misses the workbook entry, but hits the entries of its sheets.
+        self.assertEqual(self.parse(sheet_names[:2]), vectors_by_sheet_name[:2])
+        self.assertEqual(self.parsed_sheet_names, [])
+        # A new version of the parser invalidates every entry.
+        parser_version = sheet_cache.parser_version
+        sheet_cache.parser_version += 1
+        try:
+            self.assertEqual(self.parse(sheet_names), vectors_by_sheet_name)
+        finally:
+            sheet_cache.parser_version = parser_version
+        self.assertEqual(self.parsed_sheet_names, sheet_names)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the schedules built from a parameter store."""
+
+
+import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import parameter_store
+import tax_schedule
+
+
+def build_store():
+    dates = [datetime.date(2010, 1, 1), datetime.date(2012, 1, 1)]
+    vector_by_taxipp_name = dict(
+        cnav_s_0_1 = pd.Series([0.0665, 0.0675], index = dates),
+        cnav_s_0_ = pd.Series([0.001, 0.001], index = dates),
+        ret_plib_0_85 = pd.Series([0.1, 0.1], index = dates),
+        tranche1 = pd.Series([0, 0], index = dates),
+        tranche2 = pd.Series([10000, 11000], index = dates),
+        tranche3 = pd.Series([20000, 22000], index = dates),
+        # A stale bracket, then an abolished one
+        tranche4 = pd.Series([15000, u'-'], index = dates, dtype = object),
+        # A bracket whose rate is abolished, but whose threshold continues
+        tranche5 = pd.Series([30000, 30000], index = dates),
+        txmarg1 = pd.Series([0, 0], index = dates),
+        txmarg2 = pd.Series([0.1, 0.1], index = dates),
+        txmarg3 = pd.Series([0.3, 0.3], index = dates),
+        txmarg4 = pd.Series([0.4, u'-'], index = dates, dtype = object),
+        txmarg5 = pd.Series([0.5, u'-'], index = dates, dtype = object),
+        )
+    unit_by_taxipp_name = dict(
+        (taxipp_name, u'%' if taxipp_name.startswith((u'cnav', u'ret', u'txmarg')) else u'EUR')
+        for taxipp_name in vector_by_taxipp_name
+        )
+    return parameter_store.ParameterStore.from_vectors(vector_by_taxipp_name, unit_by_taxipp_name)
+
+
+class ScheduleTestCase(unittest.TestCase):
+    def test_tax(self):
+        schedule = tax_schedule.Schedule([0, 10000, 20000], [0, 0.1, 0.3])
+        incomes = np.array([-5, 5000, 15000, 25000])
+        self.assertEqual(schedule.tax(incomes).tolist(), [0, 0, 500, 2500])
+        self.assertEqual(schedule.marginal_rate(incomes).tolist(), [0, 0, 0.1, 0.3])
+        self.assertEqual(schedule.average_rate(incomes).tolist(), [0, 0, 500.0 / 15000, 0.1])
+
+    def test_from_brackets(self):
+        schedule = tax_schedule.Schedule.from_brackets([(0, 1, 0.1), (0, np.inf, 0.01), (0.5, 2, 0.2)])
+        self.assertEqual(schedule.thresholds.tolist(), [0, 0.5, 1, 2])
+        self.assertTrue(np.allclose(schedule.rates, [0.11, 0.31, 0.21, 0.01]))
+
+    def test_increasing_thresholds(self):
+        with self.assertRaises(ValueError):
+            tax_schedule.Schedule([0, 10000, 10000], [0, 0.1, 0.3])
+
+
+class BuildSchedulesTestCase(unittest.TestCase):
+    def test_income_tax(self):
+        store = build_store()
+        schedule_by_name = tax_schedule.build_schedules(store, u'2011-06')
+        # tranche4 is below tranche3, so it is ignored.
+        self.assertEqual(schedule_by_name[u'txmarg'].thresholds.tolist(), [0, 10000, 20000, 30000])
+        self.assertEqual(schedule_by_name[u'txmarg'].rates.tolist(), [0, 0.1, 0.3, 0.5])
+        schedule_by_name = tax_schedule.build_schedules(store, u'2012-06')
+        # Abolished brackets are left out.
+        self.assertEqual(schedule_by_name[u'txmarg'].thresholds.tolist(), [0, 11000, 22000])
+
+    def test_contributions(self):
+        store = build_store()
+        schedule_by_name = tax_schedule.build_schedules(store, u'2012-06', ceiling = 1000)
+        self.assertEqual(schedule_by_name[u'cnav_s'].thresholds.tolist(), [0, 1000])
+        self.assertTrue(np.allclose(schedule_by_name[u'cnav_s'].rates, [0.0685, 0.001]))
+        self.assertEqual(schedule_by_name[u'ret_plib'].thresholds.tolist(), [0, 850])
+        self.assertTrue(np.allclose(schedule_by_name[u'ret_plib'].tax([2000]), [85]))
+
+
+if __name__ == '__main__':
+    unittest.main()
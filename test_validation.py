@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the validation of the parameters parsed from IPP workbooks."""
+
+
+import datetime
+import unittest
+
+import pandas as pd
+
+import parameter_grid
+import validation
+
+
+class ValidateSheetsTestCase(unittest.TestCase):
+    def test_dates_and_years(self):
+        # Rows are sorted from the most recent one, except 2005, and 2008 is repeated.
+        dates = [datetime.date(year, 1, 1) for year in (2010, 2008, 2008, 2005, 2009, 1890, 3000)]
+        issues = validation.validate_sheets(u'Chomage', [
+            (u'ARE', [(u'are_taux', pd.Series(range(len(dates)), index = dates), u'%')]),
+            ])
+        self.assertEqual(
+            [(issue['severity'], issue['check'], issue['date']) for issue in issues],
+            [
+                ('warning', 'years', u'1890-01-01'),
+                ('error', 'years', u'3000-01-01'),
+                ('warning', 'dates', u'2008-01-01'),
+                ('warning', 'dates', u'2009-01-01'),
+                ('warning', 'dates', u'3000-01-01'),
+                ],
+            )
+        self.assertEqual(issues[2]['message'], u'Duplicate date, the value of the last row is kept')
+        self.assertEqual(validation.format_issue(issues[3]),
+            u'dates Chomage / ARE at 2009-01-01: Date out of the descending order of the sheet, after 2005-01-01')
+
+    def test_units_and_names(self):
+        dates = [datetime.date(2010, 1, 1)]
+        issues = validation.validate_sheets(u'Chomage', [
+            (u'ARE', [
+                (u'are_taux', pd.Series([1], index = dates), u'%'),
+                (u'are_plaf', pd.Series([1], index = dates), False),
+                ]),
+            (u'Empty', []),
+            (u'ASS', [(u'are_taux', pd.Series([1], index = dates), u'%')]),
+            ])
+        self.assertEqual(
+            [(issue['severity'], issue['check'], issue['sheet'], issue['parameter']) for issue in issues],
+            [
+                ('error', 'number_format', u'ARE', u'are_plaf'),
+                ('warning', 'duplicate_name', u'ASS', u'are_taux'),
+                ],
+            )
+        self.assertEqual(validation.format_issue(issues[1]),
+            u'duplicate_name Chomage / ASS / are_taux: Duplicate taxipp_name, overriding the one of sheet ARE')
+
+
+class ValidateGridTestCase(unittest.TestCase):
+    def test_rates(self):
+        dates = [datetime.date(2010, 1, 1), datetime.date(2010, 7, 1)]
+        grid = parameter_grid.ParameterGrid.from_vectors(
+            dict(
+                ok_taux = pd.Series([0.5, 1], index = dates),
+                pct = pd.Series([0.5, 5.5], index = dates),
+                tx_plein = pd.Series([50, 150], index = dates),
+                ),
+            dict(ok_taux = u'%', pct = u'%', tx_plein = None),
+            ).fill()
+        issues = validation.validate_grid(u'Impot Revenu', grid)
+        self.assertEqual(
+            sorted((issue['check'], issue['parameter'], issue['date']) for issue in issues),
+            [('rate', u'pct', u'2010-07-01'), ('rate', u'tx_plein', u'2010-07-01')],
+            )
+        issue, = [issue for issue in issues if issue['parameter'] == u'pct']
+        self.assertEqual(issue['message'], u'Rate out of [0, 1] during 6 months, from 5.5 to 5.5')
+
+    def test_currency_jump(self):
+        dates = [datetime.date(2001, 1, 1), datetime.date(2002, 1, 1)]
+        grid = parameter_grid.ParameterGrid.from_vectors(
+            dict(
+                # An amount left in FRF before 2002
+                frf = pd.Series([655.957, 100], index = dates),
+                eur = pd.Series([100, 102], index = dates),
+                ),
+            dict(eur = u'EUR', frf = u'EUR'),
+            ).fill()
+        issues = validation.validate_grid(u'Prestations', grid)
+        self.assertEqual([(issue['check'], issue['parameter'], issue['date']) for issue in issues],
+            [('currency_jump', u'frf', u'2002-01-01')])
+
+
+if __name__ == '__main__':
+    unittest.main()
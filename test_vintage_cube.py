@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the cube of the parameters of a bareme in several releases."""
+
+
+import collections
+import datetime
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import parameter_store
+import vintage_cube
+
+
+dates = [datetime.date(2010, 1, 1), datetime.date(2011, 1, 1), datetime.date(2012, 1, 1)]
+
+
+def build_store_by_release():
+    return collections.OrderedDict((
+        (u'2015', parameter_store.ParameterStore.from_vectors(
+            dict(
+                af_maj = pd.Series([100, 110], index = dates[:2]),
+                af_taux = pd.Series([0.32, u'-'], index = dates[:2], dtype = object),
+                ),
+            dict(af_maj = u'EUR', af_taux = u'%'),
+            )),
+        (u'2016', parameter_store.ParameterStore.from_vectors(
+            dict(
+                af_maj = pd.Series([100, 110, 120], index = dates),
+                af_plaf = pd.Series([5000], index = dates[:1]),
+                af_taux = pd.Series([0.32, u'-'], index = dates[:2], dtype = object),
+                ),
+            dict(af_maj = u'EUR', af_plaf = u'EUR', af_taux = u'%'),
+            )),
+        ))
+
+
+class VintageCubeTestCase(unittest.TestCase):
+    def test_shared_vectors(self):
+        cube = vintage_cube.VintageCube.from_stores(build_store_by_release())
+        self.assertEqual(cube.names, [u'af_maj', u'af_plaf', u'af_taux'])
+        self.assertEqual(len(cube), 3)
+        # af_taux is unchanged, so both releases share its vector.
+        self.assertEqual(len(cube.offsets) - 1, 4)
+        self.assertEqual(cube.vector_ids[0, 2], cube.vector_ids[1, 2])
+        self.assertEqual(cube.vector_ids[0, 1], -1)
+        self.assertIsNone(cube.get_change_points(u'af_plaf', u'2015'))
+
+    def test_gather(self):
+        cube = vintage_cube.VintageCube.from_stores(build_store_by_release())
+        gather_dates = np.array(['2009-12-01', '2011-06-01', '2012-06-01'], dtype = 'datetime64[D]')
+        values, abolished = cube.gather(u'af_maj', gather_dates, with_abolished = True)
+        self.assertTrue(np.allclose(values, [[np.nan, 110, 110], [np.nan, 110, 120]], equal_nan = True))
+        self.assertFalse(abolished.any())
+        values, abolished = cube.gather(u'af_taux', gather_dates, with_abolished = True)
+        self.assertEqual(abolished.tolist(), [[False, True, True], [False, True, True]])
+        self.assertTrue(np.isnan(cube.gather(u'af_plaf', gather_dates)[0]).all())
+        values = cube.gather_cube(gather_dates)
+        self.assertEqual(values.shape, (2, 3, 3))
+        self.assertEqual(values[1, 2, 1], 5000)
+
+    def test_get_store(self):
+        store_by_release = build_store_by_release()
+        cube = vintage_cube.VintageCube.from_stores(store_by_release)
+        for release, store in store_by_release.iteritems():
+            cube_store = cube.get_store(release)
+            self.assertEqual(list(cube_store.names), sorted(store.names))
+            for name in store.names:
+                self.assertEqual(cube_store.get_digest(name), store.get_digest(name))
+        self.assertEqual(cube.get_store(u'2016').get(u'af_maj', u'2012-06'), 120)
+
+    def test_save_and_load(self):
+        cube = vintage_cube.VintageCube.from_stores(build_store_by_release())
+        dir = tempfile.mkdtemp()
+        try:
+            cube.save(dir)
+            loaded_cube = vintage_cube.VintageCube.load(dir, mmap_mode = None)
+        finally:
+            shutil.rmtree(dir)
+        self.assertEqual(loaded_cube.releases, cube.releases)
+        self.assertEqual(loaded_cube.vector_ids.tolist(), cube.vector_ids.tolist())
+        gather_dates = np.array(['2010-06-01', '2012-06-01'], dtype = 'datetime64[D]')
+        self.assertTrue(np.allclose(loaded_cube.gather_cube(gather_dates), cube.gather_cube(gather_dates),
+            equal_nan = True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+
+"""Tests of the streaming reader of XLSX workbooks, on a workbook written by the test."""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import xlsx_reader
+
+
+parts = {
+    'xl/_rels/workbook.xml.rels': u"""<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+  <Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+    Target="worksheets/sheet1.xml"/>
+</Relationships>""",
+    'xl/sharedStrings.xml': u"""<?xml version="1.0" encoding="UTF-8"?>
+<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+  <si><t>Date</t></si>
+  <si><r><t>Taux </t></r><r><t>réduit</t></r><rPh><t>phonetic</t></rPh></si>
+</sst>""",
+    'xl/styles.xml': u"""<?xml version="1.0" encoding="UTF-8"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+  <numFmts count="2">
+    <numFmt numFmtId="164" formatCode="0.00%"/>
+    <numFmt numFmtId="165" formatCode="dd/mm/yyyy"/>
+  </numFmts>
+  <cellXfs count="3">
+    <xf numFmtId="0"/>
+    <xf numFmtId="164"/>
+    <xf numFmtId="165"/>
+  </cellXfs>
+</styleSheet>""",
+    'xl/workbook.xml': u"""<?xml version="1.0" encoding="UTF-8"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+  <sheets><sheet name="Réduction" sheetId="1" r:id="rId1"/></sheets>
+</workbook>""",
+    # B1:C1 is merged, row 3 is missing and D4 is a boolean. XAA2 and row 5 only have a style, so they are out of the
+    # dimensions of the sheet.
+    'xl/worksheets/sheet1.xml': u"""<?xml version="1.0" encoding="UTF-8"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+  <sheetData>
+    <row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c></row>
+    <row r="2">
+      <c r="A2" s="2"><v>40179</v></c><c r="B2" s="1"><v>0.055</v></c><c r="C2" t="inlineStr"><is><t>nc</t></is></c>
+      <c r="XAA2" s="1"/>
+    </row>
+    <row r="4"><c r="A4" s="1"/><c r="D4" t="b"><v>1</v></c></row>
+    <row r="5"><c r="A5" s="1"/><c r="B5" s="1"><v></v></c></row>
+  </sheetData>
+  <mergeCells count="1"><mergeCell ref="B1:C1"/></mergeCells>
+</worksheet>""",
+    }
+
+
+class XlsxWorkbookTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'workbook.xlsx')
+        with zipfile.ZipFile(self.path, 'w') as zip_file:
+            for part_path, text in sorted(parts.iteritems()):
+                zip_file.writestr(part_path, text.encode('utf-8'))
+        self.workbook = xlsx_reader.XlsxWorkbook(self.path)
+
+    def tearDown(self):
+        self.workbook.close()
+        shutil.rmtree(self.dir)
+
+    def test_iter_sheet_rows(self):
+        rows = list(self.workbook.iter_sheet_rows(u'Réduction'))
+        self.assertEqual(rows, [
+            [(1, u'Date', 0), (1, u'Taux réduit', 0), (1, u'Taux réduit', 0), (0, u'', 0)],
+            [(3, 40179.0, 2), (2, 0.055, 1), (1, u'nc', 0), (0, u'', 0)],
+            [(0, u'', 0)] * 4,
+            [(6, u'', 1), (0, u'', 0), (0, u'', 0), (4, 1, 0)],
+            ])
+        self.assertEqual(self.workbook.merged_cells_by_sheet_name[u'Réduction'], [(0, 1, 1, 3)])
+
+    def test_read_sheet_dimensions(self):
+        self.assertEqual(self.workbook.read_sheet_dimensions(self.workbook.part_path_by_sheet_name[u'Réduction']),
+            (4, 4, [(0, 1, 1, 3)]))
+
+    def test_styles(self):
+        self.assertEqual(self.workbook.sheet_names(), [u'Réduction'])
+        self.assertEqual(self.workbook.format_str_by_xf_index, [u'General', u'0.00%', u'dd/mm/yyyy'])
+        self.assertEqual(self.workbook.is_date_by_xf_index, [False, False, True])
+
+    def test_column_index_from_letters(self):
+        self.assertEqual(xlsx_reader.column_index_from_letters('A'), 0)
+        self.assertEqual(xlsx_reader.column_index_from_letters('Z'), 25)
+        self.assertEqual(xlsx_reader.column_index_from_letters('AB'), 27)
+
+
+if __name__ == '__main__':
+    unittest.main()
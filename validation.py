@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+
+"""Validation of the parameters parsed from IPP workbooks, collecting every issue instead of stopping at the first.
+
+An issue is a dict with its severity ('error' or 'warning'), its check, its bareme, sheet, parameter and date (each
+None when it doesn't apply) and a message. Errors are the problems that used to stop a run: years after max_year and
+unexpected number formats. The checks are:
+- dates: duplicate dates and dates out of the order of the other rows of a sheet, whose vectors are sorted by the grid;
+- years: years of rows out of year_range, an error after max_year;
+- number_format: cells whose number format is neither a plain number, nor EUR, FRF or %;
+- duplicate_name: taxipp_name found in several columns, the last one being kept;
+- rate: rates out of [0, 1] for a '%' unit, or out of [0, 100] for a rate without unit;
+- currency_jump: EUR amounts whose magnitude jumps around the introduction of the new franc or of the euro, hinting at
+  a wrong conversion of FRF amounts.
+
+Sheets are checked on the dates of their rows and the units of their vectors, and baremes on their filled
+ParameterGrid, with array operations over all their parameters at once.
+"""
+
+
+import collections
+import datetime
+import re
+
+import numpy as np
+
+
+# Months when the FRF amounts change of magnitude: new franc (100 old francs) and euro (6.55957 francs)
+currency_change_dates = (datetime.date(1960, 1, 1), datetime.date(2002, 1, 1))
+# Months compared before and after each currency change date
+currency_window_months = 12
+# Last year accepted by the parser before validation: later years are errors
+max_year = 2600
+# Minimum ratio between the amounts after and before a currency change date (or conversely) to report a jump
+magnitude_jump_ratio = 5.0
+rate_name_re = re.compile(ur'(tx|taux)(_|\d|$)')
+severity_by_check = dict(
+    currency_jump = 'warning',
+    dates = 'warning',
+    duplicate_name = 'warning',
+    number_format = 'error',
+    rate = 'warning',
+    years = 'warning',
+    )
+# Years of the IPP tables, out of which a year is probably a typo
+year_range = (1900, 2100)
+
+
+def format_issue(issue):
+    """Return an issue as a line of text, e.g. "dates Chomage / SR 61 at 1969-07-01: Date out of..."."""
+    return u'{} {}{}{}: {}'.format(
+        issue['check'],
+        issue['bareme'],
+        u''.join(u' / {}'.format(issue[key]) for key in ('sheet', 'parameter') if issue[key] is not None),
+        u' at {}'.format(issue['date']) if issue['date'] is not None else u'',
+        issue['message'],
+        )
+
+
+def make_issue(check, bareme, message, sheet_name = None, taxipp_name = None, date = None, severity = None):
+    return collections.OrderedDict((
+        ('severity', severity or severity_by_check[check]),
+        ('check', check),
+        ('bareme', bareme),
+        ('sheet', sheet_name),
+        ('parameter', taxipp_name),
+        ('date', None if date is None else unicode(date)),
+        ('message', message),
+        ))
+
+
+def validate_grid(bareme, grid):
+    """Check the rates and the EUR amounts of a filled ParameterGrid of a bareme, and return the issues."""
+    issues = []
+    if not len(grid.dates):
+        return issues
+    months = grid.dates.astype('datetime64[M]')
+    units = np.array(grid.units, dtype = object)
+    percent_columns = units == u'%'
+    rate_columns = np.array([
+        unit is None and rate_name_re.match(taxipp_name) is not None
+        for taxipp_name, unit in zip(grid.names, grid.units)
+        ], dtype = np.bool_)
+    with np.errstate(invalid = 'ignore'):
+        out_of_range = np.where(percent_columns, (grid.values < 0) | (grid.values > 1),
+            rate_columns & ((grid.values < 0) | (grid.values > 100)))
+    for column in np.flatnonzero(out_of_range.any(axis = 0)):
+        rows = np.flatnonzero(out_of_range[:, column])
+        issues.append(make_issue('rate', bareme,
+            u'Rate out of [0, {}] during {} months, from {} to {}'.format(
+                1 if percent_columns[column] else 100, len(rows), np.nanmin(grid.values[rows, column]),
+                np.nanmax(grid.values[rows, column])),
+            taxipp_name = grid.names[column], date = grid.dates[rows[0]]))
+
+    eur_columns = np.flatnonzero(units == u'EUR')
+    for change_date in currency_change_dates:
+        row = int((np.datetime64(change_date, 'M') - months[0]).astype(np.int64))
+        if row <= 0 or row >= len(months):
+            continue
+        values = grid.values[:, eur_columns]
+        with np.errstate(invalid = 'ignore'):
+            amounts = np.where(values > 0, values, np.nan)
+        before = amounts[max(0, row - currency_window_months):row]
+        after = amounts[row:row + currency_window_months]
+        known = ~np.isnan(before).all(axis = 0) & ~np.isnan(after).all(axis = 0)
+        before_min = np.fmin.reduce(before, axis = 0)
+        before_max = np.fmax.reduce(before, axis = 0)
+        after_min = np.fmin.reduce(after, axis = 0)
+        after_max = np.fmax.reduce(after, axis = 0)
+        with np.errstate(invalid = 'ignore'):
+            jumps = known & ((after_min >= before_max * magnitude_jump_ratio)
+                | (before_min >= after_max * magnitude_jump_ratio))
+        for index in np.flatnonzero(jumps):
+            issues.append(make_issue('currency_jump', bareme,
+                u'Amount jumping from {} to {} around {}: check the conversion of FRF amounts'.format(
+                    before_max[index] if after_min[index] > before_max[index] else before_min[index],
+                    after_min[index] if after_min[index] > before_max[index] else after_max[index],
+                    change_date),
+                taxipp_name = grid.names[eur_columns[index]], date = change_date))
+    return issues
+
+
+def validate_sheets(bareme, vectors_by_sheet_name):
+    """Check the (sheet_name, vectors) couples of a bareme, given by the parser, and return the issues.
+
+    The rows of a sheet are checked on the dates of its vectors, which are the same for all of them.
+    """
+    issues = []
+    sheet_name_by_taxipp_name = {}
+    for sheet_name, vectors in vectors_by_sheet_name:
+        if not vectors:
+            continue
+        months = np.array(vectors[0][1].index.tolist(), dtype = 'datetime64[M]')
+        years = months.astype('datetime64[Y]').astype(np.int64) + 1970
+        out_of_range = (years < year_range[0]) | (years > year_range[1])
+        for month, year in zip(months[out_of_range], years[out_of_range]):
+            issues.append(make_issue('years', bareme, u'Year out of [{}, {}]'.format(*year_range),
+                sheet_name = sheet_name, date = month.astype('datetime64[D]'),
+                severity = 'error' if year > max_year else None))
+        steps = np.diff(months.astype(np.int64))
+        sorted_months = np.sort(months)
+        for month in np.unique(sorted_months[1:][sorted_months[1:] == sorted_months[:-1]]):
+            issues.append(make_issue('dates', bareme, u'Duplicate date, the value of the last row is kept',
+                sheet_name = sheet_name, date = month.astype('datetime64[D]')))
+        # Rows are usually sorted from the most recent one, but check against the order of most rows.
+        direction = -1 if (steps < 0).sum() >= (steps > 0).sum() else 1
+        for month, previous_month in zip(months[1:][steps * direction < 0], months[:-1][steps * direction < 0]):
+            issues.append(make_issue('dates', bareme, u'Date out of the {} order of the sheet, after {}'.format(
+                u'descending' if direction < 0 else u'ascending', previous_month.astype('datetime64[D]')),
+                sheet_name = sheet_name, date = month.astype('datetime64[D]')))
+        for taxipp_name, vector, unit in vectors:
+            if unit is False:
+                issues.append(make_issue('number_format', bareme, u'Unexpected number format',
+                    sheet_name = sheet_name, taxipp_name = taxipp_name))
+            if taxipp_name in sheet_name_by_taxipp_name:
+                issues.append(make_issue('duplicate_name', bareme,
+                    u'Duplicate taxipp_name, overriding the one of sheet {}'.format(
+                        sheet_name_by_taxipp_name[taxipp_name]),
+                    sheet_name = sheet_name, taxipp_name = taxipp_name))
+            sheet_name_by_taxipp_name[taxipp_name] = sheet_name
+    return issues
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+
+"""Parameters of a bareme in several releases (vintages) of the IPP tables, as a release x month x parameter cube.
+
+The cube keeps change points, like a ParameterStore, but each distinct change points vector (with its unit) is stored
+only once: a parameter that doesn't change from a release to the next one reuses the vector of the previous release.
+A (releases, parameters) array gives the vector of each parameter in each release, -1 when the release doesn't have
+it. The vectors share flat arrays (dates, values and abolished flags), sliced by an offsets array, so that a saved
+cube can be memory-mapped.
+
+The values of the vectors at some dates are looked up at once, then spread to the releases & parameters using them:
+- gather gives a parameter as known in each release;
+- get_store gives the ParameterStore of all parameters as of a release;
+- gather_cube gives the (releases, dates, parameters) cube.
+"""
+
+
+import io
+import json
+import os
+
+import numpy as np
+
+import parameter_store
+
+
+# Dates (in days) are shifted by day_shift, to be positive, and vector ids are multiplied by vector_key_factor to
+# compute the keys of the change points, sorted in vector and date order.
+day_shift = 2 ** 31
+vector_key_factor = 2 ** 32
+
+
+class VintageCube(object):
+    def __init__(self, releases, names, vector_ids, offsets, dates, values, abolished, units):
+        self.abolished = abolished
+        self.dates = dates
+        self.index_by_name = dict((name, index) for index, name in enumerate(names))
+        self.index_by_release = dict((release, index) for index, release in enumerate(releases))
+        self.names = names
+        self.offsets = offsets
+        self.releases = releases
+        self.units = units
+        self.values = values
+        self.vector_ids = vector_ids
+        self._keys = None
+
+    def __contains__(self, name):
+        return name in self.index_by_name
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_stores(cls, store_by_release):
+        """Build a cube from an ordered dict of the ParameterStore of a bareme in each release, by release name.
+
+        Vectors are compared by their ParameterStore.get_digest.
+        """
+        releases = list(store_by_release)
+        names = sorted(set(name for store in store_by_release.itervalues() for name in store.names))
+        index_by_name = dict((name, index) for index, name in enumerate(names))
+        vector_ids = np.full((len(releases), len(names)), -1, dtype = np.int64)
+        vector_id_by_digest = {}
+        slices = []
+        units = []
+        for release_index, store in enumerate(store_by_release.itervalues()):
+            for name in store.names:
+                digest = store.get_digest(name)
+                vector_id = vector_id_by_digest.get(digest)
+                if vector_id is None:
+                    vector_id = vector_id_by_digest[digest] = len(slices)
+                    vector_start, vector_stop = store.get_bounds(name)
+                    slices.append((store, vector_start, vector_stop))
+                    units.append(store.get_unit(name))
+                vector_ids[release_index, index_by_name[name]] = vector_id
+        return cls(
+            releases,
+            names,
+            vector_ids,
+            np.cumsum([0] + [stop - start for store, start, stop in slices]).astype(np.int64),
+            np.concatenate([np.array([], dtype = 'datetime64[D]')] + [
+                store.dates[start:stop]
+                for store, start, stop in slices
+                ]).astype('datetime64[D]'),
+            np.concatenate([np.array([], dtype = np.float64)] + [
+                store.values[start:stop]
+                for store, start, stop in slices
+                ]).astype(np.float64),
+            np.concatenate([np.array([], dtype = np.bool_)] + [
+                store.abolished[start:stop]
+                for store, start, stop in slices
+                ]).astype(np.bool_),
+            units,
+            )
+
+    def gather(self, name, dates, with_abolished = False):
+        """Return the values of a parameter at each of the given dates as known in each release, as a (releases, dates)
+        float64 array.
+
+        The value is NaN in the releases without the parameter, before its first change point and when it is abolished.
+        When with_abolished is true, also return the boolean array of abolished flags.
+        """
+        return self.gather_vectors(self.vector_ids[:, self.index_by_name[name]], dates,
+            with_abolished = with_abolished)
+
+    def gather_cube(self, dates, with_abolished = False):
+        """Return the values of every parameter at each of the given dates in each release, as a (releases, dates,
+        parameters) float64 array.
+
+        See gather for the values and the with_abolished flag.
+        """
+        results = self.gather_vectors(self.vector_ids, dates, with_abolished = with_abolished)
+        if with_abolished:
+            return tuple(result.swapaxes(1, 2) for result in results)
+        return results.swapaxes(1, 2)
+
+    def gather_vectors(self, vector_ids, dates, with_abolished = False):
+        """Return the values of vectors at each of the given dates, as an array of the shape of vector_ids followed by
+        the dates.
+
+        Each distinct vector is looked up once, all at once. A vector id of -1 gives NaN values.
+        """
+        dates = np.asarray(dates, dtype = 'datetime64[D]')
+        vector_ids = np.asarray(vector_ids, dtype = np.int64)
+        unique_ids, inverse = np.unique(vector_ids, return_inverse = True)
+        known_ids = unique_ids[unique_ids >= 0]
+        queries = (known_ids[:, None] * vector_key_factor + dates.astype(np.int64) + day_shift)
+        positions = np.searchsorted(self.get_keys(), queries, side = 'right') - 1
+        found = positions >= self.offsets[known_ids][:, None]
+        positions = np.where(found, positions, 0)
+        shape = (len(unique_ids), ) + dates.shape
+        values = np.full(shape, np.nan)
+        abolished = np.zeros(shape, dtype = np.bool_)
+        if len(self.dates):
+            values[unique_ids >= 0] = np.where(found, self.values[positions], np.nan)
+            abolished[unique_ids >= 0] = found & self.abolished[positions]
+        shape = vector_ids.shape + dates.shape
+        values = values[inverse].reshape(shape)
+        if with_abolished:
+            return values, abolished[inverse].reshape(shape)
+        return values
+
+    def get_change_points(self, name, release):
+        """Return the (dates, values, abolished) arrays of a parameter as known in a release, or None when the release
+        doesn't have it."""
+        vector_id = int(self.vector_ids[self.index_by_release[release], self.index_by_name[name]])
+        if vector_id < 0:
+            return None
+        start, stop = int(self.offsets[vector_id]), int(self.offsets[vector_id + 1])
+        return self.dates[start:stop], self.values[start:stop], self.abolished[start:stop]
+
+    def get_keys(self):
+        """Return the keys of the change points, computed once: their vector id and their date, as sortable integers."""
+        if self._keys is None:
+            self._keys = (np.repeat(np.arange(len(self.offsets) - 1, dtype = np.int64), np.diff(self.offsets))
+                * vector_key_factor + self.dates.astype(np.int64) + day_shift)
+        return self._keys
+
+    def get_store(self, release):
+        """Return the ParameterStore of the parameters of a release."""
+        vector_ids = self.vector_ids[self.index_by_release[release]]
+        columns = np.flatnonzero(vector_ids >= 0)
+        vector_ids = vector_ids[columns]
+        starts = self.offsets[vector_ids]
+        lengths = self.offsets[vector_ids + 1] - starts
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        positions = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - starts, lengths)
+        return parameter_store.ParameterStore(
+            [self.names[column] for column in columns],
+            offsets,
+            self.dates[positions],
+            self.values[positions],
+            self.abolished[positions],
+            units = [self.units[vector_id] for vector_id in vector_ids],
+            )
+
+    @classmethod
+    def load(cls, dir, mmap_mode = 'r'):
+        with io.open(os.path.join(dir, u'metadata.json'), encoding = 'utf-8') as metadata_file:
+            metadata = json.load(metadata_file)
+        arrays = dict(
+            (array_name, np.load(os.path.join(dir, u'{}.npy'.format(array_name)), mmap_mode = mmap_mode))
+            for array_name in ('abolished', 'dates', 'offsets', 'values', 'vector_ids')
+            )
+        # vector_ids is saved flat, to be read without numpy too.
+        arrays['vector_ids'] = arrays['vector_ids'].reshape(len(metadata['releases']), len(metadata['names']))
+        return cls(metadata['releases'], metadata['names'], units = metadata['units'], **arrays)
+
+    def save(self, dir):
+        if not os.path.isdir(dir):
+            os.makedirs(dir)
+        for array_name in ('abolished', 'dates', 'offsets', 'values'):
+            np.save(os.path.join(dir, u'{}.npy'.format(array_name)), getattr(self, array_name))
+        np.save(os.path.join(dir, u'vector_ids.npy'), self.vector_ids.ravel())
+        with io.open(os.path.join(dir, u'metadata.json'), 'w', encoding = 'utf-8') as metadata_file:
+            metadata_file.write(unicode(json.dumps(
+                dict(names = self.names, releases = self.releases, units = self.units),
+                ensure_ascii = False,
+                indent = 2,
+                )))
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+
+
+"""Streaming reader of XLSX workbooks, giving the same raw cells as xlrd does for XLS workbooks.
+
+The XML of a sheet is never loaded as a whole: it is read with iterparse, twice (a first pass to get the dimensions
+and merged cells, which are stored after the cell data, then a pass yielding rows one at a time). Only the shared
+strings table, the styles and the merged anchor cells are kept in memory.
+
+Cells are (type, value, xf_index) triples, with xlrd type codes (EMPTY 0, TEXT 1, NUMBER 2, DATE 3, BOOLEAN 4,
+ERROR 5, BLANK 6 for a cell that has a style but no value), so that they can be decoded like XLS cells.
+"""
+
+
+import posixpath
+import re
+import zipfile
+from xml.etree import cElementTree as etree
+
+from merged_cells import MergedCellsIndex
+
+
+# Number formats that are not stored in the workbook, by number format id
+builtin_format_str_by_id = {
+    0: u'General',
+    1: u'0',
+    2: u'0.00',
+    3: u'#,##0',
+    4: u'#,##0.00',
+    9: u'0%',
+    10: u'0.00%',
+    11: u'0.00E+00',
+    12: u'# ?/?',
+    13: u'# ??/??',
+    14: u'mm-dd-yy',
+    15: u'd-mmm-yy',
+    16: u'd-mmm',
+    17: u'mmm-yy',
+    18: u'h:mm AM/PM',
+    19: u'h:mm:ss AM/PM',
+    20: u'h:mm',
+    21: u'h:mm:ss',
+    22: u'm/d/yy h:mm',
+    37: u'#,##0 ;(#,##0)',
+    38: u'#,##0 ;[Red](#,##0)',
+    39: u'#,##0.00;(#,##0.00)',
+    40: u'#,##0.00;[Red](#,##0.00)',
+    45: u'mm:ss',
+    46: u'[h]:mm:ss',
+    47: u'mmss.0',
+    48: u'##0.0E+0',
+    49: u'@',
+    }
+cell_reference_re = re.compile(r'(?P<column>[A-Z]+)(?P<row>\d+)$')
+# Parts of a number format that can't denote a date: literal strings, escaped characters, colors & conditions,
+# paddings and repetitions.
+format_literal_re = re.compile(ur'"[^"]*"|\\.|\[[^\]]*\]|_.|\*.')
+error_code_by_text = {
+    u'#NULL!': 0x00,
+    u'#DIV/0!': 0x07,
+    u'#VALUE!': 0x0F,
+    u'#REF!': 0x17,
+    u'#NAME?': 0x1D,
+    u'#NUM!': 0x24,
+    u'#N/A': 0x2A,
+    }
+main_namespace = u'{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+package_relationships_namespace = u'{http://schemas.openxmlformats.org/package/2006/relationships}'
+relationships_namespace = u'{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+
+class XlsxWorkbook(object):
+    datemode = 0
+    format_str_by_xf_index = None
+    is_date_by_xf_index = None
+
+    def __init__(self, path):
+        self.path = path
+        self.zip_file = zipfile.ZipFile(path)
+        self.merged_cells_by_sheet_name = {}
+        self.part_path_by_sheet_name = {}
+        self._sheet_names = []
+        self._shared_strings = None
+
+        target_by_relationship_id = {}
+        with self.zip_file.open('xl/_rels/workbook.xml.rels') as rels_file:
+            for relationship in etree.parse(rels_file).getroot().iter(package_relationships_namespace + 'Relationship'):
+                target_by_relationship_id[relationship.get('Id')] = relationship.get('Target')
+        with self.zip_file.open('xl/workbook.xml') as workbook_file:
+            workbook = etree.parse(workbook_file).getroot()
+        workbook_properties = workbook.find(main_namespace + 'workbookPr')
+        if workbook_properties is not None and workbook_properties.get('date1904') in ('1', 'true'):
+            self.datemode = 1
+        for sheet in workbook.iter(main_namespace + 'sheet'):
+            target = target_by_relationship_id[sheet.get(relationships_namespace + 'id')]
+            if target.startswith('/'):
+                part_path = target[1:]
+            else:
+                part_path = posixpath.normpath(posixpath.join('xl', target))
+            sheet_name = unicode(sheet.get('name'))
+            self._sheet_names.append(sheet_name)
+            self.part_path_by_sheet_name[sheet_name] = part_path
+        self.read_styles()
+
+    def close(self):
+        self.zip_file.close()
+
+    def get_sheet_fingerprint(self, sheet_name):
+        """Return a cheap fingerprint of the content of a sheet, from the CRC of the parts it depends on."""
+        fingerprint = []
+        for part_path in (self.part_path_by_sheet_name[sheet_name], 'xl/sharedStrings.xml', 'xl/styles.xml'):
+            try:
+                info = self.zip_file.getinfo(part_path)
+            except KeyError:
+                fingerprint.append(None)
+            else:
+                fingerprint.append((info.CRC, info.file_size))
+        return tuple(fingerprint)
+
+    def iter_sheet_rows(self, sheet_name):
+        """Iterate over the rows of a sheet, as lists of (type, value, xf_index) cells.
+
+        Rows are padded with empty cells up to the number of columns of the sheet, like xlrd does, and the cells that
+        only have a style beyond the dimensions of the sheet (see read_sheet_dimensions) are dropped. A merged cell
+        gets the type & value of the top-left cell of its range, but keeps its own xf_index. The merged cells of the
+        sheet are kept in merged_cells_by_sheet_name.
+        """
+        part_path = self.part_path_by_sheet_name[sheet_name]
+        nrows, ncols, merged_cells = self.read_sheet_dimensions(part_path)
+        self.merged_cells_by_sheet_name[sheet_name] = merged_cells
+        merged_cells_index = MergedCellsIndex(merged_cells)
+        raw_cell_by_anchor = dict(
+            ((row_low, column_low), (0, u''))
+            for row_low, row_high, column_low, column_high in merged_cells
+            )
+
+        empty_cell = (0, u'', 0)
+        next_row_index = 0
+        with self.zip_file.open(part_path) as sheet_file:
+            for event, element in etree.iterparse(sheet_file):
+                if element.tag != main_namespace + 'row':
+                    continue
+                row_reference = element.get('r')
+                row_index = int(row_reference) - 1 if row_reference is not None else next_row_index
+                if row_index >= nrows:
+                    element.clear()
+                    continue
+                while next_row_index < row_index:
+                    yield [empty_cell] * ncols
+                    next_row_index += 1
+                row = [empty_cell] * ncols
+                next_column_index = 0
+                for cell_element in element.iter(main_namespace + 'c'):
+                    cell_reference = cell_element.get('r')
+                    if cell_reference is None:
+                        column_index = next_column_index
+                    else:
+                        column_index = column_index_from_letters(
+                            cell_reference_re.match(cell_reference).group('column'))
+                    next_column_index = column_index + 1
+                    if column_index >= ncols:
+                        continue
+                    xf_index = int(cell_element.get('s', 0))
+                    anchor = merged_cells_index.get_anchor(row_index, column_index)
+                    if anchor is None or anchor == (row_index, column_index):
+                        type, value = self.read_cell(cell_element, xf_index)
+                        if (row_index, column_index) in raw_cell_by_anchor:
+                            raw_cell_by_anchor[(row_index, column_index)] = (type, value)
+                    else:
+                        type, value = raw_cell_by_anchor[anchor]
+                    row[column_index] = (type, value, xf_index)
+                # Cells of merged ranges that are not written in the XML still get the value of their anchor.
+                for column_low, column_high, anchor_row_index in merged_cells_index.get_row_intervals(row_index):
+                    anchor = (anchor_row_index, column_low)
+                    for column_index in range(column_low, min(column_high, ncols)):
+                        if row[column_index] is empty_cell and (row_index, column_index) != anchor:
+                            row[column_index] = raw_cell_by_anchor[anchor] + (0,)
+                element.clear()
+                yield row
+                next_row_index = row_index + 1
+        while next_row_index < nrows:
+            yield [empty_cell] * ncols
+            next_row_index += 1
+
+    def read_cell(self, cell_element, xf_index):
+        cell_type = cell_element.get('t', 'n')
+        if cell_type == 'inlineStr':
+            return 1, read_text(cell_element.find(main_namespace + 'is'))
+        value_element = cell_element.find(main_namespace + 'v')
+        if value_element is None or value_element.text is None:
+            return 6, u''
+        text = value_element.text
+        if cell_type == 'n':
+            return 3 if self.is_date_by_xf_index[xf_index] else 2, float(text)
+        if cell_type == 's':
+            return 1, self.shared_strings[int(text)]
+        if cell_type == 'str':
+            return 1, unicode(text)
+        if cell_type == 'b':
+            return 4, int(text)
+        if cell_type == 'e':
+            return 5, error_code_by_text.get(text, 0x2A)
+        raise ValueError(u'Unexpected type "{}" of cell {} in {}'.format(cell_type, cell_element.get('r'),
+            self.path).encode('utf-8'))
+
+    def read_sheet_dimensions(self, part_path):
+        """First pass over a sheet, returning its number of rows & columns and its merged cells, as xlrd ranges.
+
+        Like xlrd, only the cells that have a value and the merged cells are counted: the cells that only have a style
+        (e.g. <c r="XAA9" s="176"/>, which would pad every row to 16384 cells) are not.
+        """
+        merged_cells = []
+        ncols = 0
+        nrows = 0
+        next_row_index = 0
+        with self.zip_file.open(part_path) as sheet_file:
+            for event, element in etree.iterparse(sheet_file):
+                tag = element.tag
+                if tag == main_namespace + 'row':
+                    row_reference = element.get('r')
+                    row_index = int(row_reference) - 1 if row_reference is not None else next_row_index
+                    column_index = -1
+                    for cell_element in element.iter(main_namespace + 'c'):
+                        cell_reference = cell_element.get('r')
+                        if cell_reference is None:
+                            column_index += 1
+                        else:
+                            column_index = column_index_from_letters(
+                                cell_reference_re.match(cell_reference).group('column'))
+                        if has_value(cell_element):
+                            ncols = max(ncols, column_index + 1)
+                            nrows = max(nrows, row_index + 1)
+                    next_row_index = row_index + 1
+                    element.clear()
+                elif tag == main_namespace + 'mergeCell':
+                    first, last = element.get('ref').split(':')
+                    first_match = cell_reference_re.match(first)
+                    last_match = cell_reference_re.match(last)
+                    merged_cells.append((
+                        int(first_match.group('row')) - 1,
+                        int(last_match.group('row')),
+                        column_index_from_letters(first_match.group('column')),
+                        column_index_from_letters(last_match.group('column')) + 1,
+                        ))
+        for row_low, row_high, column_low, column_high in merged_cells:
+            nrows = max(nrows, row_high)
+            ncols = max(ncols, column_high)
+        return nrows, ncols, merged_cells
+
+    def read_styles(self):
+        format_str_by_id = builtin_format_str_by_id.copy()
+        self.format_str_by_xf_index = []
+        self.is_date_by_xf_index = []
+        try:
+            styles_file = self.zip_file.open('xl/styles.xml')
+        except KeyError:
+            styles = None
+        else:
+            with styles_file:
+                styles = etree.parse(styles_file).getroot()
+        if styles is not None:
+            for number_format in styles.iter(main_namespace + 'numFmt'):
+                format_str_by_id[int(number_format.get('numFmtId'))] = unicode(number_format.get('formatCode'))
+            cell_xfs = styles.find(main_namespace + 'cellXfs')
+            if cell_xfs is not None:
+                for xf in cell_xfs.iter(main_namespace + 'xf'):
+                    number_format_id = int(xf.get('numFmtId', 0))
+                    format_str = format_str_by_id.get(number_format_id, u'General')
+                    self.format_str_by_xf_index.append(format_str)
+                    self.is_date_by_xf_index.append(
+                        14 <= number_format_id <= 22 or 45 <= number_format_id <= 47
+                        or number_format_id >= 164 and is_date_format_str(format_str))
+        if not self.format_str_by_xf_index:
+            self.format_str_by_xf_index.append(u'General')
+            self.is_date_by_xf_index.append(False)
+
+    def sheet_names(self):
+        return list(self._sheet_names)
+
+    @property
+    def shared_strings(self):
+        if self._shared_strings is None:
+            self._shared_strings = shared_strings = []
+            try:
+                strings_file = self.zip_file.open('xl/sharedStrings.xml')
+            except KeyError:
+                return shared_strings
+            with strings_file:
+                for event, element in etree.iterparse(strings_file):
+                    if element.tag == main_namespace + 'si':
+                        shared_strings.append(read_text(element))
+                        element.clear()
+        return self._shared_strings
+
+
+def column_index_from_letters(letters):
+    column_index = 0
+    for letter in letters:
+        column_index = column_index * 26 + ord(letter) - ord('A') + 1
+    return column_index - 1
+
+
+def has_value(cell_element):
+    """Tell whether a cell has a value, as xlrd does, rather than only a style."""
+    if cell_element.get('t') in ('b', 'e', 'str'):
+        return True
+    if cell_element.get('t') == 'inlineStr' and read_text(cell_element.find(main_namespace + 'is')):
+        return True
+    value_element = cell_element.find(main_namespace + 'v')
+    return value_element is not None and bool(value_element.text)
+
+
+def is_date_format_str(format_str):
+    return any(char in u'dmyhs' for char in format_literal_re.sub(u'', format_str).lower())
+
+
+def read_text(element):
+    """Return the text of a shared or inline string, concatenating its rich text runs but not its phonetic runs."""
+    if element is None:
+        return u''
+    fragments = []
+    for child in element:
+        if child.tag == main_namespace + 't':
+            fragments.append(child.text or u'')
+        elif child.tag == main_namespace + 'r':
+            for run_child in child:
+                if run_child.tag == main_namespace + 't':
+                    fragments.append(run_child.text or u'')
+    return u''.join(fragments)